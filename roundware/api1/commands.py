@@ -13,12 +13,16 @@ try:
 except ImportError:
     pass
 from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ParseError
 from roundware.rw import models
-from roundware.lib import dbus_send
+from roundware.lib import dbus_send, localization, pagination, project_config, speaker_geojson
 from roundware.lib.exception import RoundException
-from roundwared import gpsmixer
 from roundware.lib.api import (get_project_tags_old as get_project_tags, t, log_event, form_to_request,
-                               check_for_single_audiotrack, get_parameter_from_request, play)
+                               check_for_single_audiotrack, get_parameter_from_request, parse_bbox,
+                               play)
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +51,36 @@ def play_asset_in_stream(request):
     return play( request.GET )
 
 
+def server_busy(request):
+    """
+    Whether CPU idle is less than the CPU limit, measured once per request.
+    """
+    if not hasattr(request, 'server_busy'):
+        # Get current available CPU as percentage.
+        cpu_idle = psutil.cpu_times_percent().idle
+        request.server_busy = cpu_idle < float(settings.DEMO_STREAM_CPU_LIMIT)
+    return request.server_busy
+
+
+def config_version(request):
+    """
+    Returns the project whose configuration get_config or get_tags is asked
+    for, and anything else the response depends on, if the request can be
+    answered with 304 Not Modified. Returns None, None if not: get_config
+    makes a session, or a device id, unless new_session is false and a
+    device_id is passed.
+    """
+    form = request.GET
+    operation = form.get('operation', '').lower()
+    if operation == 'get_config' and form.get('new_session') == 'false' and form.get('device_id'):
+        return form.get('project_id'), (server_busy(request), settings.STARTUP_NOTIFICATION_MESSAGE)
+    if operation == 'get_tags':
+        if 'session_id' in form:
+            return project_config.session_project_id(form['session_id']), None
+        return form.get('project_id'), None
+    return None, None
+
+
 # @profile(stats=True)
 def get_config(request):
     form = request.GET
@@ -54,7 +88,12 @@ def get_config(request):
     if 'project_id' not in form:
         raise RoundException("a project_id is required for this operation")
     project = models.Project.objects.get(id=form.get('project_id'))
-    speakers = project.speaker_set.all()
+    # Serialized once after the speakers change, see roundware.lib.speaker_geojson
+    speaker_detail = form.get('speaker_detail', speaker_geojson.DEFAULT_LEVEL)
+    if speaker_detail not in speaker_geojson.LEVELS:
+        raise RoundException("speaker_detail must be one of %s" %
+                             ", ".join(sorted(speaker_geojson.LEVELS)))
+    speakers = speaker_geojson.speakers(project.id, speaker_detail)
     audiotracks = project.audiotrack_set.values()
 
     if 'device_id' not in form or ('device_id' in form and form['device_id'] == ""):
@@ -76,12 +115,9 @@ def get_config(request):
     if 'geo_listen_enabled' in form:
         geo_listen = distutils.util.strtobool(form.get('geo_listen_enabled'))
 
-    # Get current available CPU as percentage.
-    cpu_idle = psutil.cpu_times_percent().idle
     # Demo stream is enabled if enabled project wide or CPU idle is less than
     # CPU limit (default 50%.)
-    demo_stream_enabled = project.demo_stream_enabled or cpu_idle < float(
-        settings.DEMO_STREAM_CPU_LIMIT)
+    demo_stream_enabled = project.demo_stream_enabled or server_busy(request)
 
     # Create a new session if new_session is not equal 'false'
     create_new_session = form.get('new_session') != 'false'
@@ -101,10 +137,11 @@ def get_config(request):
         session_id = s.id
         log_event('start_session', s.id, None)
 
-    sharing_message = t("none set", project.sharing_message_loc, l)
-    out_of_range_message = t("none set", project.out_of_range_message_loc, l)
-    legal_agreement = t("none set", project.legal_agreement_loc, l)
-    demo_stream_message = t("none set", project.demo_stream_message_loc, l)
+    tables = {}
+    sharing_message = t("none set", project, 'sharing_message_loc', l, tables)
+    out_of_range_message = t("none set", project, 'out_of_range_message_loc', l, tables)
+    legal_agreement = t("none set", project, 'legal_agreement_loc', l, tables)
+    demo_stream_message = t("none set", project, 'demo_stream_message_loc', l, tables)
 
     response = [
         {"device": {"device_id": device_id}},
@@ -164,7 +201,7 @@ def get_tags_for_project(request):
 
 
 # get_available_assets
-# args (project_id, [latitude], [longitude], [radius], [tagids,], [tagbool], [language], [asset_id,...], [envelope_id,...], [...])
+# args (project_id, [latitude], [longitude], [radius], [bbox], [tagids,], [tagbool], [language], [asset_id,...], [envelope_id,...], [...])
 # can pass additional parameters matching name of fields on Asset
 # example: http://localhost/roundware/?operation=get_available_assets
 # returns Dictionary
@@ -186,29 +223,24 @@ def get_available_assets(request):
             If that's not available, look for a language field on the model and
             use that.  If that's not available, fall back to English.
         """
-        try:
-            localization = tag.loc_msg.get(language=best_lang_id)
-        except models.LocalizedString.DoesNotExist:
+        table = localization.table(tag.project_id, tables)
+        best_lang_id = best_lang_id.id if best_lang_id else None
+        asset_lang = asset.language_id
+        if asset_lang and best_lang_id != asset_lang:
             # try object's specified language
-            asset_lang = asset.language
-            try:
-                if asset_lang and best_lang_id != asset_lang:
-                    localization = tag.loc_msg.get(language=asset_lang)
-                else:
-                    # fall back to English
-                    english = models.Language.objects.get(language_code='en')
-                    localization = tag.loc_msg.get(language=english)
-            except models.LocalizedString.DoesNotExist:
-                # Worst case return the unlocalized value.
-                # Yes, Tag.loc_msg = Tag.value.
-                return tag.value
-        return localization.localized_string
+            fallback = asset_lang
+        else:
+            # fall back to English
+            fallback = table.languages.get('en')
+        # Worst case return the unlocalized value.
+        # Yes, Tag.loc_msg = Tag.value.
+        return table.get(tag, 'loc_msg', (best_lang_id, fallback), tag.value)
 
     form = request.GET
     kw = {}
 
     known_params = ['project_id', 'latitude', 'longitude',
-                    'tag_ids', 'tagbool', 'radius', 'language', 'asset_id',
+                    'tag_ids', 'tagbool', 'radius', 'bbox', 'language', 'asset_id',
                     'envelope_id']
     project_id = get_parameter_from_request(request, 'project_id')
     asset_id = get_parameter_from_request(request, 'asset_id')
@@ -216,6 +248,7 @@ def get_available_assets(request):
     latitude = get_parameter_from_request(request, 'latitude')
     longitude = get_parameter_from_request(request, 'longitude')
     radius = get_parameter_from_request(request, 'radius')
+    bbox = get_parameter_from_request(request, 'bbox')
     tag_ids = get_parameter_from_request(request, 'tagids')
     tagbool = get_parameter_from_request(request, 'tagbool')
     language = get_parameter_from_request(request, 'language')
@@ -291,12 +324,11 @@ def get_available_assets(request):
                                          "radius and no radius parameter "
                                          "passed to operation.")
             radius = float(radius)
-            for asset in assets:
-                distance = gpsmixer.distance_in_meters(
-                    latitude, longitude,
-                    asset.latitude, asset.longitude)
-                if distance > radius:
-                    assets = assets.exclude(id=asset.id)
+            # ST_DWithin on the indexed location of assets
+            assets = assets.filter(location__dwithin=(
+                Point(longitude, latitude, srid=4326), D(m=radius)))
+        if bbox:
+            assets = assets.filter(location__intersects=parse_bbox(bbox))
     else:
         raise RoundException("This operation requires that you pass a "
                              "project_id, asset_id, or envelope_id")
@@ -306,9 +338,14 @@ def get_available_assets(request):
     for mtype in asset_media_types:
         assets_info['number_of_assets'][mtype] = 0
     assets_list = []
+    tables = {}
+    assets = list(assets)
+    descriptions = localization.strings(models.Asset, 'loc_description',
+                                        [asset.id for asset in assets])
+    lng_id = getattr(lng_id, 'id', lng_id)
 
     for asset in assets:
-        loc_desc = t("", asset.loc_description, lng_id)
+        loc_desc = descriptions.get(asset.id, {}).get(lng_id, "")
 
         if asset.mediatype in asset_media_types:
             assets_info['number_of_assets'][asset.mediatype] += 1
@@ -360,32 +397,51 @@ def current_version(request):
 
 def get_events(request):
     """
-    Return all events for the specified session_id
+    Return all events for the specified session_id. With page_size or
+    cursor, returns a page of them ordered by server_time, with the
+    next_cursor of the following page or None; with stream=true, streams
+    all of them.
     """
     form = request.GET
     if 'session_id' in form:
         session = models.Session.objects.get(id=form['session_id'])
         events = models.Event.objects.filter(session=form['session_id'])
-        events_info = {}
-        events_info['number_of_events'] = 0
-        events_list = []
-
-        for e in events:
-            events_list.append(
-                dict(event_id=e.id,
-                     session_id=e.session_id,
-                     event_type=e.event_type,
-                     latitude=e.latitude,
-                     longitude=e.longitude,
-                     data=e.data,
-                     tags=e.tags,
-                     server_time=str(e.server_time),
-                     )
-            )
-            events_info['number_of_events'] += 1
-
-        events_info['events'] = events_list
+        try:
+            if pagination.wants_stream(form):
+                return StreamingHttpResponse(pagination.stream_json(
+                    events, EVENT_KEYS, _event_dicts,
+                    render=lambda event: json.dumps(event, sort_keys=True).encode('utf-8'),
+                    head=b'{"events": [',
+                    tail=lambda count: ('], "number_of_events": %d, "project_id": %d}'
+                                        % (count, session.project_id)).encode('utf-8')),
+                    content_type='application/json')
+            events_info = {}
+            size = pagination.page_size(form)
+            if size is not None:
+                events, events_info['next_cursor'] = pagination.page(
+                    events, EVENT_KEYS, size, form.get('cursor'))
+        except ParseError as e:
+            raise RoundException(e.detail)
+        events_info['events'] = _event_dicts(events)
+        events_info['number_of_events'] = len(events_info['events'])
         events_info['project_id'] = session.project.id
         return events_info
     else:
         return {"error": "no session_id"}
+
+
+EVENT_KEYS = ('server_time', 'id')
+
+
+def _event_dicts(events):
+    return [dict(event_id=e['id'],
+                 session_id=e['session_id'],
+                 event_type=e['event_type'],
+                 latitude=e['latitude'],
+                 longitude=e['longitude'],
+                 data=e['data'],
+                 tags=e['tags'],
+                 server_time=str(e['server_time']),
+                 )
+            for e in events.values('id', 'session_id', 'event_type', 'latitude', 'longitude',
+                                   'data', 'tags', 'server_time')]
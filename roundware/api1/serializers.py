@@ -10,6 +10,7 @@ class AssetSerializer(serializers.ModelSerializer):
     audiolength_in_seconds = serializers.FloatField()
     class Meta:
         model = Asset
+        exclude = ('location',)
 
 
 class AssetLocationSerializer(serializers.ModelSerializer):
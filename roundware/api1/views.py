@@ -8,10 +8,9 @@ import json
 import traceback
 
 import django_filters
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 from distutils.util import strtobool
 from rest_framework import generics
-from rest_framework.renderers import JSONRenderer
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
@@ -22,9 +21,9 @@ from roundware.api1.serializers import (AssetSerializer,
                                         ProjectSerializer,
                                         EventSerializer,
                                         SessionSerializer,
-                                        ListeningHistoryItemAssetSerializer, SpeakerSerializer)
+                                        ListeningHistoryItemAssetSerializer)
 from roundware.api1 import commands
-from roundware.lib import api
+from roundware.lib import api, project_config
 from roundware.lib.exception import RoundException
 import logging
 logger = logging.getLogger(__name__)
@@ -33,10 +32,21 @@ BOOLEAN_CHOICES = (('false', False), ('true', True),
                    (0, False), (1, True),)
 
 def operations(request):
+    # Configuration operations are versioned for conditional GETs
+    project_id = None
+    if request.method == 'GET':
+        project_id, extra = commands.config_version(request)
+    if project_id is not None:
+        etag, last_modified = project_config.validators(project_id, request, extra)
+        if project_config.not_modified(request, etag, last_modified):
+            return project_config.set_validators(HttpResponseNotModified(), etag, last_modified)
+
     returned_data = catch_errors(request)
+    if isinstance(returned_data, StreamingHttpResponse):
+        return returned_data
 
     speakers = None
-    # serialize the geometry within the speaker
+    # the geometry within the speakers is serialized already
     for i, d in enumerate(returned_data):
         if 'speakers' in d:
             speakers = d.pop('speakers')
@@ -45,11 +55,15 @@ def operations(request):
     data = json.dumps(returned_data, sort_keys=True, ensure_ascii=False)
 
     if speakers:
-        speaker_json = "{\"speakers\":[" + ", ".join(
-                [JSONRenderer().render(SpeakerSerializer(s).data) for s in speakers]) + "]}"
+        speaker_json = "{\"speakers\":[" + ", ".join(speakers) + "]}"
         data = data[:-1] + ", " + speaker_json + data[-1:]
 
-    return HttpResponse(data, content_type='application/json')
+    response = HttpResponse(data, content_type='application/json')
+    if project_id is not None and not (isinstance(returned_data, dict) and
+                                       ('error_message' in returned_data or
+                                        'error' in returned_data)):
+        project_config.set_validators(response, etag, last_modified)
+    return response
 
 
 def catch_errors(request):
@@ -72,31 +86,33 @@ def catch_errors(request):
         }
 
 
+OPERATIONS = {
+    "request_stream": api.request_stream,
+    "heartbeat": api.heartbeat,
+    "current_version": commands.current_version,
+    "log_event": commands.op_log_event,
+    "create_envelope": api.create_envelope,
+    "add_asset_to_envelope": api.add_asset_to_envelope,
+    "get_config": commands.get_config,
+    "get_tags": commands.get_tags_for_project,
+    "modify_stream": api.modify_stream,
+    "move_listener": api.move_listener,
+    "get_current_streaming_asset": api.get_currently_streaming_asset,
+    "get_asset_info": commands.get_asset_info,
+    "get_available_assets": commands.get_available_assets,
+    "play_asset_in_stream": commands.play_asset_in_stream,
+    "vote_asset": api.vote_asset,
+    "skip_ahead": api.skip_ahead,
+    "get_events": commands.get_events,
+}
+
+
 def operation_to_function(operation):
     if not operation:
         raise RoundException("Operation is required")
-    operations = {
-        "request_stream": api.request_stream,
-        "heartbeat": api.heartbeat,
-        "current_version": commands.current_version,
-        "log_event": commands.op_log_event,
-        "create_envelope": api.create_envelope,
-        "add_asset_to_envelope": api.add_asset_to_envelope,
-        "get_config": commands.get_config,
-        "get_tags": commands.get_tags_for_project,
-        "modify_stream": api.modify_stream,
-        "move_listener": api.move_listener,
-        "get_current_streaming_asset": api.get_currently_streaming_asset,
-        "get_asset_info": commands.get_asset_info,
-        "get_available_assets": commands.get_available_assets,
-        "play_asset_in_stream": commands.play_asset_in_stream,
-        "vote_asset": api.vote_asset,
-        "skip_ahead": api.skip_ahead,
-        "get_events": commands.get_events,
-    }
     key = string.lower(operation)
-    if key in operations:
-        return operations[key]
+    if key in OPERATIONS:
+        return OPERATIONS[key]
     else:
         raise RoundException("Invalid operation, " + operation)
 
@@ -1,6 +1,11 @@
 from roundware.rw.models import (Event, Asset, ListeningHistoryItem, Tag, TagRelationship,
                                 TagCategory, UIItem, UIGroup)
+from roundware.lib.api import parse_bbox
+from roundware.lib.exception import RoundException
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
 from distutils.util import strtobool
+from rest_framework.exceptions import ParseError
 import django_filters
 
 BOOLEAN_CHOICES = (('false', False), ('true', True),
@@ -31,6 +36,36 @@ class NanoNumberFilter(django_filters.NumberFilter):
         return super(NanoNumberFilter, self).filter(qs, value)
 
 
+class NearFilter(django_filters.Filter):
+    """
+    Filters by "latitude,longitude,radius", radius in meters, with
+    ST_DWithin on the indexed location.
+    """
+    def filter(self, qs, value):
+        if value in (None, ''):
+            return qs
+        try:
+            latitude, longitude, radius = [float(v) for v in value.split(',')]
+        except ValueError:
+            raise ParseError("%s must be latitude,longitude,radius" % self.name)
+        return qs.filter(**{'%s__dwithin' % self.name: (Point(longitude, latitude, srid=4326),
+                                                        D(m=radius))})
+
+
+class BBoxFilter(django_filters.Filter):
+    """
+    Filters by "min_longitude,min_latitude,max_longitude,max_latitude".
+    """
+    def filter(self, qs, value):
+        if value in (None, ''):
+            return qs
+        try:
+            bbox = parse_bbox(value)
+        except RoundException as e:
+            raise ParseError(str(e))
+        return qs.filter(**{'%s__intersects' % self.name: bbox})
+
+
 class EventFilterSet(django_filters.FilterSet):
     event_type = django_filters.CharFilter(lookup_type='icontains')
     server_time = django_filters.DateTimeFilter(lookup_type='startswith')
@@ -60,6 +95,8 @@ class AssetFilterSet(django_filters.FilterSet):
     envelope_id = django_filters.NumberFilter()
     longitude = django_filters.NumberFilter(lookup_type='startswith')
     latitude = django_filters.NumberFilter(lookup_type='startswith')
+    near = NearFilter(name='location')
+    bbox = BBoxFilter(name='location')
     submitted = django_filters.TypedChoiceFilter(choices=BOOLEAN_CHOICES, coerce=strtobool)
     audiolength__lte = NanoNumberFilter(name='audiolength', lookup_type='lte')
     audiolength__gte = NanoNumberFilter(name='audiolength', lookup_type='gte')
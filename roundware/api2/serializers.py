@@ -8,9 +8,12 @@ from roundware.rw.models import (Asset, Event, Envelope, Language, ListeningHist
                                  LocalizedString, Project, Tag, TagRelationship, TagCategory,
                                  UIGroup, UIItem, Session, Vote)
 from roundware.lib.api import request_stream, vote_count_by_asset
+from roundware.lib import localization
 from rest_framework import serializers
 from rest_framework.serializers import ValidationError
 from django.contrib.auth.models import User
+from django.db.models.query import QuerySet
+from collections import defaultdict, OrderedDict
 from datetime import datetime
 import time
 import re
@@ -31,13 +34,144 @@ class AdminLocaleStringSerializerMixin(serializers.Serializer):
     def get_fields(self):
         fields = super(AdminLocaleStringSerializerMixin, self).get_fields()
 
-        if 'admin' in self.context and self.context['admin']:
-            for localized_field in self.Meta.localized_fields:
+        for localized_field in self.Meta.localized_fields:
+            if getattr(self.Meta, "localize", False):
+                # Output by localize() from the compiled localization table
+                del fields[localized_field]
+            if 'admin' in self.context and self.context['admin']:
                 fields["%s%s" % (localized_field, "_admin")] \
                     = LocalizedStringSerializer(source=localized_field, many=True)
 
         return fields
 
+    def localize(self, obj, project_id):
+        """
+        Returns the localized fields of obj in the language of the session in
+        the context, falling back to English, by field.
+        """
+        table = localization.table(project_id, self.context.setdefault("localization_tables", {}))
+        session = self.context.get("session")
+        languages = table.chain(session.language_id if session is not None else None)
+        return OrderedDict((field, table.get(obj, field, languages))
+                           for field in self.Meta.localized_fields)
+
+
+# Asset fields output under another name, appended in this order, and
+# fields left out of the output.
+ASSET_RENAMED_FIELDS = [("id", "asset_id"),
+                        ("mediatype", "media_type"),
+                        ("audiolength_in_seconds", "audio_length_in_seconds"),
+                        ("tags", "tag_ids"),
+                        ("session", "session_id")]
+ASSET_REMOVED_FIELDS = ["audiolength", "initialenvelope"]
+
+
+def rename_asset_fields(result):
+    # consistent naming for output
+    for field, name in ASSET_RENAMED_FIELDS:
+        result[name] = result.pop(field)
+    for field in ASSET_REMOVED_FIELDS:
+        del result[field]
+    return result
+
+
+def audiolength_in_seconds(audiolength):
+    # As Asset.audiolength_in_seconds(), which AssetSerializer outputs as a float.
+    if audiolength:
+        return float('%.2f' % round(audiolength / 1000000000.0, 2))
+
+
+class AssetListSerializer(serializers.ListSerializer):
+    """
+    Serializes querysets of assets, or filter sets of them, from plain rows
+    in a constant number of queries however many assets there are. The
+    output is the same as AssetSerializer's for each asset.
+    """
+
+    def to_representation(self, data):
+        queryset = getattr(data, "qs", data)
+        if not isinstance(queryset, QuerySet):
+            return super(AssetListSerializer, self).to_representation(data)
+        return [rename_asset_fields(result) for result in self.serialize_rows(queryset)]
+
+    def compile_fields(self):
+        """
+        Returns (name, source, kind, convert) for each field of the child
+        serializer, in order. kind is "column" for fields read from the asset
+        rows and converted by convert, "ids" for many to many fields and
+        "localized_strings" for the admin's localized strings.
+        """
+        fields = []
+        request = self.child.context.get("request")
+        for name, field in self.child.fields.items():
+            if name == "audiolength_in_seconds":
+                fields.append((name, "audiolength", "column", audiolength_in_seconds))
+            elif isinstance(field, serializers.ManyRelatedField):
+                fields.append((name, field.source, "ids", None))
+            elif isinstance(field, serializers.ListSerializer):
+                fields.append((name, field.source, "localized_strings", None))
+            elif isinstance(field, serializers.RelatedField):
+                fields.append((name, field.source, "column", None))
+            elif isinstance(field, serializers.FileField):
+                def convert(path, storage=Asset._meta.get_field(field.source).storage):
+                    if not path:
+                        return None
+                    url = storage.url(path)
+                    return request.build_absolute_uri(url) if request is not None else url
+                fields.append((name, field.source, "column", convert))
+            else:
+                fields.append((name, field.source, "column", field.to_representation))
+        return fields
+
+    def get_related(self, assets, source, kind):
+        """
+        Returns the ids, or the localized strings, of the source many to many
+        field of assets by asset id.
+        """
+        field = Asset._meta.get_field(source)
+        from_field = field.m2m_field_name()
+        to_field = field.m2m_reverse_field_name()
+        pairs = field.remote_field.through.objects.filter(**{"%s__in" % from_field: assets}) \
+            .order_by("id").values_list(from_field, to_field)
+        related = defaultdict(list)
+        if kind == "ids":
+            for asset_id, related_id in pairs:
+                related[asset_id].append(related_id)
+            return related
+        strings = LocalizedString.objects.filter(id__in=pairs.values(to_field)) \
+            .values_list("id", "language__language_code", "localized_string")
+        strings = dict((string[0], string) for string in strings)
+        for asset_id, string_id in pairs:
+            string_id, language, localized_string = strings[string_id]
+            related[asset_id].append(OrderedDict([("id", string_id),
+                                                  ("language", language),
+                                                  ("localized_string", localized_string)]))
+        return related
+
+    def serialize_rows(self, queryset):
+        fields = self.compile_fields()
+        rows = list(queryset.values(*set(source for name, source, kind, convert in fields
+                                         if kind == "column")))
+        assets = queryset.order_by().values("id")
+        related = dict((name, self.get_related(assets, source, kind))
+                       for name, source, kind, convert in fields if kind != "column")
+        language_codes = dict(Language.objects.values_list("id", "language_code"))
+
+        results = []
+        for row in rows:
+            result = OrderedDict()
+            for name, source, kind, convert in fields:
+                if kind != "column":
+                    result[name] = related[name][row["id"]]
+                    continue
+                value = row[source]
+                result[name] = value if value is None or convert is None else convert(value)
+            # load string version of language
+            if result.get("language") is not None:
+                result["language"] = language_codes[result["language"]]
+            results.append(result)
+        return results
+
 
 class AssetSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSerializer):
     audiolength_in_seconds = serializers.FloatField(required=False)
@@ -45,32 +179,16 @@ class AssetSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSeriali
 
     class Meta:
         model = Asset
+        # the same as latitude and longitude, which are output
+        exclude = ['location']
         localized_fields = ['loc_description', 'loc_alt_text']
+        list_serializer_class = AssetListSerializer
 
     def to_representation(self, obj):
-        result = super(AssetSerializer, self).to_representation(obj)
-        # consistent naming for output
-        result["asset_id"] = result["id"]
-        del result["id"]
-
-        result["media_type"] = result["mediatype"]
-        del result["mediatype"]
-
-        result["audio_length_in_seconds"] = result["audiolength_in_seconds"]
-        del result["audiolength_in_seconds"]
-        del result["audiolength"]
-
-        result["tag_ids"] = result["tags"]
-        del result["tags"]
-
-        result["session_id"] = result["session"]
-        del result["session"]
-
-        del result["initialenvelope"]
+        result = rename_asset_fields(super(AssetSerializer, self).to_representation(obj))
         # load string version of language
         if "language" in result and result["language"] is not None:
-            lang = Language.objects.get(pk=result["language"])
-            result["language"] = lang.language_code
+            result["language"] = obj.language.language_code
 
         return result
 
@@ -122,19 +240,15 @@ class ProjectSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSeria
         model = Project
         localized_fields = ['demo_stream_message_loc', 'legal_agreement_loc',
                             'sharing_message_loc', 'out_of_range_message_loc']
+        # output by localize(), in the session's language
+        localize = True
 
     def to_representation(self, obj):
         # must include only the related localizationStrings that match out session language
         result = super(ProjectSerializer, self).to_representation(obj)
-        # session should be passed in as context
-        session = None
-        if 'session' in self.context:
-            session = self.context["session"]
-        # find the localizedString relation fields
-        for key in result.keys():
-            if key[-4:] == "_loc" and type(result[key]) is list:
-                result[key[:-4]] = _select_localized_string(result[key], session)
-                del result[key]
+        # the localized strings in the language of the session passed in the context
+        for field, value in self.localize(obj, obj.pk).items():
+            result[field[:-4]] = value
         result["project_id"] = result["id"]
         del result["id"]
         return result
@@ -264,18 +378,15 @@ class TagSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSerialize
     class Meta:
         model = Tag
         localized_fields = ['loc_msg', 'loc_description']
+        # output by localize(), in the session's language
+        localize = True
 
     def to_representation(self, obj):
         result = super(TagSerializer, self).to_representation(obj)
         # find correct localized strings
-        session = None
-        if "session" in self.context:
-            session = self.context["session"]
-
         # TODO: determine who is using these loc_* fields - not in spec doc!
         # TODO: `filter` field is also not in spec doc
-        for field in ["loc_msg", "loc_description"]:
-            result[field] = _select_localized_string(result[field], session=session)
+        result.update(self.localize(obj, obj.project_id))
 
         # field renaming - spec doc asks for `id`
         # however, all other responses return *_id format
@@ -326,16 +437,13 @@ class UIGroupSerializer(AdminLocaleStringSerializerMixin, serializers.ModelSeria
     class Meta:
         model = UIGroup
         localized_fields = ['header_text_loc']
+        # output by localize(), in the session's language
+        localize = True
 
     def to_representation(self, obj):
         result = super(UIGroupSerializer, self).to_representation(obj)
         # find correct localized strings
-        session = None
-        if "session" in self.context:
-            session = self.context["session"]
-
-        for field in ["header_text_loc"]:
-            result[field] = _select_localized_string(result[field], session=session)
+        result.update(self.localize(obj, obj.project_id))
 
         uiitems = UIItem.objects.filter(ui_group=result["id"])
         serializer = UIItemSerializer(uiitems, many=True)
@@ -385,20 +493,3 @@ class VoteSerializer(serializers.ModelSerializer):
         del result["session"]
         result["asset_votes"] = vote_count_by_asset(result["asset_id"])
         return result
-
-
-def _select_localized_string(loc_str_ids, session=None):
-    if session is not None:
-        # find matching language
-        try:
-            lang = Language.objects.get(language_code=session.language)
-        except Language.DoesNotExist:
-            lang = Language.objects.get(language_code="en")
-    else:
-        lang = Language.objects.get(language_code="en")
-    for loc_str_id in loc_str_ids:
-        loc_str = LocalizedString.objects.get(pk=loc_str_id)
-        if loc_str.language == lang:
-            return loc_str.localized_string
-    return None
-
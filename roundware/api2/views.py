@@ -15,8 +15,9 @@ from roundware.api2.filters import (EventFilterSet, AssetFilterSet, ListeningHis
                                     UIGroupFilterSet, UIItemFilterSet)
 from roundware.lib.api import (get_project_tags_new as get_project_tags, modify_stream, move_listener, heartbeat,
                                skip_ahead, pause, resume, add_asset_to_envelope, get_currently_streaming_asset,
-                               save_asset_from_request, vote_asset, check_is_active,
+                               save_asset_from_request, vote_asset, check_stream_status,
                                vote_count_by_asset, log_event, play)
+from roundware.lib import pagination, project_config, sampling
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated, DjangoObjectPermissions
 from rest_framework.response import Response
@@ -24,7 +25,6 @@ from rest_framework.exceptions import ParseError
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import detail_route, list_route
 import logging
-from random import sample
 
 logger = logging.getLogger(__name__)
 
@@ -82,11 +82,13 @@ class AssetViewSet(viewsets.ViewSet):
 
     def list(self, request):
         """
-        GET api/2/assets/ - retrieve list of assets filtered by parameters
+        GET api/2/assets/ - retrieve list of assets filtered by parameters,
+        paged with page_size and cursor or streamed with stream=true
         """
-        assets = AssetFilterSet(request.query_params)
-        serializer = serializers.AssetSerializer(assets, many=True)
-        return Response(serializer.data)
+        assets = AssetFilterSet(request.query_params).qs
+        return pagination.list_response(
+            request, assets, ("id",),
+            lambda page: serializers.AssetSerializer(page, many=True).data)
 
     @detail_route(methods=['post', 'get'])
     def votes(self, request, pk=None):
@@ -104,15 +106,10 @@ class AssetViewSet(viewsets.ViewSet):
         """
         GET api/2/assets/random/ - retrieve random list of assets filtered by parameters
         """
-        assets = AssetFilterSet(request.query_params).qs.values_list('id', flat=True)
-        asset_count = len(assets)
-        if asset_count is 0:
+        limit = int(request.query_params.get('limit', 1))
+        selected_ids = sampling.sample_ids(AssetFilterSet(request.query_params).qs, limit)
+        if not selected_ids:
             return Response([])
-        # ensure limit isn't greater than asset_count which causes sample to fail
-        limit = min(int(request.query_params.get('limit', 1)), asset_count)
-        # ensure indices returned are unique
-        random_idx = sample(range(asset_count), limit)
-        selected_ids = [assets[x] for x in random_idx]
         results = Asset.objects.filter(id__in=selected_ids)
         serializer = serializers.AssetSerializer(results, many=True)
         return Response(serializer.data)
@@ -164,11 +161,13 @@ class EventViewSet(viewsets.ViewSet):
 
     def list(self, request):
         """
-        GET api/2/events/ - Provides list of events filtered by parameters
+        GET api/2/events/ - Provides list of events filtered by parameters,
+        paged with page_size and cursor or streamed with stream=true
         """
-        events = EventFilterSet(request.query_params)
-        serializer = serializers.EventSerializer(events, many=True)
-        return Response(serializer.data)
+        events = EventFilterSet(request.query_params).qs
+        return pagination.list_response(
+            request, events, ("server_time", "id"),
+            lambda page: serializers.EventSerializer(page, many=True).data)
 
     def retrieve(self, request, pk=None):
         """
@@ -209,11 +208,13 @@ class ListenEventViewSet(viewsets.ViewSet):
 
     def list(self, request):
         """
-        GET api/2/listenevents/ - Get listenevents by filtering parameters
+        GET api/2/listenevents/ - Get listenevents by filtering parameters,
+        paged with page_size and cursor or streamed with stream=true
         """
-        events = ListeningHistoryItemFilterSet(request.query_params)
-        serializer = serializers.ListenEventSerializer(events, many=True)
-        return Response(serializer.data)
+        events = ListeningHistoryItemFilterSet(request.query_params).qs
+        return pagination.list_response(
+            request, events, ("starttime", "id"),
+            lambda page: serializers.ListenEventSerializer(page, many=True).data)
 
     def retrieve(self, request, pk=None):
         """
@@ -235,6 +236,7 @@ class ProjectViewSet(viewsets.ViewSet):
     queryset = Project.objects.all()
     permission_classes = (IsAuthenticated,)
 
+    @project_config.conditional
     def retrieve(self, request, pk=None):
         if "session_id" in request.query_params:
             session = get_object_or_404(Session, pk=request.query_params["session_id"])
@@ -247,34 +249,52 @@ class ProjectViewSet(viewsets.ViewSet):
         return Response(serializer.data)
 
     @detail_route(methods=['get'])
+    @project_config.conditional
     def tags(self, request, pk=None):
         session = None
         if "session_id" in request.query_params:
             session = get_object_or_404(Session, pk=request.query_params["session_id"])
 
-        tags = get_project_tags(p=pk)
-        serializer = serializers.TagSerializer(tags, context={"session": session,
-                                                              "admin": "admin" in request.query_params}, many=True)
-        return Response({"tags": serializer.data})
+        def serialize(admin=False):
+            tags = get_project_tags(p=pk)
+            return list(serializers.TagSerializer(tags, context={"session": session,
+                                                                 "admin": admin}, many=True).data)
+
+        if "admin" in request.query_params:
+            return Response({"tags": serialize(admin=True)})
+        # from the compiled configuration of the project
+        language_id = session.language_id if session is not None else None
+        return Response({"tags": project_config.document(project_config.API2_TAGS, pk,
+                                                         language_id, serialize)})
 
     @detail_route(methods=['get'])
+    @project_config.conditional
     def uigroups(self, request, pk=None):
         params = request.query_params.copy()
         params["project_id"] = pk
-        uigroups = UIGroupFilterSet(params)
-        serializer = serializers.UIGroupSerializer(uigroups,
-                                                   context={"admin": "admin" in request.query_params},
-                                                   many=True)
-        return Response({"ui_groups": serializer.data})
+
+        def serialize():
+            uigroups = UIGroupFilterSet(params)
+            return list(serializers.UIGroupSerializer(uigroups,
+                                                      context={"admin": "admin" in request.query_params},
+                                                      many=True).data)
+
+        if "admin" in params or set(params) & set(UIGroupFilterSet.base_filters) != {"project_id"}:
+            return Response({"ui_groups": serialize()})
+        # all the groups of the project, from its compiled configuration
+        return Response({"ui_groups": project_config.document(project_config.API2_UIGROUPS, pk,
+                                                              None, serialize)})
 
     @detail_route(methods=['get'])
     def assets(self, request, pk=None):
         params = request.query_params.copy()
         params["project_id"] = pk
-        assets = AssetFilterSet(params)
-        # serialize and return
-        serializer = serializers.AssetSerializer(assets, context={"admin": "admin" in request.query_params}, many=True)
-        return Response(serializer.data)
+        assets = AssetFilterSet(params).qs
+        context = {"admin": "admin" in request.query_params}
+        # serialize and return, paged or streamed if asked to
+        return pagination.list_response(
+            request, assets, ("id",),
+            lambda page: serializers.AssetSerializer(page, context=context, many=True).data)
 
 
 class SessionViewSet(viewsets.ViewSet):
@@ -388,11 +408,12 @@ class StreamViewSet(viewsets.ViewSet):
     @detail_route(methods=['get'])
     def isactive(self, request, pk=None):
         try:
-            result = check_is_active(pk)
+            result = check_stream_status(pk)
             stream_id = int(pk)
             return Response({
                 'stream_id': stream_id,
-                'active': result
+                'active': result == 'ready',
+                'status': result
             })
         except Exception as e:
             return Response({"detail": str(e)},
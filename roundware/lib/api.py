@@ -1,10 +1,11 @@
 from __future__ import unicode_literals
-from django.contrib.gis.geos import Point
+from django.contrib.gis.geos import Point, Polygon
 from django.contrib.gis.measure import D
 from django.contrib.auth import get_user_model
 from rest_framework.exceptions import ParseError
 from roundware.rw import models
-from roundware.lib import dbus_send, discover_audiolength, convertaudio
+from roundware.lib import (dbus_send, discover_audiolength, convertaudio, liveness, localization,
+                           project_config, shared_streams)
 from roundware.lib.exception import RoundException
 from roundwared import gpsmixer
 from roundwared import icecast2
@@ -12,6 +13,7 @@ from django.conf import settings
 from django.db.models import Count, Avg
 from django.http import Http404
 import datetime
+import hashlib
 import json
 import os
 import subprocess
@@ -21,18 +23,22 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Bytes read at a time when persisting uploads.
+UPLOAD_CHUNK_SIZE = 64 * 1024
 
-def t(msg, field, language):
+
+
+def t(msg, obj, field, language, tables=None):
     """
-    Locates the translation for the msg in the field object for the provided
-    session language.
+    Locates the translation for the msg in the localized field of obj (a
+    Project, Tag or UIGroup) for the provided session language, in the
+    compiled localization table of its project. tables is the memo of
+    localization.table().
     """
     # TODO: Replace with standard Django internationalization.
-    try:
-        msg = field.filter(language=language)[0].localized_string
-    except:
-        pass
-    return msg
+    table = localization.table(localization.project_of(obj), tables)
+    language_id = language.id if language is not None else None
+    return table.get(obj, field, table.chain(language_id, fallback=None), msg)
 
 # This function only used by API/2 to keep backwards compatability
 def get_project_tags_old(p=None, s=None):
@@ -43,14 +49,21 @@ def get_project_tags_old(p=None, s=None):
         p = s.project
         language = s.language
 
+    return project_config.document(
+        project_config.API1_TAGS, p.id, language.id if language else None,
+        lambda: _compile_project_tags_old(p, language))
+
+
+def _compile_project_tags_old(p, language):
     uigroups = models.UIGroup.objects.filter(project=p)
+    tables = {}
     modes = {}
 
     for uigroup in uigroups:
         if uigroup.active:
             mappings = models.UIItem.objects.filter(
                 ui_group=uigroup, active=True)
-            header = t("", uigroup.header_text_loc, language)
+            header = t("", uigroup, 'header_text_loc', language, tables)
 
             masterD = {'name': uigroup.name,
                        'header_text': header,
@@ -62,7 +75,7 @@ def get_project_tags_old(p=None, s=None):
 
             default = []
             for mapping in mappings:
-                loc_desc = t("", mapping.tag.loc_description, language)
+                loc_desc = t("", mapping.tag, 'loc_description', language, tables)
                 if mapping.default:
                     default.append(mapping.tag.id)
                 # masterOptionsList.append(mapping.toTagDictionary())
@@ -74,7 +87,7 @@ def get_project_tags_old(p=None, s=None):
                                           'relationships': mapping.tag.get_relationships_old(),
                                           'description': mapping.tag.description, 'shortcode': mapping.tag.value,
                                           'loc_description': loc_desc,
-                                          'value': t("", mapping.tag.loc_msg, language)})
+                                          'value': t("", mapping.tag, 'loc_msg', language, tables)})
             masterD["options"] = masterOptionsList
             masterD["defaults"] = default
             if uigroup.ui_mode not in modes:
@@ -125,7 +138,7 @@ def request_stream(request):
     http_host = request.get_host().split(':')[0]
 
     if session.demo_stream_enabled:
-        msg = t("demo_stream_message", project.demo_stream_message_loc,
+        msg = t("demo_stream_message", project, 'demo_stream_message_loc',
                 session.language)
 
         if project.demo_stream_url:
@@ -142,26 +155,67 @@ def request_stream(request):
         # TODO: audio_format.upper() should be handled when the project is saved.
         audio_format = project.audio_format.upper()
 
-        # Make the audio stream if it doesn't exist.
-        if not stream_exists(session.id, audio_format):
+        # Sessions of a shared stream project listen to the stream of the
+        # first session with the same mix.
+        stream_session_id = session.id
+        fingerprint = shared_streams.fingerprint(session, data, audio_format)
+        if fingerprint:
+            stream_session_id = shared_streams.join(
+                fingerprint, session.id,
+                lambda owner_id: shared_stream_running(owner_id, audio_format))
+            logger.debug("Session %s listens to the shared stream of session %s",
+                         session.id, stream_session_id)
+        else:
+            shared_streams.leave([session.id])
+
+        mount = icecast2.mount_point(stream_session_id, audio_format)
+        # Clients that pass wait_for_stream=false get the stream URL right
+        # away and poll the stream status until it is ready.
+        # JSON bodies of api/2 give a bool.
+        wait = str(data.get('wait_for_stream', 'true')).lower() not in ('false', '0')
+
+        # Make the audio stream if it doesn't exist or isn't being started.
+        stream_status = icecast2.get_stream_status(mount)
+        if stream_status != icecast2.STREAM_STARTING and \
+                not stream_exists(stream_session_id, audio_format):
             command = [settings.PROJECT_ROOT + '/roundwared/rwstreamd.py',
-                       '--session_id', str(session.id), '--project_id', str(project.id)]
+                       '--session_id', str(stream_session_id), '--project_id', str(project.id)]
             for p in ['latitude', 'longitude', 'audio_format']:
                 if p in data and data[p]:
                     command.extend(['--' + p, data[p].replace("\t", ",")])
             if 'audio_stream_bitrate' in data:
                 command.extend(
                     ['--audio_stream_bitrate', str(data['audio_stream_bitrate'])])
+            if fingerprint and data.get('tags'):
+                # Sessions of shared streams can't change their tags later.
+                command.extend(['--tags', ','.join(
+                    '%s' % tag for tag in shared_streams.tag_ids(data['tags']))])
+
+            if settings.STREAM_STANDIN:
+                # Announce the stream like RoundStream.ready() would.
+                stream_status = icecast2.STREAM_READY
+                icecast2.set_stream_status(mount, stream_status,
+                                           settings.PING_INTERVAL * 2 // 1000)
+                icecast2.Admin().add_mount(mount)
+            else:
+                # Expires by itself if the stream never comes up.
+                stream_status = icecast2.STREAM_STARTING
+                icecast2.set_stream_status(mount, stream_status,
+                                           settings.STREAM_READY_TIMEOUT)
+                apache_safe_daemon_subprocess(command)
 
-            apache_safe_daemon_subprocess(command)
-            wait_for_stream(session.id, audio_format)
+        if stream_status == icecast2.STREAM_STARTING and wait:
+            wait_for_stream(stream_session_id, audio_format)
+            stream_status = icecast2.STREAM_READY
 
         move_listener(request)
 
-        return {
-            "stream_url": "http://%s:%s%s" % (http_host, settings.ICECAST_PORT,
-                                              icecast2.mount_point(session.id, audio_format))
+        response = {
+            "stream_url": "http://%s:%s%s" % (http_host, settings.ICECAST_PORT, mount)
         }
+        if not wait:
+            response["stream_status"] = stream_status or icecast2.STREAM_READY
+        return response
     else:
         msg = t("This application is designed to be used in specific geographic"
                 " locations. Apparently your phone thinks you are not at one of"
@@ -169,7 +223,7 @@ def request_stream(request):
                 " instead of the real deal. If you think your phone is"
                 " incorrect, please restart Roundware and it will probably work."
                 " Thanks for checking it out!",
-                project.out_of_range_message_loc, session.language)
+                project, 'out_of_range_message_loc', session.language)
 
         return {
             'stream_url': project.out_of_range_url,
@@ -244,6 +298,27 @@ def stream_exists(sessionid, audio_format):
     return admin.stream_exists(icecast2.mount_point(sessionid, audio_format))
 
 
+def shared_stream_running(owner_id, audio_format):
+    return icecast2.get_stream_status(icecast2.mount_point(owner_id, audio_format)) is not None \
+        or stream_exists(owner_id, audio_format)
+
+
+def is_shared_stream(session_id):
+    return shared_streams.owner(session_id) is not None
+
+
+def stream_session_id(session_id):
+    """
+    Returns the id of the session whose stream the session listens to.
+    """
+    return shared_streams.owner(session_id) or int(session_id)
+
+
+def check_not_shared_stream(session_id):
+    if is_shared_stream(session_id):
+        raise RoundException("this operation is not available on a shared stream")
+
+
 def apache_safe_daemon_subprocess(command):
     logger.debug(str(command))
     env = os.environ.copy()
@@ -264,18 +339,27 @@ def apache_safe_daemon_subprocess(command):
 
 def wait_for_stream(sessionid, audio_format):
     """
-    Loops until the give stream is present and ready to be listened to.
+    Waits until rwstreamd reports the given stream is ready to be listened to,
+    which happens once its pipeline is playing and connected to Icecast.
+    Icecast itself is still checked once a second, in case the ready status
+    was not seen.
     """
-    # Number of retries
-    retries_left = 15
-
-    logger.debug("Checking for existence of stream %s%s on %s:%s", sessionid,
-                 audio_format, settings.ICECAST_HOST, settings.ICECAST_PORT)
-    while not stream_exists(sessionid, audio_format):
-        time.sleep(1)
-        retries_left -= 1
-        if retries_left < 0:
+    mount = icecast2.mount_point(sessionid, audio_format)
+    start = time.time()
+    next_check = start + 1
+
+    logger.debug("Waiting for stream %s on %s:%s", mount,
+                 settings.ICECAST_HOST, settings.ICECAST_PORT)
+    while icecast2.get_stream_status(mount) != icecast2.STREAM_READY:
+        now = time.time()
+        if now >= next_check:
+            if stream_exists(sessionid, audio_format):
+                break
+            next_check = now + 1
+        if now - start > settings.STREAM_READY_TIMEOUT:
             raise RoundException("Stream timeout on creation")
+        time.sleep(settings.STREAM_READY_POLL_INTERVAL)
+    logger.debug("Stream %s ready after %.3f seconds", mount, time.time() - start)
 
 
 def modify_stream(request, context=None):
@@ -308,9 +392,15 @@ def modify_stream(request, context=None):
                 raise RoundException("language not supported")
 
         audio_format = project.audio_format.upper()
-        if stream_exists(int(form['session_id']), audio_format):
-            dbus_send.emit_stream_signal(
-                int(form['session_id']), "modify_stream", arg_hack)
+        if request['tags']:
+            check_not_shared_stream(session.id)
+        stream_id = stream_session_id(session.id)
+        if stream_exists(stream_id, audio_format):
+            if stream_id == session.id:
+                dbus_send.emit_stream_signal(stream_id, "modify_stream", arg_hack)
+            else:
+                # The listener location doesn't change a shared stream.
+                liveness.seen(session.id, stream_id)
             success = True
         else:
             msg = "no stream available for session: " + form['session_id']
@@ -359,8 +449,12 @@ def move_listener(request, context=None):
         request = form_to_request(form)
         arg_hack = json.dumps(request)
         log_event("move_listener", int(form['session_id']), form)
-        dbus_send.emit_stream_signal(
-            int(form['session_id']), "move_listener", arg_hack)
+        stream_id = stream_session_id(form['session_id'])
+        if stream_id == int(form['session_id']):
+            dbus_send.emit_stream_signal(stream_id, "move_listener", arg_hack)
+        else:
+            # The listener location doesn't change a shared stream.
+            liveness.seen(int(form['session_id']), stream_id)
         return {"success": True}
     except Exception as e:
         return {"success": False,
@@ -370,8 +464,12 @@ def move_listener(request, context=None):
 def heartbeat(request, session_id=None):
     if session_id is None:
         session_id = request.GET['session_id']
-    dbus_send.emit_stream_signal(int(session_id), "heartbeat", "")
-    log_event("heartbeat", int(session_id), request.GET)
+    session_id = int(session_id)
+    if project_config.session_project_id(session_id) is None:
+        raise RoundException("Failed to access session: %s " % session_id)
+    # Recorded in the cache, not as an Event nor signalled to the stream,
+    # which reads it when it pings.
+    liveness.seen(session_id, stream_session_id(session_id))
     return {"success": True}
 
 
@@ -384,6 +482,7 @@ def skip_ahead(request, session_id=None):
     log_event("skip_ahead", int(session_id))
     if not check_for_single_audiotrack(session_id):
         raise RoundException("this operation is only valid for projects with 1 audiotrack")
+    check_not_shared_stream(session_id)
 
     dbus_send.emit_stream_signal(int(session_id), "skip_ahead", "")
     return {"success": True}
@@ -406,6 +505,7 @@ def play(form):
     # Check if asset exists
     if not models.Asset.objects.filter(id=form['asset_id']).exists():
         raise RoundException("no asset found with this asset_id")
+    check_not_shared_stream(session_id)
 
     dbus_send.emit_stream_signal(session_id, "play_asset", arg_hack)
 
@@ -420,6 +520,7 @@ def pause(request, session_id=None):
 
     logger.debug("pausing")
     log_event("pause", int(session_id))
+    check_not_shared_stream(session_id)
 
     dbus_send.emit_stream_signal(int(session_id), "pause", "")
     return {"success": True}
@@ -433,6 +534,7 @@ def resume(request, session_id=None):
 
     logger.debug("resuming")
     log_event("resume", int(session_id))
+    check_not_shared_stream(session_id)
 
     dbus_send.emit_stream_signal(int(session_id), "resume", "")
     return {"success": True}
@@ -450,7 +552,23 @@ def check_is_active(session_id):
     session = models.Session.objects.select_related('project').get(id=session_id)
     audio_format = session.project.audio_format.upper()
 
-    return stream_exists(session_id, audio_format)
+    return stream_exists(stream_session_id(session_id), audio_format)
+
+
+def check_stream_status(session_id):
+    """
+    Returns the provisioning status of the session's stream: "ready",
+    "starting" or "stopped".
+    """
+    session = models.Session.objects.select_related('project').get(id=session_id)
+    audio_format = session.project.audio_format.upper()
+    session_id = stream_session_id(session_id)
+
+    status = icecast2.get_stream_status(icecast2.mount_point(session_id, audio_format))
+    if status is None:
+        return icecast2.STREAM_READY if stream_exists(session_id, audio_format) \
+            else 'stopped'
+    return status
 
 
 # create_envelope
@@ -550,9 +668,8 @@ def save_asset_from_request(request, session, asset=None):
         dest_filepath = os.path.join(settings.MEDIA_ROOT, dest_filename)
         count += 1
 
-    fileout = open(dest_filepath, 'wb')
-    fileout.write(fileitem.file.read())
-    fileout.close()
+    checksum = save_upload_to_file(fileitem, dest_filepath)
+    logger.debug("Session %s - Saved %s md5: %s", session.id, dest_filename, checksum)
 
     # Delete the uploaded original after the copy has been made.
     if asset:
@@ -643,6 +760,35 @@ def save_asset_from_request(request, session, asset=None):
     return asset
 
 
+def save_upload_to_file(fileitem, dest_filepath):
+    """
+    Persists an uploaded file or FieldFile at dest_filepath without reading
+    it into memory and returns the MD5 hex digest of its contents.
+    Files already on disk (TemporaryUploadedFile, FieldFile) are hard linked
+    when on the same filesystem, everything else is copied in chunks.
+    """
+    md5 = hashlib.md5()
+    try:
+        if hasattr(fileitem, 'temporary_file_path'):
+            source_filepath = fileitem.temporary_file_path()
+        else:
+            source_filepath = fileitem.path
+        os.link(source_filepath, dest_filepath)
+    except (AttributeError, NotImplementedError, OSError):
+        with open(dest_filepath, 'wb') as fileout:
+            for chunk in fileitem.chunks(UPLOAD_CHUNK_SIZE):
+                md5.update(chunk)
+                fileout.write(chunk)
+    else:
+        with open(dest_filepath, 'rb') as filein:
+            for chunk in iter(lambda: filein.read(UPLOAD_CHUNK_SIZE), b''):
+                md5.update(chunk)
+
+    if settings.FILE_UPLOAD_PERMISSIONS is not None:
+        os.chmod(dest_filepath, settings.FILE_UPLOAD_PERMISSIONS)
+    return md5.hexdigest()
+
+
 def get_parameter_from_request(request, name, required=False):
     ret = None
     try:
@@ -659,6 +805,22 @@ def get_parameter_from_request(request, name, required=False):
     return ret
 
 
+def parse_bbox(bbox):
+    """
+    Returns the polygon of a bounding box given as
+    "min_longitude,min_latitude,max_longitude,max_latitude".
+    """
+    try:
+        bounds = [float(value) for value in bbox.split(',')]
+    except ValueError:
+        bounds = []
+    if len(bounds) != 4:
+        raise RoundException("bbox must be min_longitude,min_latitude,max_longitude,max_latitude")
+    polygon = Polygon.from_bbox(bounds)
+    polygon.srid = 4326
+    return polygon
+
+
 def get_currently_streaming_asset(request, session_id=None):
     if session_id is None:
         session_id = request.GET.get('session_id', None)
@@ -667,7 +829,7 @@ def get_currently_streaming_asset(request, session_id=None):
     if check_for_single_audiotrack(session_id) is not True:
         raise RoundException("this operation is only valid for projects with 1 audiotrack")
     else:
-        l = _get_current_streaming_asset(session_id)
+        l = _get_current_streaming_asset(stream_session_id(session_id))
     if l:
         return {"asset_id": l.asset.id,
                 "start_time": l.starttime.isoformat(),
@@ -745,7 +907,9 @@ def vote_asset(request, asset_id=None):
 
     # send signal to stream process to have user_blocked_list updated
     # if new vote is of block_* type
-    if form.get('vote_type') in ('block_asset', 'block_user'):
+    # Shared streams keep the blocked assets of the session that owns them.
+    if form.get('vote_type') in ('block_asset', 'block_user') and \
+            not is_shared_stream(form.get('session_id')):
         dbus_send.emit_stream_signal(int(form.get('session_id')), "vote_asset", "")
         logger.info("sending vote signal for session_id = %s", int(form.get('session_id')))
 
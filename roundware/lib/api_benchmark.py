@@ -0,0 +1,449 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Latency and SQL query counts of every api/1 operation and api/2 endpoint,
+# requested in-process through the Django test client at several catalog
+# sizes. The catalogs are built like roundwared.benchmark's and rolled back
+# afterwards. Streams are stood in for (settings.STREAM_STANDIN and a stand-in
+# for Icecast's status), so no rwstreamd, dbus or Icecast is needed.
+#
+# Every endpoint declares a query budget: a fixed number of queries plus a
+# number per item it returns. A budget per item is an N+1 query that is known
+# about; lower it when the N+1 is fixed. check_budgets() lists the endpoints
+# over their budget.
+from __future__ import unicode_literals, division
+from collections import namedtuple, OrderedDict
+import json
+import logging
+import platform
+import random
+import time
+from timeit import default_timer
+from urllib import urlencode
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from roundware.lib import sampling
+from roundware.lib.cache_backends import state
+from roundware.rw.models import (Asset, Audiotrack, Envelope, Event, Language,
+                                 ListeningHistoryItem, LocalizedString,
+                                 TagRelationship, UIGroup, UIItem)
+from roundwared import icecast2
+from roundwared.benchmark import LATITUDE, LONGITUDE, Catalog, git_revision, measure
+
+logger = logging.getLogger(__name__)
+
+Endpoint = namedtuple('Endpoint', 'name method path params queries per_item')
+# Keys of the lists api/1 and api/2 wrap their results in.
+ITEM_KEYS = ('results', 'assets', 'events', 'tags', 'ui_groups')
+
+
+def operation(name, queries, per_item=0, **params):
+    """
+    An api/1 operation. Parameter values are formatted with Catalog.ids().
+    """
+    params['operation'] = name
+    return Endpoint('api/1 operation=%s' % name, 'get', '/api/1/', params,
+                    queries, per_item)
+
+
+def resource(method, path, queries, per_item=0, params=None, name=None):
+    """
+    A REST endpoint of api/1 or api/2. The path and parameter values are
+    formatted with Catalog.ids().
+    """
+    return Endpoint(name or '%s /%s' % (method.upper(), path), method, '/' + path,
+                    params or {}, queries, per_item)
+
+
+ENDPOINTS = (
+    operation('current_version', 1),
+    operation('get_config', 30, project_id='{project}', device_id='{device}'),
+    operation('get_tags', 60, session_id='{session}'),
+    # Localizes the description of every asset and the name of every tag.
+    operation('get_available_assets', 10, 12, project_id='{project}'),
+    operation('get_asset_info', 8, session_id='{session}', asset_id='{asset}'),
+    operation('get_events', 6, session_id='{session}'),
+    operation('log_event', 5, session_id='{session}', event_type='benchmark'),
+    operation('create_envelope', 5, session_id='{session}'),
+    operation('request_stream', 20, session_id='{session}',
+              latitude='{latitude}', longitude='{longitude}'),
+    operation('heartbeat', 3, session_id='{session}'),
+    operation('modify_stream', 8, session_id='{session}', tags='{tags}'),
+    operation('move_listener', 5, session_id='{session}',
+              latitude='{latitude}', longitude='{longitude}'),
+    operation('get_current_streaming_asset', 6, session_id='{session}'),
+    operation('play_asset_in_stream', 8, session_id='{session}', asset_id='{asset}'),
+    operation('vote_asset', 14, session_id='{session}', asset_id='{asset}',
+              vote_type='like'),
+    operation('skip_ahead', 8, session_id='{session}'),
+
+    # Tags, localized strings and the language of every asset.
+    resource('get', 'api/1/rest/asset/', 4, 4),
+    resource('get', 'api/1/rest/assetlocation/', 4),
+    resource('get', 'api/1/rest/assetlocation/{asset}/', 3),
+    resource('get', 'api/1/rest/project/', 4, 8),
+    resource('get', 'api/1/rest/event/', 4),
+    resource('get', 'api/1/rest/session/', 4),
+    resource('get', 'api/1/rest/listeninghistoryitem/', 4),
+
+    # Asset listings are serialized by AssetListSerializer in a constant
+    # number of queries.
+    resource('get', 'api/2/assets/', 9, params=dict(project_id='{project}')),
+    resource('get', 'api/2/assets/{asset}/', 10),
+    resource('get', 'api/2/assets/random/', 10, params=dict(project_id='{project}', limit='10')),
+    resource('get', 'api/2/assets/{asset}/votes/', 5),
+    resource('post', 'api/2/assets/{asset}/votes/', 18,
+             params=dict(session_id='{session}', vote_type='like')),
+    resource('get', 'api/2/events/', 5, params=dict(session_id='{session}')),
+    resource('get', 'api/2/events/{event}/', 4),
+    resource('post', 'api/2/events/', 6,
+             params=dict(session_id='{session}', event_type='benchmark')),
+    resource('get', 'api/2/listenevents/', 5, params=dict(session='{session}')),
+    resource('get', 'api/2/listenevents/{listen_event}/', 4),
+    resource('get', 'api/2/projects/{project}/', 30, params=dict(session_id='{session}')),
+    # TagSerializer gets the relationships per tag; localized strings are
+    # looked up in the compiled table of the project.
+    resource('get', 'api/2/projects/{project}/tags/', 14, 4,
+             dict(session_id='{session}')),
+    # UIGroupSerializer gets the UIItems per group.
+    resource('get', 'api/2/projects/{project}/uigroups/', 13, 3,
+             dict(session_id='{session}')),
+    resource('get', 'api/2/projects/{project}/assets/', 9),
+    resource('post', 'api/2/sessions/', 10,
+             params=dict(project_id='{project}', client_system='benchmark',
+                         geo_listen_enabled='true')),
+    resource('post', 'api/2/streams/', 30,
+             params=dict(session_id='{session}', latitude='{latitude}',
+                         longitude='{longitude}')),
+    resource('patch', 'api/2/streams/{session}/', 6,
+             params=dict(latitude='{latitude}', longitude='{longitude}'),
+             name='PATCH /api/2/streams/{session}/ (move listener)'),
+    resource('patch', 'api/2/streams/{session}/', 10, params=dict(tag_ids='{tags}'),
+             name='PATCH /api/2/streams/{session}/ (modify stream)'),
+    resource('post', 'api/2/streams/{session}/heartbeat/', 4),
+    resource('post', 'api/2/streams/{session}/playasset/', 10,
+             params=dict(asset_id='{asset}')),
+    resource('post', 'api/2/streams/{session}/skip/', 8),
+    resource('post', 'api/2/streams/{session}/pause/', 6),
+    resource('post', 'api/2/streams/{session}/resume/', 6),
+    resource('post', 'api/2/streams/{session}/replayasset/', 14),
+    resource('get', 'api/2/streams/{session}/isactive/', 4),
+    resource('get', 'api/2/tags/', 12, 4, dict(project='{project}')),
+    resource('get', 'api/2/tags/{tag}/', 18, params=dict(session_id='{session}')),
+    resource('get', 'api/2/tagcategories/', 3),
+    resource('get', 'api/2/tagcategories/{tag_category}/', 3),
+    resource('get', 'api/2/tagrelationships/', 3, params=dict(tag_id='{tag}')),
+    resource('get', 'api/2/uigroups/', 12, 3, dict(project_id='{project}')),
+    resource('get', 'api/2/uigroups/{ui_group}/', 14, params=dict(session_id='{session}')),
+    resource('get', 'api/2/uiitems/', 3, params=dict(ui_group_id='{ui_group}')),
+    resource('get', 'api/2/uiitems/{ui_item}/', 3),
+    resource('post', 'api/2/users/', 8,
+             params=dict(device_id='{device}', client_type='benchmark')),
+    resource('post', 'api/2/envelopes/', 6, params=dict(session_id='{session}')),
+)
+
+# Endpoints that are not benchmarked, and why.
+SKIPPED = OrderedDict([
+    ('api/1 operation=add_asset_to_envelope', 'transcodes an uploaded audio file'),
+    ('POST /api/2/assets/', 'transcodes an uploaded audio file'),
+    ('PATCH /api/2/envelopes/{envelope}/', 'transcodes an uploaded audio file'),
+    ('POST /api/2/tagcategories/', 'changes the project configuration'),
+    ('PATCH /api/2/tagcategories/{tag_category}/', 'changes the project configuration'),
+    ('DELETE /api/2/tagcategories/{tag_category}/', 'changes the project configuration'),
+])
+
+
+class ApiCatalog(Catalog):
+    """
+    A Catalog with what the API serves besides assets: localized strings,
+    tag relationships, an audiotrack, listening history, an envelope, an
+    event and an API token for the listening user.
+    """
+
+    def __init__(self, size, rng):
+        if size < 1:
+            raise ValueError("API benchmarks need at least one asset")
+        Catalog.__init__(self, size, rng)
+        # Localizations fall back to English.
+        self.english = Language.objects.get_or_create(
+            language_code='en', defaults={'name': 'English'})[0]
+        self.project.languages.add(self.english)
+        for field in ('sharing_message_loc', 'out_of_range_message_loc',
+                      'legal_agreement_loc', 'demo_stream_message_loc'):
+            getattr(self.project, field).add(*self.localize(field))
+        self.ui_groups = list(UIGroup.objects.filter(project=self.project))
+        for ui_group in self.ui_groups:
+            ui_group.header_text_loc.add(*self.localize(ui_group.name))
+        for tag in self.tags:
+            tag.loc_msg.add(*self.localize(tag.value))
+            tag.loc_description.add(*self.localize(tag.value))
+        for parent, tag in zip(self.tags, self.tags[1:]):
+            TagRelationship.objects.create(tag=tag, parent=parent)
+
+        Audiotrack.objects.create(
+            project=self.project, minvolume=1.0, maxvolume=1.0,
+            minduration=5.0e9, maxduration=10.0e9, mindeadair=1.0e9,
+            maxdeadair=3.0e9, minfadeintime=0.1e9, maxfadeintime=0.5e9,
+            minfadeouttime=0.1e9, maxfadeouttime=0.5e9, minpanpos=0.0,
+            maxpanpos=0.0, minpanduration=5.0e9, maxpanduration=10.0e9)
+        self.listen_event = ListeningHistoryItem.objects.create(
+            session=self.session, asset=self.assets[0], starttime=timezone.now(),
+            duration=self.assets[0].audiolength)
+        self.envelope = Envelope.objects.create(session=self.session)
+        self.event = Event.objects.create(
+            session=self.session, event_type='start_session', server_time=timezone.now())
+        user = get_user_model().objects.get(userprofile__device_id=self.session.device_id)
+        self.token = Token.objects.create(user=user)
+
+    def localize(self, text):
+        return [LocalizedString.objects.create(localized_string=text, language=language)
+                for language in (self.language, self.english)]
+
+    def ids(self):
+        """
+        Returns the values endpoint paths and parameters are formatted with.
+        """
+        return {
+            'project': self.project.id,
+            'session': self.session.id,
+            'device': self.session.device_id,
+            'asset': self.assets[0].id,
+            'tag': self.tags[0].id,
+            'tags': ','.join(str(tag.id) for tag in self.tags[:2]),
+            'tag_category': self.tags[0].tag_category_id,
+            'ui_group': self.ui_groups[0].id,
+            'ui_item': UIItem.objects.filter(ui_group=self.ui_groups[0])[0].id,
+            'event': self.event.id,
+            'listen_event': self.listen_event.id,
+            'envelope': self.envelope.id,
+            'latitude': LATITUDE,
+            'longitude': LONGITUDE,
+        }
+
+    def mount(self):
+        return icecast2.mount_point(self.session.id, self.project.audio_format.upper())
+
+
+class IcecastStandin(object):
+    """
+    Stands in for the /admin/stats of Icecast while in use, reporting the
+    mounts in self.mounts.
+    """
+
+    def __init__(self):
+        self.mounts = set()
+
+    def __enter__(self):
+        standin = self
+
+        def poll_status(admin):
+            status = {'time': time.time(),
+                      'mounts': dict((mount, 0) for mount in standin.mounts)}
+            state.set(icecast2.STATUS_CACHE_KEY, status, icecast2.STATUS_CACHE_TIMEOUT)
+            return status
+        self.poll_status = icecast2.Admin.poll_status
+        icecast2.Admin.poll_status = poll_status
+        state.delete(icecast2.STATUS_CACHE_KEY)
+        return self
+
+    def __exit__(self, *exc_info):
+        icecast2.Admin.poll_status = self.poll_status
+        state.delete(icecast2.STATUS_CACHE_KEY)
+
+
+def send(client, endpoint, ids):
+    path = endpoint.path.format(**ids)
+    params = dict((key, unicode(value).format(**ids))
+                  for key, value in endpoint.params.items())
+    if endpoint.method == 'get':
+        return client.get(path, params)
+    if endpoint.method == 'patch':
+        return client.patch(path, urlencode(params),
+                            content_type='application/x-www-form-urlencoded')
+    return getattr(client, endpoint.method)(path, params)
+
+
+def count_items(data):
+    """
+    Returns the number of items in a response: the length of a list, or of
+    the list a dict wraps them in.
+    """
+    if isinstance(data, list):
+        return len(data)
+    if isinstance(data, dict):
+        for key in ITEM_KEYS:
+            if isinstance(data.get(key), list):
+                return len(data[key])
+    return 0
+
+
+def response_error(response, data):
+    """
+    Returns the error of a response, if any. api/1 operations report errors
+    with a 200 response.
+    """
+    if isinstance(data, dict):
+        for key in ('error_message', 'error', 'detail'):
+            if data.get(key):
+                return data[key]
+    if response.status_code >= 400:
+        return "HTTP %s" % response.status_code
+    return None
+
+
+def benchmark_endpoints(client, catalog, endpoints, repeat):
+    """
+    Times the endpoints on an ApiCatalog. Returns an OrderedDict of results
+    by endpoint name.
+    """
+    ids = catalog.ids()
+    results = OrderedDict()
+    for endpoint in endpoints:
+        responses = []
+        result = measure(lambda: responses.append(send(client, endpoint, ids)), repeat)
+        response = responses[-1]
+        try:
+            data = json.loads(response.content.decode('utf-8'))
+        except ValueError:
+            data = None
+        result['status'] = response.status_code
+        result['error'] = response_error(response, data)
+        result['items'] = count_items(data)
+        result['budget'] = endpoint.queries + endpoint.per_item * result['items']
+        result['over_budget'] = result['queries'] > result['budget']
+        results[endpoint.name] = result
+    return results
+
+
+def run(sizes, repeat=10, seed=0, endpoints=ENDPOINTS):
+    """
+    Benchmarks the endpoints on catalogs of each of the sizes (at least one
+    asset), repeat timed requests per endpoint. Returns the results with
+    details of the environment.
+    """
+    results = OrderedDict()
+    force_debug_cursor = connection.force_debug_cursor
+    connection.force_debug_cursor = True
+    try:
+        with override_settings(STREAM_STANDIN=True), IcecastStandin() as icecast:
+            for size in sizes:
+                rng = random.Random(seed)
+                random.seed(seed)
+                started = default_timer()
+                with transaction.atomic():
+                    catalog = ApiCatalog(size, rng)
+                    logger.info("Built a catalog of %s assets in %.1f seconds",
+                                size, default_timer() - started)
+                    # The listening session's stream is up.
+                    icecast.mounts = set([catalog.mount()])
+                    state.delete(icecast2.STATUS_CACHE_KEY)
+                    client = Client(HTTP_AUTHORIZATION='Token %s' % catalog.token.key)
+                    results[str(size)] = benchmark_endpoints(client, catalog, endpoints, repeat)
+                    transaction.set_rollback(True)
+    finally:
+        connection.force_debug_cursor = force_debug_cursor
+    return OrderedDict([
+        ('revision', git_revision()),
+        ('created', timezone.now().isoformat()),
+        ('database', connection.vendor),
+        ('python', platform.python_version()),
+        ('repeat', repeat),
+        ('seed', seed),
+        ('units', 'seconds'),
+        ('skipped', SKIPPED),
+        ('results', results),
+    ])
+
+
+def check_budgets(report):
+    """
+    Returns a description of every endpoint that failed or went over its
+    query budget.
+    """
+    failures = []
+    for size, results in report['results'].items():
+        for name, result in results.items():
+            if result['error']:
+                failures.append("%s assets, %s: %s" % (size, name, result['error']))
+            elif result['over_budget']:
+                failures.append("%s assets, %s: %.1f queries, budget %s" % (
+                    size, name, result['queries'], result['budget']))
+    return failures
+
+
+def format_results(report):
+    """
+    Returns benchmark results as human readable text. Endpoints over their
+    budget are marked with !, failed ones with E.
+    """
+    lines = ["Revision %s on %s, %s timed requests per endpoint" % (
+        report['revision'], report['database'], report['repeat'])]
+    for size, results in report['results'].items():
+        lines.append("")
+        lines.append("%s assets" % size)
+        lines.append("  %-60s %10s %10s %6s %8s %7s" % (
+            'endpoint', 'median ms', 'p95 ms', 'items', 'queries', 'budget'))
+        for name, result in results.items():
+            mark = 'E' if result['error'] else '!' if result['over_budget'] else ' '
+            lines.append("%s %-60s %10.3f %10.3f %6d %8.1f %7s" % (
+                mark, name, result['median'] * 1000, result['p95'] * 1000,
+                result['items'], result['queries'], result['budget']))
+    if report['skipped']:
+        lines.append("")
+        lines.append("Not benchmarked:")
+        for name, reason in report['skipped'].items():
+            lines.append("  %s: %s" % (name, reason))
+    return '\n'.join(lines)
+
+
+def run_sampling(sizes, limit=10, repeat=10, seed=0):
+    """
+    Times sampling limit random assets of a project, as api/2 assets/random
+    does, by reading every id in memory and with sampling.sample_ids(), on
+    catalogs of each of the sizes. Returns the results by size and strategy.
+    """
+    results = OrderedDict()
+    force_debug_cursor = connection.force_debug_cursor
+    connection.force_debug_cursor = True
+    try:
+        for size in sizes:
+            rng = random.Random(seed)
+            with transaction.atomic():
+                catalog = Catalog(size, rng)
+                assets = Asset.objects.filter(project=catalog.project)
+                results[str(size)] = OrderedDict([
+                    ('in memory', measure(lambda: sampling.sample_in_memory(
+                        assets.values_list('id', flat=True), limit, rng), repeat)),
+                    ('sample_ids', measure(lambda: sampling.sample_ids(assets, limit, rng),
+                                           repeat)),
+                ])
+                transaction.set_rollback(True)
+    finally:
+        connection.force_debug_cursor = force_debug_cursor
+    return OrderedDict([
+        ('revision', git_revision()),
+        ('database', connection.vendor),
+        ('limit', limit),
+        ('repeat', repeat),
+        ('units', 'seconds'),
+        ('results', results),
+    ])
+
+
+def format_sampling(report):
+    lines = ["Revision %s on %s, sampling %s assets, %s times per strategy" % (
+        report['revision'], report['database'], report['limit'], report['repeat'])]
+    lines.append("  %-10s %-12s %10s %10s %8s" % ('assets', 'strategy', 'median ms', 'p95 ms',
+                                                 'queries'))
+    for size, results in report['results'].items():
+        for strategy, result in results.items():
+            lines.append("  %-10s %-12s %10.3f %10.3f %8.1f" % (
+                size, strategy, result['median'] * 1000, result['p95'] * 1000,
+                result['queries']))
+    return '\n'.join(lines)
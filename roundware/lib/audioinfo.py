@@ -0,0 +1,257 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Reads audio metadata directly from file headers, without starting a
+# mediainfo/avconv subprocess. WAV (RIFF) files are read from the fmt/data
+# chunks, MP3 files from the first frame header plus any Xing/Info/VBRI
+# header and Ogg Vorbis files from the identification header and the
+# granule position of the last page.
+#
+# This module deliberately has no Django dependency so it can be used by
+# scripts and management commands alike.
+from __future__ import unicode_literals
+from collections import namedtuple
+import os
+import struct
+
+# Durations are in nanoseconds, the same unit as Asset.audiolength and gst.
+SECOND = 1000000000
+
+AudioInfo = namedtuple('AudioInfo',
+                       ['format', 'duration', 'rate', 'channels', 'size'])
+
+# How far into an MP3 file to look for the first frame sync.
+MP3_SYNC_SEARCH_BYTES = 64 * 1024
+# How far from the end of an Ogg file to look for the last page.
+OGG_TAIL_BYTES = 64 * 1024
+
+# MPEG audio lookup tables, indexed by [version][layer][bitrate_index]
+# Versions: 1 = MPEG1, 2 = MPEG2 and MPEG2.5. Layers: 1, 2, 3. In kbit/s.
+_MP3_BITRATES = {
+    1: {1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]},
+    2: {1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]},
+}
+# Keyed by the two version bits of the frame header.
+_MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG1
+    2: [22050, 24000, 16000],  # MPEG2
+    0: [11025, 12000, 8000],   # MPEG2.5
+}
+
+
+def probe(filepath):
+    """
+    Returns an AudioInfo for the audio file at filepath, or None when the
+    file is missing, is not in a supported format or its headers are corrupt.
+    """
+    try:
+        size = os.path.getsize(filepath)
+        with open(filepath, 'rb') as f:
+            magic = f.read(12)
+            f.seek(0)
+            if magic[:4] == b'RIFF' and magic[8:12] == b'WAVE':
+                return _probe_wav(f, size)
+            elif magic[:4] == b'OggS':
+                return _probe_ogg(f, size)
+            elif magic[:3] == b'ID3' or _is_mp3_sync(bytearray(magic[:2])):
+                return _probe_mp3(f, size)
+    except (IOError, OSError, struct.error):
+        pass
+    return None
+
+
+def probe_directory(path, extensions=('.wav', '.mp3', '.ogg')):
+    """
+    Probes every audio file below path. Yields (filepath, AudioInfo) tuples;
+    the AudioInfo is None for files that could not be read.
+    """
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() in extensions:
+                filepath = os.path.join(dirpath, filename)
+                yield filepath, probe(filepath)
+
+
+def _probe_wav(f, size):
+    f.seek(12)
+    channels = rate = byte_rate = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack(b'<4sI', header)
+        if chunk_id == b'fmt ':
+            fmt = f.read(16)
+            if len(fmt) < 16:
+                return None
+            (audio_format, channels, rate, byte_rate,
+             block_align, bits) = struct.unpack(b'<HHIIHH', fmt)
+            # Skip the rest of the chunk, e.g. WAVE_FORMAT_EXTENSIBLE data.
+            f.seek(chunk_size - 16 + (chunk_size & 1), os.SEEK_CUR)
+        elif chunk_id == b'data':
+            if not byte_rate:
+                return None
+            # Streaming writers leave the data size unset (0 or 0xFFFFFFFF),
+            # in which case the data runs until the end of the file.
+            available = size - f.tell()
+            if chunk_size == 0 or chunk_size > available:
+                chunk_size = available
+            duration = chunk_size * SECOND // byte_rate
+            return AudioInfo('wav', duration, rate, channels, size)
+        else:
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def _is_mp3_sync(header):
+    return len(header) >= 2 and header[0] == 0xFF and (header[1] & 0xE0) == 0xE0
+
+
+def _parse_mp3_header(header):
+    """
+    Returns (version_bits, layer, bitrate, rate, channels, samples_per_frame,
+    frame_length) for a 4 byte MPEG audio frame header or None if invalid.
+    """
+    if not _is_mp3_sync(header):
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer = 4 - ((header[1] >> 1) & 0x03)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+    channel_mode = header[3] >> 6
+    if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) \
+            or rate_index == 3:
+        return None
+
+    version = 1 if version_bits == 3 else 2
+    bitrate = _MP3_BITRATES[version][layer][bitrate_index] * 1000
+    rate = _MP3_SAMPLE_RATES[version_bits][rate_index]
+    channels = 1 if channel_mode == 3 else 2
+    if layer == 1:
+        samples_per_frame = 384
+        frame_length = (12 * bitrate // rate + padding) * 4
+    elif layer == 2 or version == 1:
+        samples_per_frame = 1152
+        frame_length = 144 * bitrate // rate + padding
+    else:
+        samples_per_frame = 576
+        frame_length = 72 * bitrate // rate + padding
+    return (version_bits, layer, bitrate, rate, channels, samples_per_frame,
+            frame_length)
+
+
+def _probe_mp3(f, size):
+    offset = 0
+    tag = f.read(10)
+    if tag[:3] == b'ID3' and len(tag) == 10:
+        flags = bytearray(tag)[5]
+        s = bytearray(tag[6:10])
+        offset = 10 + ((s[0] << 21) | (s[1] << 14) | (s[2] << 7) | s[3])
+        if flags & 0x10:
+            offset += 10
+    f.seek(offset)
+    data = bytearray(f.read(MP3_SYNC_SEARCH_BYTES))
+
+    # Find the first frame header that is followed by another valid header,
+    # which rules out false syncs inside album art and other binary data.
+    i = 0
+    frame = None
+    while i + 4 <= len(data):
+        if data[i] == 0xFF:
+            frame = _parse_mp3_header(data[i:i + 4])
+            if frame:
+                following = data[i + frame[6]:i + frame[6] + 4]
+                if len(following) < 4 or _parse_mp3_header(following):
+                    break
+            frame = None
+        i += 1
+    if not frame:
+        return None
+    (version_bits, layer, bitrate, rate, channels, samples_per_frame,
+     frame_length) = frame
+    frame_start = offset + i
+
+    # Variable bitrate files carry the total frame count in a Xing/Info
+    # header directly after the side information, or in a VBRI header.
+    frames = None
+    if version_bits == 3:
+        side_info = 17 if channels == 1 else 32
+    else:
+        side_info = 9 if channels == 1 else 17
+    xing = data[i + 4 + side_info:i + 4 + side_info + 12]
+    vbri = data[i + 36:i + 36 + 18]
+    if xing[:4] in (b'Xing', b'Info') and len(xing) == 12:
+        xing_flags = struct.unpack(b'>I', bytes(xing[4:8]))[0]
+        if xing_flags & 0x01:
+            frames = struct.unpack(b'>I', bytes(xing[8:12]))[0]
+    elif vbri[:4] == b'VBRI' and len(vbri) == 18:
+        frames = struct.unpack(b'>I', bytes(vbri[14:18]))[0]
+
+    if frames:
+        duration = frames * samples_per_frame * SECOND // rate
+    elif _mp3_is_cbr(data, i):
+        audio_bytes = size - frame_start
+        f.seek(-128, os.SEEK_END)
+        if f.read(3) == b'TAG':
+            audio_bytes -= 128
+        duration = audio_bytes * 8 * SECOND // bitrate
+    else:
+        # VBR without a frame count header; walk the frame headers.
+        samples = 0
+        position = frame_start
+        while True:
+            f.seek(position)
+            header = _parse_mp3_header(bytearray(f.read(4)))
+            if not header:
+                break
+            samples += header[5]
+            position += header[6]
+        duration = samples * SECOND // rate
+    return AudioInfo('mp3', duration, rate, channels, size)
+
+
+def _mp3_is_cbr(data, i):
+    """
+    True if every complete frame in data, starting at index i, has the same
+    bitrate.
+    """
+    bitrate = None
+    while i + 4 <= len(data):
+        header = _parse_mp3_header(data[i:i + 4])
+        if not header:
+            break
+        if bitrate is not None and header[2] != bitrate:
+            return False
+        bitrate = header[2]
+        i += header[6]
+    return True
+
+
+def _probe_ogg(f, size):
+    page = f.read(27)
+    if len(page) < 27:
+        return None
+    segments = bytearray(page)[26]
+    f.seek(segments, os.SEEK_CUR)
+    packet = f.read(16)
+    if packet[:7] != b'\x01vorbis' or len(packet) < 16:
+        return None
+    channels, rate = struct.unpack(b'<BI', packet[11:16])
+    if not rate:
+        return None
+
+    # The granule position of the last page is the total number of samples.
+    f.seek(max(0, size - OGG_TAIL_BYTES))
+    tail = f.read()
+    last_page = tail.rfind(b'OggS')
+    if last_page < 0 or last_page + 14 > len(tail):
+        return None
+    granule = struct.unpack(b'<q', tail[last_page + 6:last_page + 14])[0]
+    if granule < 0:
+        return None
+    duration = granule * SECOND // rate
+    return AudioInfo('ogg', duration, rate, channels, size)
@@ -0,0 +1,132 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import io
+import time
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.utils.module_loading import import_string
+from roundwared import metrics
+
+# Told apart from cached values, which may be anything but this.
+MISSING = object()
+
+
+class MeasuredCache(BaseCache):
+    """
+    Wraps the cache backend named by OPTIONS['BACKEND'], passing it the rest
+    of the options, and tallies the hits and misses of gets for the request
+    metrics. Configure it in CACHES like:
+
+        'BACKEND': 'roundware.lib.cache_backends.MeasuredCache',
+        'OPTIONS': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache'}
+    """
+
+    def __init__(self, location, params):
+        params = dict(params)
+        options = dict(params.get('OPTIONS', {}))
+        backend = options.pop('BACKEND')
+        params['OPTIONS'] = options
+        super(MeasuredCache, self).__init__(params)
+        self.cache = import_string(backend)(location, params)
+
+    def get(self, key, default=None, version=None):
+        value = self.cache.get(key, MISSING, version=version)
+        if value is MISSING:
+            metrics.tally('cache_misses')
+            return default
+        metrics.tally('cache_hits')
+        return value
+
+    def get_many(self, keys, version=None):
+        values = self.cache.get_many(keys, version=version)
+        metrics.tally('cache_hits', len(values))
+        metrics.tally('cache_misses', len(keys) - len(values))
+        return values
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.cache.add(key, value, timeout, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.cache.set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self.cache.set_many(data, timeout, version)
+
+    def delete(self, key, version=None):
+        self.cache.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        self.cache.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        return self.cache.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.cache.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.cache.decr(key, delta, version=version)
+
+    def clear(self):
+        self.cache.clear()
+
+    def close(self, **kwargs):
+        self.cache.close(**kwargs)
+
+
+class ExpiringFileBasedCache(FileBasedCache):
+    """
+    A FileBasedCache that, once it holds MAX_ENTRIES, deletes the entries
+    that expired before it culls a random CULL_FREQUENCY of the rest, so
+    live entries are only lost if that many are live.
+
+    FileBasedCache lists all of its files to cull on every set. This one
+    does so at most once every OPTIONS['CULL_INTERVAL'] seconds, 10 by
+    default, and may meanwhile hold more than MAX_ENTRIES.
+    """
+
+    def __init__(self, dir, params):
+        super(ExpiringFileBasedCache, self).__init__(dir, params)
+        self._cull_interval = params.get('OPTIONS', {}).get('CULL_INTERVAL', 10)
+        self._next_cull = 0
+
+    def _cull(self):
+        now = time.time()
+        if now < self._next_cull:
+            return
+        self._next_cull = now + self._cull_interval
+        filelist = self._list_cache_files()
+        if len(filelist) < self._max_entries:
+            return
+        for fname in filelist:
+            try:
+                with io.open(fname, 'rb') as f:
+                    # Deletes the file if it expired.
+                    self._is_expired(f)
+            except (IOError, OSError, EOFError):
+                # Deleted, or being written, by another process.
+                pass
+        super(ExpiringFileBasedCache, self)._cull()
+
+
+class CacheProxy(object):
+    """
+    The cache of alias in the current thread, looked up on every use like
+    django.core.cache.cache is for the default cache.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __getattr__(self, name):
+        return getattr(caches[self.alias], name)
+
+
+# What web workers and streams share about live sessions and streams: when
+# sessions were last seen, their projects, the shared streams and the status
+# of streams. Kept out of the default cache, so documents cached there never
+# cull it; see CACHES['state'].
+state = CacheProxy('state')
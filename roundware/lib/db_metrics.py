@@ -0,0 +1,43 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Counts the database queries of a thread, and the time they take, in its
+# roundwared.metrics tally as "db_queries" and "db_query_seconds", like
+# MeasuredCache counts cache gets. Unlike the debug cursor it neither formats
+# nor keeps the queries, so streams and web workers can count all of theirs.
+from __future__ import unicode_literals
+from django.db.backends.utils import CursorDebugWrapper, CursorWrapper
+from roundwared import metrics
+
+
+class MeasuredCursorMixin(object):
+
+    def execute(self, sql, params=None):
+        metrics.tally('db_queries')
+        with metrics.timed('db_query_seconds'):
+            return super(MeasuredCursorMixin, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        metrics.tally('db_queries')
+        with metrics.timed('db_query_seconds'):
+            return super(MeasuredCursorMixin, self).executemany(sql, param_list)
+
+
+class MeasuredCursorWrapper(MeasuredCursorMixin, CursorWrapper):
+    pass
+
+
+class MeasuredCursorDebugWrapper(MeasuredCursorMixin, CursorDebugWrapper):
+    pass
+
+
+def measure(connection):
+    """
+    Makes the cursors connection makes from now on tally their queries.
+    connection is that of the current thread, as each thread has its own.
+    """
+    if getattr(connection, 'measured', False):
+        return
+    connection.make_cursor = lambda cursor: MeasuredCursorWrapper(cursor, connection)
+    connection.make_debug_cursor = lambda cursor: MeasuredCursorDebugWrapper(cursor, connection)
+    connection.measured = True
@@ -3,15 +3,24 @@
 
 # Sends dbus signals to rwstreamd.py
 from __future__ import unicode_literals
+import logging
 import dbus
 import dbus.service
 from dbus.mainloop.glib import DBusGMainLoop
+from django.conf import settings
+from roundwared import metrics
+
+logger = logging.getLogger(__name__)
 
 INTERFACE = "org.roundware.StreamScript"
 OBJECT_PATH = "/org/roundware/StreamScript/emitter"
 
 def emit_stream_signal(sessionid, operation, args):
-    global_emitter.round_stream_control(sessionid, operation, args)
+    if settings.STREAM_STANDIN:
+        logger.debug("Stream signal stand-in: %s %s %s", sessionid, operation, args)
+        return
+    with metrics.timed('dbus_seconds'):
+        global_emitter.round_stream_control(sessionid, operation, args)
 
 
 class StreamSignalEmmiter(dbus.service.Object):
@@ -26,4 +35,5 @@ class StreamSignalEmmiter(dbus.service.Object):
     def round_stream_control(self, sessionid, operation, args):
         pass
 
-global_emitter = StreamSignalEmmiter()
+# There may be no system bus where stream stand-ins are used.
+global_emitter = None if settings.STREAM_STANDIN else StreamSignalEmmiter()
@@ -6,11 +6,20 @@ from django.conf import settings
 import os
 import subprocess
 from exception import RoundException
+from roundware.lib import audioinfo
 
 
 def discover_and_set_audiolength(recording, filename):
     filepath = os.path.join(settings.MEDIA_ROOT, filename)
 
+    # Read the length from the file headers, uploads are converted to wav.
+    info = audioinfo.probe(filepath)
+    if info:
+        recording.audiolength = info.duration
+        recording.save()
+        return
+
+    # Fall back to mediainfo for formats audioinfo can't read.
     cmd = ['mediainfo', '--Inform=General;%Duration%', filepath]
     p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
     output, error = p.communicate()
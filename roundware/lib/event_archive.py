@@ -0,0 +1,119 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Archiving of old events, so the Event table only holds recent ones. Events
+# are archived a day at a time: counted by session and type into EventRollup,
+# written to a gzipped JSON lines file and deleted, in one transaction. A
+# file is named after its day and the time it was written, so archiving a
+# day again, for events logged late, adds a file rather than replacing one.
+# Run by manage.py archive_events.
+from __future__ import unicode_literals
+import datetime
+import gzip
+import json
+import logging
+import os
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from roundware.rw.models import Event, EventRollup
+
+logger = logging.getLogger(__name__)
+
+# The fields of events written to archive files.
+FIELDS = ('id', 'server_time', 'client_time', 'session_id', 'event_type', 'data',
+          'latitude', 'longitude', 'tags')
+
+
+def day_events(day):
+    start = datetime.datetime.combine(day, datetime.time())
+    return Event.objects.filter(server_time__gte=start,
+                                server_time__lt=start + datetime.timedelta(days=1))
+
+
+def days_before(cutoff):
+    """
+    Returns the days before the datetime cutoff that have events, oldest
+    first.
+    """
+    first = Event.objects.filter(server_time__lt=cutoff).aggregate(Min('server_time'))
+    if first['server_time__min'] is None:
+        return []
+    day = first['server_time__min'].date()
+    days = []
+    while datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time()) <= cutoff:
+        days.append(day)
+        day += datetime.timedelta(days=1)
+    return days
+
+
+def roll_up(day, events):
+    """
+    Adds the counts of events, those of day, to the EventRollups of day.
+    """
+    existing = dict(((rollup.session_id, rollup.event_type), rollup)
+                    for rollup in EventRollup.objects.filter(day=day).select_for_update())
+    created = []
+    for row in events.order_by().values('session_id', 'event_type').annotate(
+            count=Count('id'), first_time=Min('server_time'), last_time=Max('server_time')):
+        rollup = existing.get((row['session_id'], row['event_type']))
+        if rollup is None:
+            created.append(EventRollup(day=day, **row))
+            continue
+        rollup.count += row['count']
+        rollup.first_time = min(rollup.first_time, row['first_time'])
+        rollup.last_time = max(rollup.last_time, row['last_time'])
+        rollup.save()
+    EventRollup.objects.bulk_create(created)
+
+
+def export(events, path):
+    """
+    Writes events to path as gzipped JSON lines. Returns how many there were.
+    """
+    count = 0
+    with open(path, 'wb') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb') as out:
+            for row in events.order_by('id').values(*FIELDS).iterator():
+                row['server_time'] = row['server_time'].isoformat()
+                out.write(json.dumps(row).encode('utf-8') + b'\n')
+                count += 1
+        f.flush()
+        os.fsync(f.fileno())
+    return count
+
+
+def archive_day(day, directory):
+    """
+    Rolls up, exports and deletes the events of day. Returns how many there
+    were.
+    """
+    path = os.path.join(directory, 'events-%s-%s.jsonl.gz' % (
+        day.isoformat(), datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')))
+    events = day_events(day)
+    try:
+        with transaction.atomic():
+            roll_up(day, events)
+            count = export(events, path)
+            events.delete()
+    except:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    if not count:
+        os.remove(path)
+    return count
+
+
+def archive(cutoff, directory):
+    """
+    Archives the events of the days before the datetime cutoff. Returns how
+    many there were by day.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    archived = []
+    for day in days_before(cutoff):
+        count = archive_day(day, directory)
+        logger.info("Archived %s events of %s", count, day)
+        archived.append((day, count))
+    return archived
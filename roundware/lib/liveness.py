@@ -0,0 +1,96 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Liveness of listening sessions. Clients heartbeat every few seconds, and a
+# heartbeat only records when its session, and the stream the session
+# listens to, were last seen, in the state cache that web workers and
+# rwstreamd share. The database gets one LivenessInterval per stretch of
+# heartbeats no more than settings.HEARTBEAT_TIMEOUT apart: the heartbeat
+# that starts a stretch creates it, under a lock on the session's row so
+# concurrent heartbeats start one, and flush(), run periodically by
+# manage.py flush_liveness, moves its end. Streams read when they were last
+# heartbeated when they ping.
+from __future__ import unicode_literals
+import datetime
+import time
+from django.conf import settings
+from django.db import transaction
+from roundware.lib import shared_streams
+from roundware.lib.cache_backends import state as cache
+from roundware.rw.models import LivenessInterval, Session
+
+# (start of the session's interval, timestamp it was last seen), kept for two
+# timeouts so flush() reads the end of intervals that just stopped.
+SESSION_CACHE_KEY = 'liveness_session%s'
+# Timestamp the stream of a session was last heartbeated.
+STREAM_CACHE_KEY = 'liveness_stream%s'
+
+
+def seen(session_id, stream_id=None, now=None):
+    """
+    Records a heartbeat of session_id, listening to the stream of stream_id
+    or its own.
+    """
+    now = time.time() if now is None else now
+    timeout = settings.HEARTBEAT_TIMEOUT
+    key = SESSION_CACHE_KEY % session_id
+    current = cache.get(key)
+    if current is None or now - current[1] > timeout:
+        with transaction.atomic():
+            list(Session.objects.select_for_update().filter(pk=session_id).values_list('id'))
+            # Unless a heartbeat that held the lock before started it.
+            current = cache.get(key)
+            if current is None or now - current[1] > timeout:
+                if current is not None:
+                    close(session_id, current)
+                start = datetime.datetime.fromtimestamp(now)
+                LivenessInterval.objects.create(session_id=session_id, start=start, end=start)
+                current = (start, now)
+                cache.set(key, current, timeout * 2)
+    cache.set_many({key: (current[0], now),
+                    STREAM_CACHE_KEY % (stream_id or session_id): now}, timeout * 2)
+
+
+def close(session_id, current):
+    """
+    Closes the interval of session_id that started and was last seen as in
+    current, a value of its SESSION_CACHE_KEY.
+    """
+    LivenessInterval.objects.filter(session_id=session_id, start=current[0], closed=False) \
+        .update(end=datetime.datetime.fromtimestamp(current[1]), closed=True)
+
+
+def stream_last_seen(stream_id):
+    """
+    Returns the timestamp the stream of stream_id was last heartbeated, or
+    None if it wasn't lately.
+    """
+    return cache.get(STREAM_CACHE_KEY % stream_id)
+
+
+def flush(now=None):
+    """
+    Moves the end of the open intervals to when their sessions were last
+    seen, and closes those of sessions that stopped heartbeating, which
+    leave their shared streams. Returns how many intervals were closed.
+    """
+    now = time.time() if now is None else now
+    intervals = list(LivenessInterval.objects.filter(closed=False))
+    current = cache.get_many([SESSION_CACHE_KEY % interval.session_id for interval in intervals])
+    closed = 0
+    gone = []
+    for interval in intervals:
+        seen = current.get(SESSION_CACHE_KEY % interval.session_id)
+        if seen is None or seen[0] != interval.start:
+            # Forgotten by the cache, or superseded by a later interval.
+            end, stopped = interval.end, True
+        else:
+            end = datetime.datetime.fromtimestamp(seen[1])
+            stopped = now - seen[1] > settings.HEARTBEAT_TIMEOUT
+        if end != interval.end or stopped:
+            LivenessInterval.objects.filter(pk=interval.pk).update(end=end, closed=stopped)
+        if stopped and (seen is None or seen[0] == interval.start):
+            gone.append(interval.session_id)
+        closed += stopped
+    shared_streams.leave(gone)
+    return closed
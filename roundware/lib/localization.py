@@ -0,0 +1,231 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Compiled localization tables. The localized strings of the configuration of
+# a project, its messages and the strings of its tags and UI groups, are read
+# in one query per field into a table by language and owner, cached per
+# project, so localizing a whole tag list costs no query per string. A table
+# is dropped when a LocalizedString or the strings of a project, tag or UI
+# group change, and every table when a Language does, once the change
+# commits; see the signal handlers at the end.
+from __future__ import unicode_literals
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import Signal
+from roundware.rw.models import Language, LocalizedString, Project, Tag, UIGroup
+
+# The localized fields compiled, by model.
+FIELDS = (
+    (Project, ('sharing_message_loc', 'out_of_range_message_loc', 'legal_agreement_loc',
+               'demo_stream_message_loc')),
+    (Tag, ('loc_description', 'loc_msg')),
+    (UIGroup, ('header_text_loc',)),
+)
+# Table of a project, by generation and project id.
+CACHE_KEY = 'localization%s-%s'
+# Bumped to drop every table; milliseconds, like the generations of
+# roundware.lib.project_config.
+GENERATION_CACHE_KEY = 'localization_generation'
+# Tables are compiled anew at least this often, in case a change was made
+# without signals, like by QuerySet.update().
+CACHE_TIMEOUT = 24 * 3600
+
+# Sent when tables are dropped, with the ids of their projects, or None for
+# every project.
+invalidated = Signal(providing_args=['project_ids'])
+
+
+def field_key(model, field):
+    return '%s.%s' % (model._meta.model_name, field)
+
+
+class Table(object):
+    """
+    The localized strings of a project by language and owner.
+    """
+
+    def __init__(self, languages, strings):
+        # {language code: language id}
+        self.languages = languages
+        # {language id: {(field key, owner id): string}}
+        self.strings = strings
+
+    def chain(self, language_id, fallback='en'):
+        """
+        Returns the languages to look strings up in: language_id, then the
+        fallback language, when there is one.
+        """
+        chain = [language_id, self.languages.get(fallback)] if fallback else [language_id]
+        return tuple(language for i, language in enumerate(chain)
+                     if language is not None and language not in chain[:i])
+
+    def get(self, obj, field, languages, default=None):
+        """
+        Returns the string of the localized field of obj in the first of
+        languages it has one in, or default.
+        """
+        key = (field_key(type(obj), field), obj.pk)
+        for language in languages:
+            value = self.strings.get(language, {}).get(key)
+            if value is not None:
+                return value
+        return default
+
+
+def compile_table(project_id):
+    """
+    Reads the Table of project_id from the database.
+    """
+    strings = {}
+    for model, fields in FIELDS:
+        for name in fields:
+            field = model._meta.get_field(name)
+            owner = field.m2m_field_name()
+            string = field.m2m_reverse_field_name()
+            owner_filter = owner if model is Project else '%s__project' % owner
+            rows = field.remote_field.through.objects \
+                .filter(**{owner_filter: project_id}) \
+                .order_by(string) \
+                .values_list(owner, '%s__language' % string,
+                             '%s__localized_string' % string)
+            key = field_key(model, name)
+            for owner_id, language_id, value in rows:
+                # The first string of a language, as the lookups this replaces gave.
+                strings.setdefault(language_id, {}).setdefault((key, owner_id), value)
+    languages = dict(Language.objects.values_list('language_code', 'id'))
+    return Table(languages, strings)
+
+
+def generation():
+    current = cache.get(GENERATION_CACHE_KEY)
+    if current is None:
+        # Not from 0: tables cached under generations since evicted must
+        # not be used again.
+        current = int(time.time() * 1000)
+        cache.set(GENERATION_CACHE_KEY, current, None)
+    return current
+
+
+def cache_key(project_id):
+    return CACHE_KEY % (generation(), project_id)
+
+
+def table(project_id, memo=None):
+    """
+    Returns the Table of project_id, compiled anew if it isn't cached. memo
+    is a dict to keep the tables got in, like the context of a serializer,
+    so that a request gets each from the cache once.
+    """
+    if memo is not None and project_id in memo:
+        return memo[project_id]
+    key = cache_key(project_id)
+    cached = cache.get(key)
+    if cached is None:
+        compiled = compile_table(project_id)
+        cache.set(key, (compiled.languages, compiled.strings), CACHE_TIMEOUT)
+    else:
+        compiled = Table(*cached)
+    if memo is not None:
+        memo[project_id] = compiled
+    return compiled
+
+
+def strings(model, field, owner_ids):
+    """
+    Returns the strings of a localized field of many objects, not in a
+    Table, like those of assets, as {owner id: {language id: string}}.
+    """
+    field = model._meta.get_field(field)
+    owner = field.m2m_field_name()
+    string = field.m2m_reverse_field_name()
+    result = {}
+    for owner_id, language_id, value in field.remote_field.through.objects \
+            .filter(**{'%s__in' % owner: owner_ids}) \
+            .order_by(string) \
+            .values_list(owner, '%s__language' % string,
+                         '%s__localized_string' % string):
+        result.setdefault(owner_id, {}).setdefault(language_id, value)
+    return result
+
+
+def invalidate(project_ids):
+    project_ids = set(project_ids)
+    cache.delete_many([cache_key(project_id) for project_id in project_ids])
+    invalidated.send(sender=Table, project_ids=project_ids)
+
+
+def invalidate_all():
+    cache.set(GENERATION_CACHE_KEY, max(int(time.time() * 1000), generation() + 1), None)
+    invalidated.send(sender=Table, project_ids=None)
+
+
+def invalidate_on_commit(project_ids):
+    """
+    Invalidates the tables of project_ids, or every table if None, once the
+    current transaction commits, or at once outside of one.
+    """
+    if project_ids is None:
+        transaction.on_commit(invalidate_all)
+    else:
+        project_ids = set(project_ids)
+        transaction.on_commit(lambda: invalidate(project_ids))
+
+
+def projects_of_strings(string_ids):
+    """
+    Returns the ids of the projects whose tables have the strings.
+    """
+    project_ids = set()
+    for model, fields in FIELDS:
+        for name in fields:
+            field = model._meta.get_field(name)
+            owner = field.m2m_field_name()
+            project = owner if model is Project else '%s__project' % owner
+            project_ids.update(field.remote_field.through.objects.filter(
+                **{'%s__in' % field.m2m_reverse_field_name(): string_ids}
+            ).values_list(project, flat=True))
+    return project_ids
+
+
+def project_of(obj):
+    return obj.pk if isinstance(obj, Project) else obj.project_id
+
+
+def on_strings_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_on_commit([project_of(instance)])
+    elif action == 'post_clear':
+        # The owners are gone from the through table: drop every table.
+        invalidate_on_commit(None)
+    else:
+        invalidate_on_commit(project_of(owner) for owner in model.objects.filter(pk__in=pk_set))
+
+
+def on_string_saved(sender, instance, **kwargs):
+    invalidate_on_commit(projects_of_strings([instance.pk]))
+
+
+def on_owner_saved(sender, instance, **kwargs):
+    invalidate_on_commit([project_of(instance)])
+
+
+def on_language_saved(sender, **kwargs):
+    invalidate_on_commit(None)
+
+
+for model, fields in FIELDS:
+    for name in fields:
+        m2m_changed.connect(on_strings_changed, model._meta.get_field(name).remote_field.through,
+                            dispatch_uid='localization-%s' % field_key(model, name))
+    if model is not Project:
+        post_save.connect(on_owner_saved, model, dispatch_uid='localization-save-%s' % model._meta.model_name)
+        post_delete.connect(on_owner_saved, model, dispatch_uid='localization-delete-%s' % model._meta.model_name)
+post_save.connect(on_string_saved, LocalizedString, dispatch_uid='localization-string-save')
+# Before the rows linking the string to its owners are deleted with it.
+pre_delete.connect(on_string_saved, LocalizedString, dispatch_uid='localization-string-delete')
+post_save.connect(on_language_saved, Language, dispatch_uid='localization-language-save')
+post_delete.connect(on_language_saved, Language, dispatch_uid='localization-language-delete')
@@ -0,0 +1,144 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Keyset pagination and streamed JSON for list endpoints. Lists are ordered by
+# indexed keys ending with the id, like ("server_time", "id"), and a page
+# starts after the keys of the last item of the page before it, so it costs
+# the same however deep into the list it is. Lists are returned whole, as
+# they always were, unless the page_size or cursor parameters are given;
+# with stream=true they are written out in batches of STREAM_BATCH_SIZE.
+from __future__ import unicode_literals
+import base64
+import datetime
+import json
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Items read and serialized at a time when streaming.
+STREAM_BATCH_SIZE = 500
+TRUE_VALUES = ('true', '1')
+
+
+def encode_cursor(values):
+    """
+    Returns the cursor of the page after the item with the given key values.
+    """
+    values = [value.isoformat() if isinstance(value, datetime.datetime) else value
+              for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, keys):
+    """
+    Returns the key values of a cursor made by encode_cursor().
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError):
+        raise ParseError("invalid cursor")
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ParseError("invalid cursor")
+    return values
+
+
+def after(queryset, keys, values):
+    """
+    Filters queryset to the items ordered after the given values of keys.
+    """
+    condition = Q()
+    for i, key in enumerate(keys):
+        q = Q(**{'%s__gt' % key: values[i]})
+        for previous, value in zip(keys[:i], values[:i]):
+            q &= Q(**{previous: value})
+        condition |= q
+    return queryset.filter(condition)
+
+
+def page(queryset, keys, page_size, cursor=None):
+    """
+    Returns the queryset of the page_size items of queryset after cursor,
+    ordered by keys, and the cursor of the next page, None if it is the last.
+    Only the keys of the page are read, so the queryset can be serialized
+    however its serializer likes.
+    """
+    remaining = after(queryset, keys, decode_cursor(cursor, keys)) if cursor else queryset
+    rows = list(remaining.order_by(*keys).values_list(*keys).distinct()[:page_size + 1])
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    ids = [row[-1] for row in rows[:page_size]]
+    return queryset.filter(pk__in=ids).order_by(*keys), next_cursor
+
+
+def page_size(params):
+    """
+    Returns the page size asked for by the request params, or None if the
+    whole list is asked for.
+    """
+    if 'page_size' not in params and 'cursor' not in params:
+        return None
+    try:
+        size = int(params.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ParseError("page_size must be a number")
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def wants_stream(params):
+    return params.get('stream', '').lower() in TRUE_VALUES
+
+
+def next_link(request, cursor):
+    """
+    Returns the Link header to the page after the one requested.
+    """
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return '<%s>; rel="next"' % request.build_absolute_uri('?' + params.urlencode())
+
+
+def render_json(item):
+    return JSONRenderer().render(item)
+
+
+def stream_json(queryset, keys, serialize, render=render_json, head=b'[',
+                tail=lambda count: b']'):
+    """
+    Yields the JSON array of every item of queryset, read and serialized
+    by serialize(queryset) in batches ordered by keys. head and tail(count)
+    are written around the array.
+    """
+    yield head
+    count = 0
+    cursor = None
+    while True:
+        batch, cursor = page(queryset, keys, STREAM_BATCH_SIZE, cursor)
+        for item in serialize(batch):
+            yield (b',' if count else b'') + render(item)
+            count += 1
+        if cursor is None:
+            break
+    yield tail(count)
+
+
+def list_response(request, queryset, keys, serialize):
+    """
+    Responds with the items of queryset as serialize(queryset) lists them:
+    all of them, a page of them if the request asks for one, with a Link
+    header to the next page, or all of them streamed if it asks for that.
+    """
+    params = request.query_params
+    if wants_stream(params):
+        return StreamingHttpResponse(stream_json(queryset, keys, serialize),
+                                     content_type='application/json')
+    size = page_size(params)
+    if size is None:
+        return Response(serialize(queryset))
+    items, cursor = page(queryset, keys, size, params.get('cursor'))
+    response = Response(serialize(items))
+    if cursor:
+        response['Link'] = next_link(request, cursor)
+    return response
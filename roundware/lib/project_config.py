@@ -0,0 +1,232 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Compiled tag and UI configuration of projects: the tags, UI groups and
+# relationships every client reads when it starts, as api/1
+# get_tags_for_project and api/2 projects/:id/tags and uigroups serve them.
+# Each document is made once per project and language and cached under the
+# generation of the project's configuration, which changes when the Project
+# or a Tag, TagCategory, TagRelationship, UIGroup, UIItem, Speaker, Audiotrack,
+# language or localized string of the project does; see the signal handlers at
+# the end. Changes move the generation once their transaction commits, so no
+# document made from the rows before they commit is cached under the new one.
+#
+# The generation also versions the responses of the configuration endpoints
+# for conditional GETs: conditional() answers 304 Not Modified to a client
+# that has the current version from the cached generation alone.
+from __future__ import unicode_literals
+import functools
+import hashlib
+import json
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from roundware.lib import localization
+from roundware.lib.cache_backends import state
+from roundware.rw.models import (Audiotrack, Project, Session, Speaker, Tag, TagCategory,
+                                 TagRelationship, UIGroup, UIItem)
+
+# Document by kind, generation, project id and language id.
+CACHE_KEY = 'project_config_%s%s-%s-%s'
+# Generation of the configuration of a project, or of every project with ''.
+GENERATION_CACHE_KEY = 'project_config_generation%s'
+# Documents are made anew at least this often, in case a change was made
+# without signals, like by QuerySet.update().
+CACHE_TIMEOUT = 24 * 3600
+
+# Project of a session, which doesn't change, kept in the state cache while
+# the session is active.
+SESSION_PROJECT_CACHE_KEY = 'session_project%s'
+SESSION_PROJECT_CACHE_TIMEOUT = 10 * 60
+
+API1_TAGS = 'api1_tags'
+API2_TAGS = 'api2_tags'
+API2_UIGROUPS = 'api2_uigroups'
+
+
+def generation(project_id):
+    """
+    Returns the generation of the configuration of project_id, a string that
+    changes whenever the configuration does.
+    """
+    keys = [GENERATION_CACHE_KEY % '', GENERATION_CACHE_KEY % project_id]
+    generations = cache.get_many(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        # Not from 0: documents cached under generations since evicted
+        # must not be used again.
+        now = new_generation(0)
+        cache.set_many(dict((key, now) for key in missing), None)
+        generations.update((key, now) for key in missing)
+    return '%s.%s' % tuple(generations[key] for key in keys)
+
+
+def new_generation(current):
+    # Milliseconds, so generations also tell when they were made.
+    return max(int(time.time() * 1000), current + 1)
+
+
+def bump(project_id=''):
+    """
+    Moves the configuration of project_id, or of every project if '', to a
+    new generation.
+    """
+    key = GENERATION_CACHE_KEY % project_id
+    cache.set(key, new_generation(cache.get(key, 0)), None)
+
+
+def bump_on_commit(project_ids):
+    """
+    Bumps the configuration of each of project_ids, '' for every project,
+    once the current transaction commits, or at once outside of one.
+    """
+    project_ids = set(project_ids)
+
+    def bump_all():
+        for project_id in project_ids:
+            bump(project_id)
+    transaction.on_commit(bump_all)
+
+
+def document(kind, project_id, language_id, make):
+    """
+    Returns the document of kind for the project and language from the
+    cache, or made by make() and cached.
+    """
+    key = CACHE_KEY % (kind, generation(project_id), project_id, language_id)
+    result = cache.get(key)
+    if result is None:
+        result = make()
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
+
+
+def session_project_id(session_id):
+    """
+    Returns the id of the project of session_id, or None if there is no
+    such session.
+    """
+    key = SESSION_PROJECT_CACHE_KEY % session_id
+    project_id = state.get(key)
+    if project_id is None:
+        project_id = Session.objects.filter(pk=session_id) \
+            .values_list('project_id', flat=True).first()
+        if project_id is not None:
+            state.set(key, project_id, SESSION_PROJECT_CACHE_TIMEOUT)
+    return project_id
+
+
+def validators(project_id, request, extra=None):
+    """
+    Returns the ETag and Last-Modified of the response to the GET request of
+    the configuration of project_id, from its path, query and the generation
+    of the configuration, and extra, anything else the response depends on.
+    """
+    current = generation(project_id)
+    query = sorted((key, request.GET.getlist(key)) for key in request.GET)
+    version = json.dumps([request.path, query, current, extra]).encode('utf-8')
+    last_modified = max(int(part) for part in current.split('.')) // 1000
+    return quote_etag(hashlib.md5(version).hexdigest()), last_modified
+
+
+def not_modified(request, etag, last_modified):
+    """
+    Whether the copy the client has, going by its If-None-Match or, without
+    one, If-Modified-Since header, is current.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return etag in etags or '*' in etags
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional_response(request, project_id, respond):
+    """
+    Answers a GET request of the configuration of project_id with 304 Not
+    Modified if the client has the current version, else with respond(),
+    versioned if it succeeds.
+    """
+    if request.method != 'GET' or project_id is None:
+        return respond()
+    etag, last_modified = validators(project_id, request)
+    if not_modified(request, etag, last_modified):
+        return set_validators(HttpResponseNotModified(), etag, last_modified)
+    response = respond()
+    if response.status_code == 200:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def conditional(view):
+    """
+    Decorates a view method of a project's configuration, taking the
+    project id as pk, to answer conditional GETs.
+    """
+    @functools.wraps(view)
+    def wrapper(self, request, pk=None, **kwargs):
+        return conditional_response(request, pk, lambda: view(self, request, pk, **kwargs))
+    return wrapper
+
+
+def on_changed(sender, instance, **kwargs):
+    if isinstance(instance, UIItem):
+        project_ids = UIGroup.objects.filter(pk=instance.ui_group_id) \
+            .values_list('project_id', flat=True)
+    elif isinstance(instance, TagRelationship):
+        project_ids = Tag.objects.filter(pk=instance.tag_id).values_list('project_id', flat=True)
+    elif isinstance(instance, Project):
+        project_ids = [instance.pk]
+    else:
+        project_ids = [instance.project_id]
+    bump_on_commit(project_ids)
+
+
+def on_category_changed(sender, **kwargs):
+    bump_on_commit([''])
+
+
+def on_relationships_changed(sender, instance, action, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    project_ids = set(Tag.objects.filter(pk__in=pk_set or []).values_list('project_id', flat=True))
+    project_ids.add(instance.project_id)
+    bump_on_commit(project_ids)
+
+
+def on_languages_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_on_commit([instance.pk])
+    elif action == 'post_clear':
+        # The projects are gone from the through table.
+        bump_on_commit([''])
+    else:
+        bump_on_commit(pk_set or [])
+
+
+def on_localization_invalidated(sender, project_ids, **kwargs):
+    bump_on_commit([''] if project_ids is None else project_ids)
+
+
+for model in (Audiotrack, Project, Speaker, Tag, TagRelationship, UIGroup, UIItem):
+    post_save.connect(on_changed, model, dispatch_uid='project_config-save-%s' % model._meta.model_name)
+    post_delete.connect(on_changed, model, dispatch_uid='project_config-delete-%s' % model._meta.model_name)
+post_save.connect(on_category_changed, TagCategory, dispatch_uid='project_config-save-tagcategory')
+post_delete.connect(on_category_changed, TagCategory, dispatch_uid='project_config-delete-tagcategory')
+m2m_changed.connect(on_relationships_changed, Tag.relationships_old.through,
+                    dispatch_uid='project_config-relationships_old')
+m2m_changed.connect(on_languages_changed, Project.languages.through,
+                    dispatch_uid='project_config-languages')
+localization.invalidated.connect(on_localization_invalidated, dispatch_uid='project_config')
@@ -0,0 +1,85 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Uniform random samples of the rows of a queryset, at a cost that scales
+# with the sample rather than with the queryset, for api/2 assets/random.
+# Ids are drawn at random between the least and greatest id of the table and
+# kept if the queryset has them (rejection sampling, which is uniform however
+# the ids are spread). The share of the ids drawn that were kept estimates how
+# dense the queryset is, and so how many to draw next. Querysets too sparse
+# for that to pay off are few rows, estimated from the same share, and the
+# rest of their ids are read and sampled in memory.
+from __future__ import unicode_literals, division
+import random
+from django.db.models import Max, Min
+from django.utils.six.moves import range
+
+# Fewest random ids looked up in the first round.
+PROBE_MIN = 100
+# Rounds of random ids drawn before reading the rest of the ids.
+PROBE_ROUNDS = 3
+# Most random ids looked up in one query; querysets that would need more are
+# sparse enough to read.
+PROBE_MAX = 5000
+
+
+def sample_in_memory(ids, limit, rng=random):
+    """
+    Returns limit of the ids of a queryset at random, reading them all.
+    """
+    ids = list(ids)
+    return rng.sample(ids, min(limit, len(ids)))
+
+
+def sample_ids(qs, limit, rng=random):
+    """
+    Returns the ids of limit distinct rows of qs at random, or of all of them
+    if there are fewer, in random order.
+
+    The id bounds of the table are two index lookups, and each round looks
+    up at most PROBE_MAX random ids. The ids of qs are only read when the
+    rounds so far estimate that it has a share of the table's id range
+    under 1.5 * limit / PROBE_MAX, or when the rounds run out.
+    """
+    if limit < 1:
+        return []
+    ids = qs.order_by().values_list('id', flat=True).distinct()
+    # Not those of qs, which would scan all of its rows.
+    bounds = qs.model.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    span = bounds['high'] - bounds['low'] + 1
+
+    found = []
+    probed = set()
+    hit_count = 0
+    size = min(max(2 * limit, PROBE_MIN), span)
+    for _ in range(PROBE_ROUNDS):
+        candidates = set()
+        while len(candidates) < size:
+            candidate = rng.randint(bounds['low'], bounds['high'])
+            if candidate not in probed:
+                candidates.add(candidate)
+        probed.update(candidates)
+        hits = list(ids.filter(id__in=candidates))
+        hit_count += len(hits)
+        rng.shuffle(hits)
+        needed = limit - len(found)
+        found.extend(hits[:needed])
+        needed -= len(hits[:needed])
+        untried = span - len(probed)
+        if not needed or not untried:
+            break
+        # Enough ids that the expected number of hits covers what is needed,
+        # assuming one hit if there were none yet.
+        density = max(hit_count, 1) / len(probed)
+        size = min(int(needed / density * 1.5) + 1, untried)
+        if size > PROBE_MAX:
+            break
+
+    if len(found) < limit and len(probed) < span:
+        # qs is sparse, so has few rows: the density estimates how many.
+        rest = set(ids) - set(found)
+        found.extend(sample_in_memory(rest, limit - len(found), rng))
+    rng.shuffle(found)
+    return found
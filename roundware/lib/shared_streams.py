@@ -0,0 +1,126 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Streams shared by the global listen sessions of projects with
+# shared_stream_enabled. Without geo listen, rwstreamd mixes from the project,
+# the session language, the audio settings, the requested tags and the
+# project's ordering only, so sessions whose requests agree on those, their
+# fingerprint, listen to one stream: that of the first of them, its owner.
+# The SharedStream of a fingerprint is claimed under a row lock, so concurrent
+# requests agree on the owner, and counts the sessions listening to it. They
+# leave when they request another stream or stop heartbeating (see
+# roundware.lib.liveness), and the stream stops once none are left.
+from __future__ import unicode_literals
+from collections import Counter
+import hashlib
+import re
+from django.db import transaction
+from django.db.models import F, Sum
+from roundware.lib.cache_backends import state as cache
+from roundware.lib.exception import RoundException
+from roundware.rw.models import Session, SharedStream
+
+# Owner of the shared stream a session listens to, or 0 if it has its own.
+SESSION_CACHE_KEY = 'shared_stream_session%s'
+SESSION_CACHE_TIMEOUT = 24 * 3600
+
+
+def tag_ids(value):
+    """
+    Returns the sorted ids of the tags parameter value, a list or ids
+    separated by commas or tabs.
+    """
+    parts = value if isinstance(value, (list, tuple)) else re.split(r'[,\t]', value)
+    try:
+        return sorted(set(int(part) for part in parts if ('%s' % part).strip()))
+    except ValueError:
+        raise RoundException("tags must be tag ids")
+
+
+def fingerprint(session, data, audio_format):
+    """
+    Returns the fingerprint of the shared stream the session can listen to,
+    or None if it needs a stream of its own.
+    """
+    project = session.project
+    if not project.shared_stream_enabled or session.geo_listen_enabled:
+        return None
+    parts = (session.project_id, session.language_id, audio_format,
+             data.get('audio_stream_bitrate', ''), project.ordering,
+             ','.join('%s' % tag for tag in tag_ids(data.get('tags') or '')))
+    return hashlib.sha1('|'.join('%s' % part for part in parts).encode('utf-8')).hexdigest()
+
+
+def join(fingerprint, session_id, running):
+    """
+    Makes session_id listen to the shared stream of fingerprint, becoming
+    its owner if there is none yet or running(owner_id) is False for the
+    current one. Returns the id of the owner.
+    """
+    with transaction.atomic():
+        shared, created = SharedStream.objects.get_or_create(
+            fingerprint=fingerprint, defaults={'owner_id': session_id})
+        shared = SharedStream.objects.select_for_update().get(pk=shared.pk)
+        if shared.owner_id != session_id and not running(shared.owner_id):
+            # The stream ended; this session starts the next one.
+            members = list(shared.sessions.values_list('id', flat=True))
+            Session.objects.filter(pk__in=members).update(shared_stream=None)
+            cache.delete_many([SESSION_CACHE_KEY % member for member in members])
+            shared.owner_id = session_id
+            shared.listeners = 0
+        previous = Session.objects.select_for_update().filter(pk=session_id) \
+            .values_list('shared_stream', flat=True).first()
+        if previous != shared.pk:
+            if previous is not None:
+                SharedStream.objects.filter(pk=previous).update(listeners=F('listeners') - 1)
+            Session.objects.filter(pk=session_id).update(shared_stream=shared)
+            shared.listeners += 1
+        shared.save()
+    cache.set(SESSION_CACHE_KEY % session_id, shared.owner_id, SESSION_CACHE_TIMEOUT)
+    return shared.owner_id
+
+
+def leave(session_ids):
+    """
+    Makes the sessions of session_ids leave their shared streams, if any.
+    """
+    session_ids = list(session_ids)
+    if not session_ids:
+        return
+    with transaction.atomic():
+        streams = Session.objects.filter(pk__in=session_ids, shared_stream__isnull=False) \
+            .values_list('shared_stream', flat=True)
+        # Locked in the order join() locks them: streams, then sessions.
+        list(SharedStream.objects.select_for_update().filter(pk__in=list(streams)).order_by('pk'))
+        members = list(Session.objects.select_for_update()
+                       .filter(pk__in=session_ids, shared_stream__isnull=False)
+                       .values_list('id', 'shared_stream'))
+        for stream_id, count in Counter(stream_id for _, stream_id in members).items():
+            SharedStream.objects.filter(pk=stream_id).update(listeners=F('listeners') - count)
+        Session.objects.filter(pk__in=[session_id for session_id, _ in members]) \
+            .update(shared_stream=None)
+    cache.delete_many([SESSION_CACHE_KEY % session_id for session_id in session_ids])
+
+
+def owner(session_id):
+    """
+    Returns the id of the owner of the shared stream session_id listens to,
+    or None if it listens to its own.
+    """
+    session_id = int(session_id)
+    key = SESSION_CACHE_KEY % session_id
+    owner_id = cache.get(key)
+    if owner_id is None:
+        owner_id = Session.objects.filter(pk=session_id) \
+            .values_list('shared_stream__owner', flat=True).first() or 0
+        cache.set(key, owner_id, SESSION_CACHE_TIMEOUT)
+    return owner_id or None
+
+
+def listeners(owner_id):
+    """
+    Returns how many sessions listen to the shared stream of owner_id, or
+    None if its stream isn't shared.
+    """
+    return SharedStream.objects.filter(owner=owner_id) \
+        .aggregate(listeners=Sum('listeners'))['listeners']
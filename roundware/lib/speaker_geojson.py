@@ -0,0 +1,72 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# The speakers of projects, serialized for clients with their shapes as
+# GeoJSON at several levels of detail. Hand-drawn shapes can be megabytes of
+# GeoJSON, so the speakers are serialized at every level by the first
+# get_config after they change and cached under the generation of the
+# project's configuration; the others only join the cached JSON of the level
+# the client asks for. Saving a speaker starts a new generation, so saves
+# don't serialize anything themselves.
+from __future__ import unicode_literals
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+from roundware.api1.serializers import SpeakerSerializer
+from roundware.lib import project_config
+from roundware.rw.models import Speaker
+
+# Simplification tolerances in degrees, by level of detail: about 1, 10 and
+# 100 meters.
+LEVELS = {
+    'full': None,
+    'high': 0.00001,
+    'medium': 0.0001,
+    'low': 0.001,
+}
+DEFAULT_LEVEL = 'full'
+GEOMETRY_FIELDS = ('shape', 'boundary', 'attenuation_border')
+# JSON of the speakers of a project, by level, generation and project id.
+CACHE_KEY = 'speaker_geojson%s%s-%s'
+
+
+def render(speaker, tolerance):
+    """
+    Returns the JSON of speaker with its geometries simplified to tolerance,
+    or whole if it is None.
+    """
+    geometries = dict((field, getattr(speaker, field)) for field in GEOMETRY_FIELDS)
+    try:
+        for field, geometry in geometries.items():
+            if tolerance and geometry is not None:
+                setattr(speaker, field, geometry.simplify(tolerance, preserve_topology=True))
+        return JSONRenderer().render(SpeakerSerializer(speaker).data).decode('utf-8')
+    finally:
+        for field, geometry in geometries.items():
+            setattr(speaker, field, geometry)
+
+
+def prepare(project_id):
+    """
+    Serializes the speakers of project_id at every level and caches them.
+    Returns them by level.
+    """
+    # Read first, so speakers changed meanwhile are cached under the old
+    # generation rather than stale ones under the new.
+    generation = project_config.generation(project_id)
+    speakers = list(Speaker.objects.filter(project=project_id))
+    rendered = {}
+    for level, tolerance in LEVELS.items():
+        rendered[level] = [render(speaker, tolerance) for speaker in speakers]
+    cache.set_many(dict((CACHE_KEY % (level, generation, project_id), value)
+                        for level, value in rendered.items()), project_config.CACHE_TIMEOUT)
+    return rendered
+
+
+def speakers(project_id, level=DEFAULT_LEVEL):
+    """
+    Returns the JSON of each speaker of project_id at level, a key of LEVELS.
+    """
+    result = cache.get(CACHE_KEY % (level, project_config.generation(project_id), project_id))
+    if result is None:
+        result = prepare(project_id)[level]
+    return result
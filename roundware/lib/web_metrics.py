@@ -0,0 +1,214 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Request metrics of the web tier, by endpoint: an api/1 operation or the
+# method and URL name of any other view. RequestMetricsMiddleware measures
+# every request; each web process writes its metrics to settings.WEB_METRICS_DIR
+# every WEB_METRICS_INTERVAL and the /metrics view serves all of them, in the
+# Prometheus text format of roundwared.metrics.
+from __future__ import unicode_literals
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils.crypto import constant_time_compare
+from roundware.api1 import views as api1_views
+from roundware.lib import db_metrics
+from roundwared import metrics
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Endpoints kept apart; more, like the admin's pages, are counted as "other".
+MAX_ENDPOINTS = 200
+# Seconds after which the metrics file of a process that stopped writing it is
+# deleted; idle processes don't rewrite theirs.
+MAX_AGE = 3600
+
+
+class WebMetrics(metrics.Registry):
+    """
+    The request metrics of one web process.
+    """
+
+    def __init__(self, process):
+        metrics.Registry.__init__(self, (('process', process),))
+        self.process = process
+        self.request_seconds = self.labelled_histogram(
+            'roundware_web_request_seconds', 'Time to respond to requests.',
+            'endpoint', max_values=MAX_ENDPOINTS)
+        self.errors = self.labelled_counter(
+            'roundware_web_request_errors_total', 'Responses with a 5xx status.',
+            'endpoint', MAX_ENDPOINTS)
+        self.db_queries = self.labelled_counter(
+            'roundware_web_db_queries_total', 'Database queries.',
+            'endpoint', MAX_ENDPOINTS)
+        self.db_query_seconds = self.labelled_counter(
+            'roundware_web_db_query_seconds_total', 'Time spent in database queries.',
+            'endpoint', MAX_ENDPOINTS)
+        self.cache_hits = self.labelled_counter(
+            'roundware_web_cache_hits_total', 'Cache gets that found the key.',
+            'endpoint', MAX_ENDPOINTS)
+        self.cache_misses = self.labelled_counter(
+            'roundware_web_cache_misses_total', 'Cache gets that did not find the key.',
+            'endpoint', MAX_ENDPOINTS)
+        self.dbus_seconds = self.labelled_counter(
+            'roundware_web_dbus_seconds_total', 'Time spent sending stream control signals.',
+            'endpoint', MAX_ENDPOINTS)
+        self.icecast_seconds = self.labelled_counter(
+            'roundware_web_icecast_seconds_total', 'Time spent in Icecast admin requests.',
+            'endpoint', MAX_ENDPOINTS)
+        self.lock = threading.Lock()
+        self.written = 0
+
+    def record(self, endpoint, seconds, status, tally):
+        """
+        Records a request. tally is the roundwared.metrics tally of its
+        thread, with its database queries counted by db_metrics.
+        """
+        with self.lock:
+            self.request_seconds.observe(endpoint, seconds)
+            if status >= 500:
+                self.errors.inc(endpoint)
+            self.db_queries.inc(endpoint, int(tally.get('db_queries', 0)))
+            self.db_query_seconds.inc(endpoint, tally.get('db_query_seconds', 0))
+            self.cache_hits.inc(endpoint, int(tally.get('cache_hits', 0)))
+            self.cache_misses.inc(endpoint, int(tally.get('cache_misses', 0)))
+            self.dbus_seconds.inc(endpoint, tally.get('dbus_seconds', 0))
+            self.icecast_seconds.inc(endpoint, tally.get('icecast_seconds', 0))
+
+    def write(self, directory, force=False):
+        """
+        Writes the metrics to directory if WEB_METRICS_INTERVAL passed since
+        they were last written, or if force.
+        """
+        now = time.time()
+        if not force and now - self.written < settings.WEB_METRICS_INTERVAL:
+            return
+        self.written = now
+        with self.lock:
+            metrics.write(self, metrics.path(directory, 'web-%s' % os.getpid()))
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def registry():
+    """
+    Returns the WebMetrics of this process.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None or _registry.process != os.getpid():
+            # Made anew in processes forked after it was made.
+            _registry = WebMetrics(os.getpid())
+        return _registry
+
+
+def endpoint(request, view_func):
+    """
+    Names what a request asks for: "api1 <operation>" for api/1
+    operations, else the method and name of the URL, like "GET asset-list".
+    """
+    if view_func is api1_views.operations:
+        # The view reads the operation from POST unless it is in GET, too.
+        operation = (request.GET.get('operation') or
+                     request.POST.get('operation') or '').lower()
+        return 'api1 %s' % (operation if operation in api1_views.OPERATIONS else 'invalid')
+    match = request.resolver_match
+    name = match.view_name if match and match.url_name else \
+        '%s.%s' % (view_func.__module__, view_func.__name__)
+    return '%s %s' % (request.method, name)
+
+
+def authorized(request):
+    """
+    Staff may see the metrics, and so may requests with the
+    WEB_METRICS_TOKEN as a bearer token, like Prometheus' scrapes.
+    """
+    if request.user.is_authenticated() and request.user.is_staff:
+        return True
+    token = settings.WEB_METRICS_TOKEN
+    return bool(token) and constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer %s' % token)
+
+
+def render():
+    """
+    Returns the metrics of every web process in the Prometheus text format.
+    """
+    directory = settings.WEB_METRICS_DIR
+    registry().write(directory, force=True)
+    return metrics.merge(metrics.read_dir(directory, MAX_AGE))
+
+
+class RequestMetricsMiddleware(object):
+    """
+    Measures the time, database queries, cache hits and misses, and dbus
+    and Icecast time of every request to a view, by endpoint. Not used if
+    WEB_METRICS_DIR is None.
+    """
+
+    def __init__(self):
+        if not settings.WEB_METRICS_DIR:
+            raise MiddlewareNotUsed()
+
+    def process_request(self, request):
+        request.metrics_started = time.time()
+        db_metrics.measure(connection)
+        metrics.begin_tally()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_endpoint = endpoint(request, view_func)
+
+    def process_response(self, request, response):
+        name = getattr(request, 'metrics_endpoint', None)
+        if name is None:
+            # Answered before a view was chosen, e.g. a 404.
+            metrics.end_tally()
+        elif response.streaming:
+            # The content, and the queries that make it, come after this
+            # returns; the request is recorded once the server closes it.
+            response.streaming_content = RecordedContent(
+                response.streaming_content,
+                lambda: self.record(request, name, response.status_code))
+        else:
+            self.record(request, name, response.status_code)
+        return response
+
+    def record(self, request, name, status):
+        web_metrics = registry()
+        web_metrics.record(name, time.time() - request.metrics_started, status,
+                           metrics.end_tally())
+        try:
+            web_metrics.write(settings.WEB_METRICS_DIR)
+        except (IOError, OSError) as e:
+            logger.warning("Could not write the request metrics: %s", e)
+
+
+class RecordedContent(object):
+    """
+    Iterates the content of a streaming response and calls record once the
+    response is closed, which closes the objects it iterates.
+    """
+
+    def __init__(self, content, record):
+        self.content = iter(content)
+        self.record = record
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.content)
+
+    next = __next__
+
+    def close(self):
+        if self.record is not None:
+            record, self.record = self.record, None
+            record()
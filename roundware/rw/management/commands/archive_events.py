@@ -0,0 +1,33 @@
+from . import RoundwareCommand
+from django.conf import settings
+from django.core.management.base import CommandError
+from roundware.lib import event_archive
+import datetime
+
+class Command(RoundwareCommand):
+    args = ''
+    help = ('Counts events older than the retention window by session, day and type, '
+            'writes them to gzipped JSON lines files and deletes them')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.EVENT_RETENTION_DAYS,
+                            help='Days of events to keep')
+        parser.add_argument('--directory', default=settings.EVENT_ARCHIVE_DIR,
+                            help='Directory to write the archive files to')
+        parser.add_argument('--dry-run', action='store_true', default=False,
+                            help='List the days that would be archived')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError("--days must be at least 0")
+        cutoff = datetime.datetime.combine(
+            datetime.date.today() - datetime.timedelta(days=options['days']), datetime.time())
+        if options['dry_run']:
+            for day in event_archive.days_before(cutoff):
+                self.stdout.write("%s: %s events" % (day, event_archive.day_events(day).count()))
+            return
+        archived = event_archive.archive(cutoff, options['directory'])
+        for day, count in archived:
+            self.stdout.write("%s: archived %s events" % (day, count))
+        self.stdout.write("Archived %s events of %s days to %s" % (
+            sum(count for day, count in archived), len(archived), options['directory']))
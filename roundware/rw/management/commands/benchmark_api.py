@@ -0,0 +1,48 @@
+from . import RoundwareCommand
+# Benchmarks don't need GStreamer; stub it where it is not installed.
+from roundwared import gst_stubs
+gst_stubs.install()
+from django.core.management.base import CommandError
+from roundware.lib import api_benchmark
+import json
+
+class Command(RoundwareCommand):
+    args = ''
+    help = ('Times every api/1 operation and api/2 endpoint and counts their queries '
+            'at several catalog sizes. Fails if an endpoint fails or goes over its '
+            'query budget')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000',
+                            help='Comma separated numbers of assets to benchmark with')
+        parser.add_argument('--repeat', type=int, default=10,
+                            help='Timed requests per endpoint')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None,
+                            help='JSON file to write the results to')
+        parser.add_argument('--sampling', action='store_true',
+                            help='Compare random asset sampling strategies instead')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        if min(sizes) < 1:
+            raise CommandError("Sizes must be at least 1")
+        if options['sampling']:
+            report = api_benchmark.run_sampling(sizes, repeat=options['repeat'],
+                                                seed=options['seed'])
+            self.write_report(report, options['output'])
+            self.stdout.write(api_benchmark.format_sampling(report))
+            return
+        report = api_benchmark.run(sizes, repeat=options['repeat'], seed=options['seed'])
+        self.write_report(report, options['output'])
+        self.stdout.write(api_benchmark.format_results(report))
+        failures = api_benchmark.check_budgets(report)
+        if failures:
+            raise CommandError("%s endpoints failed or went over their query budget:\n%s"
+                               % (len(failures), '\n'.join(failures)))
+
+    def write_report(self, report, output):
+        if output:
+            with open(output, 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write("Wrote %s" % output)
@@ -0,0 +1,29 @@
+from . import RoundwareCommand
+# Benchmarks don't need GStreamer; stub it where it is not installed.
+from roundwared import gst_stubs
+gst_stubs.install()
+from roundwared import benchmark
+import json
+
+class Command(RoundwareCommand):
+    args = ''
+    help = ('Times the roundwared stream code paths at several catalog sizes and '
+            'writes the results as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000,10000',
+                            help='Comma separated numbers of assets to benchmark with')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Timed calls per benchmark')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None,
+                            help='JSON file to write the results to')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        report = benchmark.run(sizes, repeat=options['repeat'], seed=options['seed'])
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write("Wrote %s" % options['output'])
+        self.stdout.write(benchmark.format_results(report))
@@ -0,0 +1,45 @@
+from . import RoundwareCommand
+from django.conf import settings
+from roundware.lib import audioinfo
+from roundware.rw.models import Asset
+import os
+
+class Command(RoundwareCommand):
+    args = ''
+    help = 'Checks Asset audio lengths against the audio files in the media directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', default=False,
+                            help='Update Asset.audiolength from the file when they differ')
+        # Allow small rounding differences from older mediainfo values (ms).
+        parser.add_argument('--tolerance', type=int, default=1000,
+                            help='Allowed difference in milliseconds')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Checking all Roundware audio Asset lengths")
+        tolerance = options['tolerance'] * 1000000
+
+        checked = 0
+        unreadable = 0
+        mismatched = 0
+        for asset in Asset.objects.filter(mediatype='audio').only('id', 'filename', 'audiolength'):
+            if not asset.filename:
+                continue
+            filepath = os.path.join(settings.MEDIA_ROOT, asset.filename)
+            info = audioinfo.probe(filepath)
+            checked += 1
+            if info is None:
+                unreadable += 1
+                self.stderr.write("Unreadable file: %s" % filepath)
+                continue
+
+            if asset.audiolength is None or abs(asset.audiolength - info.duration) > tolerance:
+                mismatched += 1
+                self.stderr.write("Asset %s length %s, file length %s: %s" %
+                                  (asset.id, asset.audiolength, info.duration, filepath))
+                if options['fix']:
+                    Asset.objects.filter(id=asset.id).update(audiolength=info.duration)
+
+        self.stdout.write("Assets checked:    %s" % checked)
+        self.stdout.write("Files unreadable:  %s" % unreadable)
+        self.stdout.write("Lengths different: %s" % mismatched)
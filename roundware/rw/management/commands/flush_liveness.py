@@ -0,0 +1,11 @@
+from . import RoundwareCommand
+from roundware.lib import liveness
+
+class Command(RoundwareCommand):
+    args = ''
+    help = ('Writes when sessions were last heartbeated to their liveness intervals and '
+            'closes those of sessions that stopped. Run it more often than HEARTBEAT_TIMEOUT')
+
+    def handle(self, *args, **options):
+        closed = liveness.flush()
+        self.stdout.write("Closed %s liveness intervals" % closed)
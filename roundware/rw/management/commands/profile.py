@@ -0,0 +1,46 @@
+from . import RoundwareCommand
+from django.conf import settings
+from django.core.management.base import CommandError
+from roundware.lib import dbus_send
+from roundware.lib.api import stream_session_id
+from roundwared import profiler
+import json
+
+class Command(RoundwareCommand):
+    args = ''
+    help = ('Profiles the stream of a session, or the web workers, for a while. The '
+            'profiled processes write the output to PROFILE_DIR')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=profiler.KINDS + (profiler.STOP,),
+                            help='Profiler to run, or stop to end a profile early')
+        parser.add_argument('--session', type=int, default=None,
+                            help='Session whose stream to profile; the web workers if not given')
+        parser.add_argument('--duration', type=int, default=profiler.DEFAULT_DURATION,
+                            help='Seconds to profile for, at most %s' % profiler.MAX_DURATION)
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        duration = options['duration']
+        if kind != profiler.STOP and not 0 < duration <= profiler.MAX_DURATION:
+            raise CommandError("Profiles last from 1 to %s seconds" % profiler.MAX_DURATION)
+
+        if options['session'] is None:
+            if kind == profiler.CPROFILE:
+                raise CommandError("cprofile profiles a single thread; profile the web "
+                                   "workers with sample or tracemalloc")
+            profiler.request(profiler.request_path(settings.PROFILE_DIR, profiler.WEB),
+                             kind, duration)
+            target = "the web workers"
+        else:
+            session_id = stream_session_id(options['session'])
+            dbus_send.emit_stream_signal(session_id, "profile",
+                                         json.dumps({'kind': kind, 'duration': duration}))
+            target = "the stream of session %s" % session_id
+
+        if kind == profiler.STOP:
+            self.stdout.write("Asked %s to stop profiling" % target)
+        else:
+            self.stdout.write("Asked %s to profile with %s for %s seconds; the output "
+                              "will be written to %s" % (target, kind, duration,
+                                                         settings.PROFILE_DIR))
@@ -0,0 +1,49 @@
+from . import RoundwareCommand
+from django.conf import settings
+from roundware.rw.models import Audiotrack, Session
+from roundwared.offline_mixer import OfflineMixer
+from roundwared.recording_collection import RecordingCollection
+from roundwared.schedule import SECOND
+import random
+import time
+
+class Command(RoundwareCommand):
+    args = ''
+    help = 'Renders the audiotrack mix of a session\'s stream to a WAV file without gst'
+
+    def add_arguments(self, parser):
+        parser.add_argument('session_id', type=int)
+        parser.add_argument('output', help='WAV file to write')
+        parser.add_argument('--seconds', type=int, default=60,
+                            help='Length of the rendered stream')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Seed for reproducible renders')
+        parser.add_argument('--latitude', type=float, default=None)
+        parser.add_argument('--longitude', type=float, default=None)
+
+    def handle(self, *args, **options):
+        session = Session.objects.select_related('project').get(id=options['session_id'])
+        project = session.project
+        if options['seed'] is not None:
+            # RecordingCollection orders assets with the random module.
+            random.seed(options['seed'])
+
+        request = {'session_id': session.id,
+                   'project_id': project.id,
+                   'latitude': options['latitude'] or False,
+                   'longitude': options['longitude'] or False}
+        radius = project.recording_radius
+        if radius is None:
+            radius = settings.RECORDING_RADIUS
+        rc = RecordingCollection(None, request, radius, str(project.ordering))
+        if session.geo_listen_enabled and request['latitude'] and request['longitude']:
+            rc.move_listener(request)
+        rc.start()
+
+        mixer = OfflineMixer(rc, Audiotrack.objects.filter(project=project),
+                             seed=options['seed'])
+        started = time.time()
+        mixer.render_to_file(options['output'], options['seconds'] * SECOND)
+        self.stdout.write("Rendered %s seconds of session %s to %s in %.2f seconds" %
+                          (options['seconds'], session.id, options['output'],
+                           time.time() - started))
@@ -0,0 +1,42 @@
+from . import RoundwareCommand
+# Simulated streams don't need GStreamer; stub it where it is not installed.
+from roundwared import gst_stubs
+gst_stubs.install()
+from roundwared.simulator import Simulator, format_report
+import json
+
+class Command(RoundwareCommand):
+    args = ''
+    help = ('Simulates listening sessions of a project in virtual time and reports '
+            'the database load they generate')
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id', type=int)
+        parser.add_argument('--sessions', type=int, default=100,
+                            help='Number of simultaneous listeners')
+        parser.add_argument('--minutes', type=float, default=10,
+                            help='Simulated length of the sessions')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed for reproducible simulations')
+        parser.add_argument('--move-interval', type=int, default=10,
+                            help='Seconds between listener moves')
+        parser.add_argument('--walk-radius', type=int, default=300,
+                            help='Meters around the project location listeners walk in')
+        parser.add_argument('--check-files', action='store_true', default=False,
+                            help='Check that played asset files exist, like a live stream')
+        parser.add_argument('--json', action='store_true', default=False,
+                            help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        simulator = Simulator(options['project_id'],
+                              sessions=options['sessions'],
+                              seconds=int(options['minutes'] * 60),
+                              seed=options['seed'],
+                              move_interval=options['move_interval'],
+                              walk_radius=options['walk_radius'],
+                              check_files=options['check_files'])
+        report = simulator.run()
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+        else:
+            self.stdout.write(format_report(report))
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0021_session_geo_listen_enabled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='shared_stream_enabled',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0022_project_shared_stream_enabled'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('server_time', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='listeninghistoryitem',
+            index_together=set([('starttime', 'id')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import django.contrib.gis.db.models.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0023_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='location',
+            field=django.contrib.gis.db.models.fields.PointField(srid=4326, null=True, editable=False,
+                                                                 blank=True, geography=True),
+        ),
+        migrations.RunSQL(
+            "UPDATE rw_asset SET location = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography "
+            "WHERE latitude IS NOT NULL AND longitude IS NOT NULL;",
+            migrations.RunSQL.noop
+        ),
+    ]
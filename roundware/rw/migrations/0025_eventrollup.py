@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0024_asset_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('day', models.DateField(db_index=True)),
+                ('event_type', models.CharField(max_length=50)),
+                ('count', models.IntegerField()),
+                ('first_time', models.DateTimeField()),
+                ('last_time', models.DateTimeField()),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rw.Session')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='eventrollup',
+            unique_together=set([('session', 'day', 'event_type')]),
+        ),
+    ]
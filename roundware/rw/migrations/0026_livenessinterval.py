@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0025_eventrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LivenessInterval',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('closed', models.BooleanField(default=False, db_index=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rw.Session')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rw', '0026_livenessinterval'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SharedStream',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('fingerprint', models.CharField(unique=True, max_length=40)),
+                ('listeners', models.PositiveIntegerField(default=0)),
+                ('owner', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.CASCADE, to='rw.Session')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='shared_stream',
+            field=models.ForeignKey(related_name='sessions', on_delete=django.db.models.deletion.SET_NULL, blank=True, to='rw.SharedStream', null=True),
+        ),
+    ]
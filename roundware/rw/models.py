@@ -77,6 +77,7 @@ class Project(models.Model):
     recording_radius = models.IntegerField(null=True)
     listen_enabled = models.BooleanField(default=False)
     geo_listen_enabled = models.BooleanField(default=False)
+    shared_stream_enabled = models.BooleanField(default=False)
     speak_enabled = models.BooleanField(default=False)
     geo_speak_enabled = models.BooleanField(default=False)
     reset_tag_defaults_on_startup = models.BooleanField(default=False)
@@ -135,11 +136,27 @@ class Session(models.Model):
     demo_stream_enabled = models.BooleanField(default=False)
     geo_listen_enabled = models.BooleanField(default=True)
     timezone = models.CharField(max_length=5, default="0000")
+    # The shared stream the session listens to, if any.
+    shared_stream = models.ForeignKey('SharedStream', null=True, blank=True,
+                                      on_delete=models.SET_NULL, related_name='sessions')
 
     def __unicode__(self):
         return str(self.id)
 
 
+class SharedStream(models.Model):
+    """
+    The stream global listen sessions with the same request fingerprint
+    listen to; see roundware.lib.shared_streams.
+    """
+    # SHA-1 of the project, language, audio settings, tags and ordering.
+    fingerprint = models.CharField(max_length=40, unique=True)
+    # The session whose stream, and mount, is shared.
+    owner = models.ForeignKey(Session, related_name='+')
+    # Sessions listening to the stream; it stops when none are.
+    listeners = models.PositiveIntegerField(default=0)
+
+
 class TagCategory(models.Model):
     name = models.CharField(max_length=50)
     data = models.TextField(null=True, blank=True)
@@ -312,6 +329,10 @@ class Audiotrack(models.Model):
 
 
 class Event(models.Model):
+    class Meta:
+        # For keyset pagination, see roundware.lib.pagination.
+        index_together = [['server_time', 'id']]
+
     server_time = models.DateTimeField()
     client_time = models.CharField(max_length=50, null=True, blank=True)
     session = models.ForeignKey(Session)
@@ -323,6 +344,34 @@ class Event(models.Model):
     tags = models.TextField(null=True, blank=True)
 
 
+class EventRollup(models.Model):
+    """
+    The number of events of each type a session had in a day, kept when the
+    events are archived; see roundware.lib.event_archive.
+    """
+    class Meta:
+        unique_together = [['session', 'day', 'event_type']]
+
+    session = models.ForeignKey(Session)
+    day = models.DateField(db_index=True)
+    event_type = models.CharField(max_length=50)
+    count = models.IntegerField()
+    first_time = models.DateTimeField()
+    last_time = models.DateTimeField()
+
+
+class LivenessInterval(models.Model):
+    """
+    A stretch of time in which a session heartbeated, each heartbeat within
+    settings.HEARTBEAT_TIMEOUT of the one before; see roundware.lib.liveness.
+    """
+    session = models.ForeignKey(Session)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    # Set once the session stopped heartbeating and end is final.
+    closed = models.BooleanField(default=False, db_index=True)
+
+
 class Asset(models.Model):
     ASSET_MEDIA_TYPES = [('audio', 'audio'), ('video', 'video'),
                          ('photo', 'photo'), ('text', 'text')]
@@ -340,6 +389,9 @@ class Asset(models.Model):
         Session, null=True, blank=True)
     latitude = models.FloatField(null=True, blank=False)
     longitude = models.FloatField(null=True, blank=False)
+    # latitude and longitude as a spatially indexed point, for radius and
+    # bounding box queries; kept up to date by save()
+    location = models.PointField(geography=True, null=True, blank=True, editable=False)
     filename = models.CharField(max_length=256, null=True, blank=True)
     file = ValidatedFileField(storage=FileSystemStorage(
         location=settings.MEDIA_ROOT,
@@ -386,6 +438,19 @@ class Asset(models.Model):
         super(Asset, self).__init__(*args, **kwargs)
         self.ENVELOPE_ID = 0
 
+    def save(self, *args, **kwargs):
+        self.location = self.build_location()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and \
+                ('latitude' in update_fields or 'longitude' in update_fields):
+            kwargs['update_fields'] = list(update_fields) + ['location']
+        super(Asset, self).save(*args, **kwargs)
+
+    def build_location(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return Point(float(self.longitude), float(self.latitude), srid=4326)
+
     def clean_fields(self, exclude=None):
         super(Asset, self).clean_fields(exclude)
         if not self.file:
@@ -605,6 +670,10 @@ class Speaker(models.Model):
     location_map.allow_tags = True
 
 class ListeningHistoryItem(models.Model):
+    class Meta:
+        # For keyset pagination, see roundware.lib.pagination.
+        index_together = [['starttime', 'id']]
+
     session = models.ForeignKey(Session)
     asset = models.ForeignKey(Asset)
     starttime = models.DateTimeField()
@@ -11,7 +11,8 @@ from django.views.generic.base import TemplateView
 from django.utils.safestring import mark_safe
 from django.shortcuts import render_to_response
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseForbidden, Http404
+from django.conf import settings
 
 from guardian.mixins import PermissionRequiredMixin
 from braces.views import (LoginRequiredMixin, FormValidMessageMixin,
@@ -28,6 +29,7 @@ from roundware.rw.forms import (TagCreateForm, BatchTagFormset,
                                 UIGroupForSetupTagUIEditForm,
                                 UIGroupForSetupTagUISelectForm)
 from roundware.rw.widgets import SetupTagUISortedCheckboxSelectMultiple
+from roundware.lib import web_metrics
 logger = logging.getLogger(__name__)
 
 
@@ -288,3 +290,13 @@ def asset_map(request):
 def listen_map(request):
     return render_to_response("tools/listen-map.html")
 
+
+def metrics(request):
+    """
+    The request metrics of every web process, for Prometheus to scrape.
+    """
+    if not settings.WEB_METRICS_DIR:
+        raise Http404
+    if not web_metrics.authorized(request):
+        return HttpResponseForbidden()
+    return HttpResponse(web_metrics.render(), content_type=web_metrics.CONTENT_TYPE)
@@ -39,6 +39,42 @@ ICECAST_USERNAME = "admin"
 ICECAST_PASSWORD = "roundice"
 ICECAST_SOURCE_USERNAME = "source"
 ICECAST_SOURCE_PASSWORD = "roundice"
+# In seconds, how often Icecast status is requested per host.
+ICECAST_STATUS_INTERVAL = 2
+# Locked by the process refreshing the Icecast status; on the same host as the
+# state cache.
+ICECAST_STATUS_LOCK_FILE = '/var/tmp/roundware_icecast2_status.lock'
+# In seconds, how long request_stream waits for a new stream to become ready
+# and how often it checks.
+STREAM_READY_TIMEOUT = 15
+STREAM_READY_POLL_INTERVAL = 0.05
+# When True, request_stream starts no rwstreamd processes but marks streams
+# ready at once, and stream control signals are logged instead of sent over
+# dbus. For load testing the web tier on one machine, see
+# roundware/settings/loadtest.py and scripts/load-test.py.
+STREAM_STANDIN = False
+# Where every rwstreamd writes its metrics in the Prometheus text format, and
+# how often in milliseconds. None disables writing them. Serve the metrics of
+# a host with scripts/stream-metrics.py or node_exporter's textfile collector.
+STREAM_METRICS_DIR = '/var/tmp/roundware_metrics'
+STREAM_METRICS_INTERVAL = 10000
+# In milliseconds, how late the rwstreamd main loop may run before the code
+# blocking it is logged and counted in the stream metrics. None disables it.
+STREAM_STALL_THRESHOLD = 500
+# Where streams and web workers write the profiles asked for with
+# manage.py profile.
+PROFILE_DIR = '/var/tmp/roundware_profiles'
+# Where every web process writes its request metrics, and how often in
+# seconds. They are served at /metrics to staff and to requests with the
+# token as a bearer token. None disables them.
+WEB_METRICS_DIR = '/var/tmp/roundware_web_metrics'
+WEB_METRICS_INTERVAL = 10
+WEB_METRICS_TOKEN = None
+# Events older than this many days are counted by session, day and type into
+# EventRollup, written to gzipped JSON lines files in EVENT_ARCHIVE_DIR and
+# deleted by manage.py archive_events.
+EVENT_RETENTION_DAYS = 90
+EVENT_ARCHIVE_DIR = '/var/www/roundware/event_archive'
 # Discrete steps
 NUM_PAN_STEPS = 200
 # In milliseconds
@@ -46,6 +82,8 @@ STEREO_PAN_INTERVAL = 10
 # In milliseconds
 PING_INTERVAL = 10000
 MASTER_VOLUME = 3.0
+# In seconds, how long a stream or liveness interval lasts without
+# heartbeats. Run manage.py flush_liveness more often than this.
 HEARTBEAT_TIMEOUT = 200
 # Radius in meters - default system wide setting
 RECORDING_RADIUS = 1
@@ -199,6 +237,7 @@ TEMPLATES = [
 ]
 
 MIDDLEWARE_CLASSES = (
+    'roundware.lib.web_metrics.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -322,15 +361,35 @@ LOGGING = {
 FILE_UPLOAD_HANDLERS = (
     "django.core.files.uploadhandler.TemporaryFileUploadHandler",
 )
-
+# Uploads are hard linked out of the (0600) temporary upload directory, so
+# set the permissions explicitly.
+FILE_UPLOAD_PERMISSIONS = 0o644
+
+# MeasuredCache counts cache hits and misses for the request metrics and
+# passes everything on to the cache backend in its OPTIONS. The state cache
+# holds the live state of sessions and streams (roundware.lib.cache_backends.
+# state), about five entries per active session; size its MAX_ENTRIES for the
+# sessions of the busiest hour, as it culls entries when full.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'BACKEND': 'roundware.lib.cache_backends.MeasuredCache',
         'LOCATION': '/var/tmp/django_cache',
         'TIMEOUT': 60,
         'OPTIONS': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
             'MAX_ENTRIES': 1000
         }
+    },
+    'state': {
+        'BACKEND': 'roundware.lib.cache_backends.MeasuredCache',
+        'LOCATION': '/var/tmp/roundware_state',
+        'TIMEOUT': 60,
+        'OPTIONS': {
+            'BACKEND': 'roundware.lib.cache_backends.ExpiringFileBasedCache',
+            'MAX_ENTRIES': 50000,
+            # Seconds between listings of the cache files to cull.
+            'CULL_INTERVAL': 10
+        }
     }
 }
 
@@ -0,0 +1,19 @@
+# Settings for load testing the web tier on one machine with
+# scripts/load-test.py, which runs an Icecast admin stand-in. Use with
+# DJANGO_SETTINGS_MODULE=roundware.settings.loadtest
+import os
+
+from roundware.settings import *
+
+# No rwstreamd processes or dbus, see STREAM_STANDIN in common.py.
+STREAM_STANDIN = True
+ICECAST_HOST = os.environ.get('ROUNDWARE_ICECAST_STANDIN_HOST', 'localhost')
+ICECAST_PORT = os.environ.get('ROUNDWARE_ICECAST_STANDIN_PORT', '8001')
+
+# Don't throttle the simulated clients, which all come from one address.
+REST_FRAMEWORK = dict(REST_FRAMEWORK, DEFAULT_THROTTLE_CLASSES=())
+
+# Keep what the load test caches, like the stand-in's stream statuses, apart
+# from the caches of any server on the same machine.
+CACHES = dict((alias, dict(params, LOCATION=params['LOCATION'] + '_loadtest'))
+              for alias, params in CACHES.items())
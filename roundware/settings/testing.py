@@ -15,11 +15,17 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.dummy.DummyCache'
     },
+    'state': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'
+    },
     'locmemcache': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
     }
 }
 
+# Tests that need the request metrics set a directory of their own.
+WEB_METRICS_DIR = None
+
 # True when unit tests are running. Used by roundwared.recording_collection
 TESTING = True
 
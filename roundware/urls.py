@@ -26,6 +26,7 @@ urlpatterns = [
     url(r'^tools/asset-map$', rw_views.asset_map),
     url(r'^tools/listen-map$', rw_views.listen_map),
     url(r'^dashboard/$', rw_views.chart_views),
+    url(r'^metrics$', rw_views.metrics),
 
     # V1 DRF API
     url(r'^api/1/', include('roundware.api1.urls')),
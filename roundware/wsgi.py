@@ -22,3 +22,8 @@ execfile(ACTIVATE_VENV, dict(__file__=ACTIVATE_VENV))
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+# Profile the web workers on request, see manage.py profile.
+from django.conf import settings
+from roundwared import profiler
+profiler.watch(settings.PROFILE_DIR)
+
@@ -15,12 +15,12 @@ gobject.threads_init()
 import pygst
 pygst.require("0.10")
 import gst
-import random
 import logging
 import os
 import time
 from roundwared import src_wav_file
 from roundwared import db
+from roundwared import schedule
 from django.conf import settings
 from roundware.rw.models import Asset
 
@@ -42,13 +42,15 @@ class AudioTrack:
         self.adder = adder
         self.settings = settings
         self.rc = recording_collection
-        self.current_pan_pos = 0
-        self.target_pan_pos = 0
+        self.panner = schedule.Panner(settings)
         self.state = STATE_DEAD_AIR
         self.src_wav_file = None
         self.current_recording = None
         # Incremented only after start_audio() is called.
         self.track_timer = 0
+        # When the dead air since the last asset was last counted, None while
+        # an asset is playing.
+        self.dead_air_since = None
 
     def start_audio(self):
         """
@@ -81,76 +83,36 @@ class AudioTrack:
             elif self.state == STATE_DEAD_AIR:
                 self.state = STATE_WAITING
                 # Generate a random amount of dead air.
-                deadair = random.randint(
-                    self.settings.mindeadair,
-                    self.settings.maxdeadair) / gst.MSECOND
+                deadair = schedule.choose_deadair(self.settings)
                 # Attempt to start an asset in the future.
                 gobject.timeout_add(deadair, asset_start_timer)
             return True
 
         # http://www.pygtk.org/pygtk2reference/gobject-functions.html#function-gobject--timeout-add
         # Call audio_timer_callback() every second.
+        self.dead_air_since = time.time()
         gobject.timeout_add(1000, track_timer)
 
     def stereo_pan(self):
-        if self.current_pan_pos == self.target_pan_pos \
-                or self.pan_steps_left == 0:
-            self.set_new_pan_target()
-            self.set_new_pan_duration()
-        else:
-            pan_distance = \
-                self.target_pan_pos - self.current_pan_pos
-            amount_to_pan_now = pan_distance / self.pan_steps_left
-            self.current_pan_pos += amount_to_pan_now
-            self.pan_steps_left -= 1
-            if self.src_wav_file:
-                self.src_wav_file.pan_to(self.current_pan_pos)
+        pan_pos = self.panner.step()
+        if pan_pos is not None and self.src_wav_file:
+            self.src_wav_file.pan_to(pan_pos)
 
     ######################################################################
     # PRIVATE
     ######################################################################
 
     def add_file(self):
+        started = time.time()
         self.current_recording = self.rc.get_recording()
+        self.stream.metrics.get_recording_seconds.observe(time.time() - started)
         if not self.current_recording:
             self.state = STATE_DEAD_AIR
             self.set_track_metadata()
             return
 
-        duration = min(
-            self.current_recording.audiolength,
-            random.randint(
-                # FIXME: I don't allow less than a second to
-                # play currently. Mostly because playing zero
-                # is an error. Revisit this.
-                max(self.settings.minduration,
-                    gst.SECOND),
-                max(self.settings.maxduration,
-                    gst.SECOND)))
-
-        start = random.randint(
-            0,
-            self.current_recording.audiolength - duration)
-
-        fadein = random.randint(
-            self.settings.minfadeintime,
-            self.settings.maxfadeintime)
-        fadeout = random.randint(
-            self.settings.minfadeouttime,
-            self.settings.maxfadeouttime)
-
-        # FIXME: Instead of doing this divide by two, instead,
-        # decrease them by the same percentage. Remember it's
-        # possible that fade_in != fade_out.
-        if fadein + fadeout > duration:
-            fadein = duration / 2
-            fadeout = duration / 2
-
-        volume = self.current_recording.volume * (
-            self.settings.minvolume +
-            random.random() *
-            (self.settings.maxvolume -
-                self.settings.minvolume))
+        (recording, start, duration, fadein, fadeout, volume) = \
+            schedule.choose_clip(self.settings, self.current_recording)
 
         # logger.debug("current_recording.filename: %s, start: %s, duration: %s, fadein: %s, fadeout: %s, volume: %s",
         #                        self.current_recording.filename, start, duration, fadein, fadeout, volume)
@@ -170,7 +132,10 @@ class AudioTrack:
         self.addersinkpad.add_event_probe(self.event_probe)
         (ret, cur, pen) = self.pipeline.get_state()
         self.src_wav_file.set_state(cur)
+        self.update_dead_air()
+        self.dead_air_since = None
         self.state = STATE_PLAYING
+        self.stream.metrics.asset_transitions.inc()
 
         # Generate metadata for the current asset.
         tags = [str(tag.id) for tag in self.current_recording.tags.all()]
@@ -197,30 +162,22 @@ class AudioTrack:
             self.pipeline.remove(self.src_wav_file)
             self.adder.release_request_pad(self.addersinkpad)
             self.state = STATE_DEAD_AIR
+            self.dead_air_since = time.time()
             self.current_recording = None
             self.src_wav_file = None
         return False
 
-    def set_new_pan_target(self):
-        pan_step_size = (self.settings.maxpanpos -
-                         self.settings.minpanpos) / \
-            settings.NUM_PAN_STEPS
-        target_pan_step = random.randint(0, settings.NUM_PAN_STEPS)
-        self.target_pan_pos = -1 + target_pan_step * pan_step_size
-
-    def set_new_pan_duration(self):
-        duration_in_gst_units = \
-            random.randint(
-                self.settings.minpanduration,
-                self.settings.maxpanduration)
-        duration_in_miliseconds = duration_in_gst_units / gst.MSECOND
-        self.pan_steps_left = duration_in_miliseconds / \
-            settings.STEREO_PAN_INTERVAL
+    def update_dead_air(self):
+        """
+        Counts the dead air since it was last counted in the stream metrics.
+        """
+        if self.dead_air_since is not None:
+            now = time.time()
+            self.stream.metrics.dead_air_seconds.inc(now - self.dead_air_since)
+            self.dead_air_since = now
 
     def skip_ahead(self):
-        fadeoutnsecs = random.randint(
-            self.settings.minfadeouttime,
-            self.settings.maxfadeouttime)
+        fadeoutnsecs = schedule.choose_fadeout(self.settings)
         if self.src_wav_file != None and not self.src_wav_file.fading:
             logger.info("fading out for: " + str(round((fadeoutnsecs/1000000000),2)) + " sec")
             self.src_wav_file.fade_out(fadeoutnsecs)
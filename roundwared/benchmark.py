@@ -0,0 +1,336 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Micro-benchmarks of the roundwared code paths every stream runs: asset
+# queries, playlist updates, asset ordering and speaker volumes. Each catalog
+# size gets a synthetic project (assets, tags, votes and, on PostGIS,
+# speakers) created in a transaction that is rolled back afterwards, so the
+# suite can run against any development database.
+#
+# Results are plain dicts ready to be written as JSON; compare two result
+# files with scripts/compare-benchmarks.py.
+from __future__ import unicode_literals, division
+from collections import OrderedDict
+from timeit import default_timer
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+
+from django.contrib.auth import get_user_model
+from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from roundware.rw.models import (Asset, Language, Project, Session, Speaker, Tag,
+                                 TagCategory, UIGroup, UIItem, Vote)
+from roundwared import asset_sorters, db
+from roundwared.recording_collection import RecordingCollection
+from roundwared.schedule import SECOND
+from roundwared.simulator import (METERS_PER_DEGREE, VirtualGPSMixer, Walker,
+                                  percentile)
+
+logger = logging.getLogger(__name__)
+
+LATITUDE = 40.7
+LONGITUDE = -73.9
+# Meters around the project location assets, speakers and listeners are in.
+CATALOG_RADIUS = 1000
+RECORDING_RADIUS = 100
+TAG_CATEGORIES = 2
+TAGS_PER_CATEGORY = 4
+SPEAKERS = 10
+SPEAKER_SIZE = 200
+# Share of assets blocked by the listening user.
+BLOCKED_ASSETS = 0.05
+# Untimed calls before the timed ones.
+WARMUP = 1
+
+
+def measure(function, repeat, setup=None):
+    """
+    Calls function repeat times, after setup if given, and returns its
+    latency statistics (seconds) and queries per call.
+    """
+    latencies = []
+    queries = 0
+    for i in range(WARMUP + repeat):
+        if setup:
+            setup()
+        connection.queries_log.clear()
+        started = default_timer()
+        function()
+        elapsed = default_timer() - started
+        if i >= WARMUP:
+            latencies.append(elapsed)
+            queries += len(connection.queries_log)
+    latencies.sort()
+    return OrderedDict([
+        ('repeat', repeat),
+        ('min', latencies[0]),
+        ('median', percentile(latencies, 50)),
+        ('mean', sum(latencies) / repeat),
+        ('p95', percentile(latencies, 95)),
+        ('max', latencies[-1]),
+        ('queries', queries / repeat),
+    ])
+
+
+def offset(latitude, longitude, east, north):
+    """
+    Returns the (latitude, longitude) east and north meters from a point.
+    """
+    return (latitude + north / METERS_PER_DEGREE,
+            longitude + east / (METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01)))
+
+
+def square(latitude, longitude, meters):
+    """
+    Returns a MultiPolygon square with sides of meters centered on a point.
+    """
+    south, west = offset(latitude, longitude, -meters / 2, -meters / 2)
+    north, east = offset(latitude, longitude, meters / 2, meters / 2)
+    return MultiPolygon(Polygon(((west, south), (east, south), (east, north),
+                                 (west, north), (west, south))), srid=4326)
+
+
+def supports_speakers():
+    """
+    Speaker attenuation borders are built with PostGIS SQL.
+    """
+    return connection.vendor == 'postgresql'
+
+
+class Catalog:
+    """
+    A synthetic project of size assets spread around (LATITUDE, LONGITUDE),
+    tagged in TAG_CATEGORIES listen categories, and a listening session whose
+    user has blocked BLOCKED_ASSETS of them.
+    """
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.language = Language.objects.create(name='Benchmark', language_code='xx')
+        self.project = Project.objects.create(
+            name='Benchmark %s' % size, latitude=LATITUDE, longitude=LONGITUDE,
+            pub_date=timezone.now(), audio_format='mp3', max_recording_length=30,
+            sharing_url='', out_of_range_url='', recording_radius=RECORDING_RADIUS,
+            listen_enabled=True, geo_listen_enabled=True,
+            repeat_mode=Project.CONTINUOUS)
+        self.project.languages.add(self.language)
+
+        self.tags = []
+        for c in range(TAG_CATEGORIES):
+            category = TagCategory.objects.create(name='benchmark%s' % c)
+            ui_group = UIGroup.objects.create(
+                name=category.name, tag_category=category, project=self.project,
+                ui_mode=UIGroup.LISTEN, select=UIGroup.MULTI, index=c)
+            for t in range(TAGS_PER_CATEGORY):
+                tag = Tag.objects.create(project=self.project, tag_category=category,
+                                         value='%s-%s' % (category.name, t))
+                # Half of the tags are selected by default.
+                UIItem.objects.create(ui_group=ui_group, index=t, tag=tag,
+                                      active=True, default=t % 2 == 0)
+                self.tags.append(tag)
+
+        self.session = self.make_session('benchmark-listener')
+        speaking_sessions = [self.make_session('benchmark-speaker%s' % i)
+                             for i in range(10)]
+        Asset.objects.bulk_create(
+            [self.make_asset(i, rng.choice(speaking_sessions)) for i in range(size)])
+        self.assets = list(Asset.objects.filter(project=self.project))
+        Through = Asset.tags.through
+        Through.objects.bulk_create(
+            [Through(asset_id=asset.id, tag_id=tag.id)
+             for asset in self.assets
+             for tag in rng.sample(self.tags, 2)])
+
+        User = get_user_model()
+        user = User.objects.create(username='benchmark-listener-%s' % size)
+        user.userprofile.device_id = self.session.device_id
+        user.userprofile.save()
+        Vote.objects.bulk_create(
+            [Vote(voter=user, session=self.session, asset=asset, type='block_asset')
+             for asset in rng.sample(self.assets, int(size * BLOCKED_ASSETS))])
+        if self.assets:
+            # Block the user who recorded the first asset, and so all of
+            # their assets.
+            blocked_user = User.objects.create(username='benchmark-speaker-%s' % size)
+            blocked_user.userprofile.device_id = Session.objects.get(
+                id=self.assets[0].session_id).device_id
+            blocked_user.userprofile.save()
+            Vote.objects.create(voter=user, session=self.session,
+                                asset=self.assets[0], type='block_user')
+            # Likes for order_assets_by_like.
+            Vote.objects.bulk_create(
+                [Vote(session=self.session, asset=asset, type='like')
+                 for asset in rng.sample(self.assets, len(self.assets) // 2)])
+
+        self.speakers = []
+        if supports_speakers():
+            for i in range(SPEAKERS):
+                latitude, longitude = self.random_position()
+                self.speakers.append(Speaker.objects.create(
+                    project=self.project, activeyn=True, code='b%s' % i,
+                    maxvolume=1.0, minvolume=0.0, uri='http://localhost/%s.mp3' % i,
+                    backupuri='http://localhost/%s.mp3' % i,
+                    shape=square(latitude, longitude, SPEAKER_SIZE),
+                    attenuation_distance=SPEAKER_SIZE // 4))
+
+    def make_session(self, device_id):
+        return Session.objects.create(
+            project=self.project, language=self.language, starttime=timezone.now(),
+            device_id=device_id, geo_listen_enabled=True)
+
+    def make_asset(self, i, session):
+        latitude, longitude = self.random_position()
+        asset = Asset(project=self.project, session=session, language=self.language,
+                      latitude=latitude, longitude=longitude,
+                      filename='benchmark%s.wav' % i, mediatype='audio',
+                      audiolength=self.rng.randint(5, 60) * SECOND,
+                      weight=self.rng.randint(0, 99))
+        # bulk_create() doesn't call save(), which sets it.
+        asset.location = asset.build_location()
+        return asset
+
+    def random_position(self):
+        distance = CATALOG_RADIUS * math.sqrt(self.rng.random())
+        bearing = self.rng.uniform(0, 2 * math.pi)
+        return offset(LATITUDE, LONGITUDE, distance * math.sin(bearing),
+                      distance * math.cos(bearing))
+
+    def request(self, latitude=LATITUDE, longitude=LONGITUDE):
+        return {'session_id': self.session.id,
+                'project_id': self.project.id,
+                'latitude': latitude,
+                'longitude': longitude}
+
+
+def benchmark_catalog(catalog, repeat, rng):
+    """
+    Times the hot paths on a Catalog. Returns an OrderedDict of results by
+    benchmark name.
+    """
+    results = OrderedDict()
+    request = catalog.request()
+    session_id = catalog.session.id
+    default_tags = db.get_default_tags_for_project(catalog.project)
+
+    # The stream calls these through their cache; time both.
+    results['db.get_recordings'] = measure(
+        lambda: db.get_recordings(session_id, None), repeat,
+        setup=lambda: db.get_recordings.invalidate(session_id, None))
+    results['db.get_recordings (cached)'] = measure(
+        lambda: db.get_recordings(session_id, None), repeat)
+    results['db.filter_recs_for_tags'] = measure(
+        lambda: db.filter_recs_for_tags(catalog.project, default_tags, catalog.language),
+        repeat,
+        setup=lambda: db.filter_recs_for_tags.invalidate(
+            catalog.project, default_tags, catalog.language))
+
+    rc = RecordingCollection(None, request, RECORDING_RADIUS, 'random')
+    rc.start()
+    results['RecordingCollection.update_request'] = measure(
+        lambda: rc.update_request(request), repeat,
+        setup=lambda: db.get_recordings.invalidate(session_id, None))
+
+    walker = Walker(LATITUDE, LONGITUDE, CATALOG_RADIUS, rng)
+    positions = [walker.walk(10) for i in range(WARMUP + repeat)]
+    moves = iter(positions)
+    results['RecordingCollection.move_listener'] = measure(
+        lambda: rc.move_listener(catalog.request(*next(moves))), repeat)
+
+    # Refill the playlist outside of the timing, as playing every asset of a
+    # large catalog would take too long.
+    def fill_playlist():
+        if not rc.playlist_proximity:
+            rc.banned_timeout = {}
+            rc.banned_proximity = []
+            rc._update_playlist_proximity(request)
+    with override_settings(TESTING=True):
+        results['RecordingCollection.get_recording'] = measure(
+            rc.get_recording, repeat, setup=fill_playlist)
+    results['RecordingCollection._generate_user_blocked_list'] = measure(
+        rc._generate_user_blocked_list, repeat)
+
+    for sorter in ('order_assets_randomly', 'order_assets_by_weight',
+                   'order_assets_by_like'):
+        function = getattr(asset_sorters, sorter)
+        results['asset_sorters.%s' % sorter] = measure(
+            lambda: function(list(rc.all)), repeat)
+
+    if catalog.speakers:
+        mixer = VirtualGPSMixer(catalog.request(), catalog.project)
+        moves = iter(positions)
+
+        def move_mixer():
+            listener = catalog.request(*next(moves))
+            listener['session_id'] = [session_id]
+            mixer.move_listener(listener)
+        results['GPSMixer.move_listener'] = measure(move_mixer, repeat)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.STDOUT).strip().decode('ascii')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, repeat=20, seed=0):
+    """
+    Benchmarks catalogs of each of the sizes, repeat timed calls per
+    benchmark. Returns the results with details of the environment.
+    """
+    results = OrderedDict()
+    force_debug_cursor = connection.force_debug_cursor
+    connection.force_debug_cursor = True
+    try:
+        for size in sizes:
+            rng = random.Random(seed)
+            # RecordingCollection orders assets with the random module.
+            random.seed(seed)
+            started = default_timer()
+            with transaction.atomic():
+                catalog = Catalog(size, rng)
+                logger.info("Built a catalog of %s assets in %.1f seconds",
+                            size, default_timer() - started)
+                results[str(size)] = benchmark_catalog(catalog, repeat, rng)
+                transaction.set_rollback(True)
+    finally:
+        connection.force_debug_cursor = force_debug_cursor
+    return OrderedDict([
+        ('revision', git_revision()),
+        ('created', timezone.now().isoformat()),
+        ('database', connection.vendor),
+        ('python', platform.python_version()),
+        ('repeat', repeat),
+        ('seed', seed),
+        ('units', 'seconds'),
+        ('results', results),
+    ])
+
+
+def format_results(report):
+    """
+    Returns benchmark results as human readable text.
+    """
+    lines = ["Revision %s on %s, %s timed calls per benchmark" % (
+        report['revision'], report['database'], report['repeat'])]
+    for size, results in report['results'].items():
+        lines.append("")
+        lines.append("%s assets" % size)
+        lines.append("  %-52s %10s %10s %10s %8s" % (
+            'benchmark', 'median ms', 'p95 ms', 'max ms', 'queries'))
+        for name, result in results.items():
+            lines.append("  %-52s %10.3f %10.3f %10.3f %8.1f" % (
+                name, result['median'] * 1000, result['p95'] * 1000,
+                result['max'] * 1000, result['queries']))
+    return '\n'.join(lines)
@@ -30,6 +30,9 @@ def add_signal_receiver(stream):
                 stream.play_asset(request)
             elif operation == "vote_asset":
                 stream.vote_asset()
+            elif operation == "profile":
+                request = json.loads(args)
+                stream.profile(request)
         else:
             if operation == "refresh_recordings":
                 stream.refresh_recordings()
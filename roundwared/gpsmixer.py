@@ -125,6 +125,9 @@ class GPSMixer (gst.Bin):
             logger.debug("already added, setting vol: " + str(volume))
         self.sources[speaker.id].set_volume(volume)
 
+    def count_playing_speakers(self):
+        return len([source for source in self.sources.values() if source.target_vol > 0])
+
     def get_current_speakers(self):
         logger.info("filtering speakers")
         listener = Point(float(self.listener['longitude']), float(self.listener['latitude']))
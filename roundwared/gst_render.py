@@ -0,0 +1,58 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Renders one clip of a WAV file through the gst elements a live stream uses
+# (SrcWavFile, as played by AudioTrack), to check roundwared.offline_mixer
+# against; see scripts/compare-offline-mix.py.
+from __future__ import unicode_literals
+import gobject
+gobject.threads_init()
+import pygst
+pygst.require("0.10")
+import gst
+import logging
+
+from roundwared.src_wav_file import SrcWavFile
+
+logger = logging.getLogger(__name__)
+
+CAPS = "audio/x-raw-int,rate=44100,channels=2,width=16,depth=16,signed=(boolean)true"
+
+
+def render_clip(filepath, clip, pan_pos, output):
+    """
+    Writes the clip of the WAV file at filepath, panned to pan_pos, to the
+    WAV file output as 44.1kHz 16 bit stereo.
+    """
+    pipeline = gst.Pipeline()
+    src = SrcWavFile(filepath, clip.start, clip.duration, clip.fadein,
+                     clip.fadeout, clip.volume)
+    src.pan_to(pan_pos)
+    capsfilter = gst.element_factory_make("capsfilter")
+    capsfilter.set_property("caps", gst.caps_from_string(CAPS))
+    wavenc = gst.element_factory_make("wavenc")
+    filesink = gst.element_factory_make("filesink")
+    filesink.set_property("location", output)
+    pipeline.add(src, capsfilter, wavenc, filesink)
+    gst.element_link_many(src, capsfilter, wavenc, filesink)
+
+    # Seek to the clip when the first segment arrives, like AudioTrack.
+    def event_probe(pad, event):
+        if event.type == gst.EVENT_NEWSEGMENT:
+            gobject.idle_add(src.seek_to_start)
+        return True
+    src.get_pad('src').add_event_probe(event_probe)
+
+    loop = gobject.MainLoop()
+
+    def on_message(bus, message):
+        if message.type in (gst.MESSAGE_EOS, gst.MESSAGE_ERROR):
+            if message.type == gst.MESSAGE_ERROR:
+                logger.error("gst error: %s" % (message.parse_error(),))
+            loop.quit()
+    bus = pipeline.get_bus()
+    bus.add_signal_watch()
+    bus.connect("message", on_message)
+    pipeline.set_state(gst.STATE_PLAYING)
+    loop.run()
+    pipeline.set_state(gst.STATE_NULL)
@@ -0,0 +1,67 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Stand-ins for the gobject, pygst and gst modules, so roundwared modules can
+# be imported where GStreamer 0.10 is not installed, e.g. by the session
+# simulator on a laptop. Every attribute is a no-op callable returning
+# another stub; nothing is ever played.
+from __future__ import unicode_literals
+import sys
+import types
+
+MODULES = ('gobject', 'pygst', 'gst')
+
+
+class Stub(object):
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return Stub()
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Stub()
+
+
+class StubModule(types.ModuleType):
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Stub()
+
+
+def stub_modules():
+    """
+    Returns new stub modules by name. gst.Bin and gobject.GObject are
+    classes, as roundwared subclasses them.
+    """
+    modules = dict((name, StubModule(str(name))) for name in MODULES)
+    modules['gst'].Bin = type(str('Bin'), (Stub,), {})
+    modules['gst'].Pipeline = type(str('Pipeline'), (Stub,), {})
+    modules['gst'].SECOND = 1000000000
+    modules['gst'].MSECOND = 1000000
+    modules['gobject'].GObject = type(str('GObject'), (Stub,), {})
+    return modules
+
+
+def install():
+    """
+    Installs the stubs in sys.modules unless gst can be imported. Must be
+    called before any roundwared module that uses gst is imported. Returns
+    True if the stubs were installed.
+    """
+    try:
+        import pygst
+        pygst.require("0.10")
+        import gst  # noqa
+        return False
+    except ImportError:
+        pass
+    for name in MODULES:
+        sys.modules.pop(name, None)
+    sys.modules.update(stub_modules())
+    return True
@@ -2,49 +2,120 @@
 # See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
 
 from __future__ import unicode_literals
+import fcntl
 import libxml2
 import logging
 import requests
+import time
 from django.conf import settings
+from roundware.lib.cache_backends import state as cache
+from roundwared import metrics
 
 logger = logging.getLogger(__name__)
 
+# Icecast status is shared by all web workers and streams on the host through
+# the state cache, so /admin/stats is requested at most once per
+# ICECAST_STATUS_INTERVAL no matter how many streams or requests there are.
+# The process refreshing it holds an flock on ICECAST_STATUS_LOCK_FILE, as the
+# file based cache has no atomic add to claim the refresh with.
+STATUS_CACHE_KEY = 'icecast2_status'
+# Keep the last status around for a while so other processes keep reading it
+# while one process refreshes it.
+STATUS_CACHE_TIMEOUT = 60
+
+# rwstreamd publishes the provisioning status of its mount through the cache
+# so request_stream can hand out the stream URL as soon as it is playable.
+STREAM_STATUS_CACHE_KEY = 'icecast2_stream_status%s'
+STREAM_STARTING = 'starting'
+STREAM_READY = 'ready'
+
 
 def mount_point(sessionid, audio_format):
     return '/stream%s.%s' % (sessionid, audio_format.lower())
 
+
+def get_stream_status(mount):
+    """
+    Returns STREAM_STARTING or STREAM_READY as published for the mount, or
+    None if nothing is known about it.
+    """
+    return cache.get(STREAM_STATUS_CACHE_KEY % mount)
+
+
+def set_stream_status(mount, status, timeout=None):
+    cache.set(STREAM_STATUS_CACHE_KEY % mount, status, timeout)
+
+
+def clear_stream_status(mount):
+    cache.delete(STREAM_STATUS_CACHE_KEY % mount)
+
+
 class Admin:
 
     def __init__(self):
         self.auth = (str(settings.ICECAST_USERNAME), str(settings.ICECAST_PASSWORD))
         self.base_uri = "http://" + settings.ICECAST_HOST + ":" + settings.ICECAST_PORT
 
+    def get_status(self):
+        """
+        Returns a dict of listener counts keyed by mount point for every
+        mount on the server. The cached status is used unless it is older
+        than ICECAST_STATUS_INTERVAL, in which case only the process that
+        gets the refresh lock requests it again; the others use the stale
+        one meanwhile.
+        """
+        status = cache.get(STATUS_CACHE_KEY)
+        if status is None:
+            status = self.poll_status()
+        elif self.is_stale(status):
+            with open(settings.ICECAST_STATUS_LOCK_FILE, 'a') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError:
+                    return status['mounts']
+                # Another process may have refreshed it before the lock was
+                # released.
+                status = cache.get(STATUS_CACHE_KEY) or status
+                if self.is_stale(status):
+                    status = self.poll_status()
+        return status['mounts']
+
+    def is_stale(self, status):
+        return time.time() - status['time'] > settings.ICECAST_STATUS_INTERVAL
+
+    def poll_status(self):
+        """
+        Requests the status of all mounts from Icecast and publishes it to
+        the cache.
+        """
+        status = {'time': time.time(),
+                  'mounts': self.process_xml_sources("/admin/stats")}
+        cache.set(STATUS_CACHE_KEY, status, STATUS_CACHE_TIMEOUT)
+        return status
+
+    def add_mount(self, mount):
+        """
+        Adds a newly connected mount to the cached status, so it is visible
+        before the next poll of Icecast.
+        """
+        status = cache.get(STATUS_CACHE_KEY)
+        if status is not None and mount not in status['mounts']:
+            status['mounts'][mount] = 0
+            cache.set(STATUS_CACHE_KEY, status, STATUS_CACHE_TIMEOUT)
+
     def get_mount_list(self):
-        result = self.process_xml(
-            "/admin/listmounts", "//icestats/source/@mount")
-        if result:
-            return result
-        else:
-            return []
+        return self.get_status().keys()
 
     def get_client_count(self, mount):
-        result = self.process_xml(
-            "/admin/listclients?mount=" + mount,
-            "//icestats/source/Listeners")
-        if result:
-            return int(result[0])
-        else:
-            return 0
+        return self.get_status().get(mount, 0)
 
     def stream_exists(self, mount):
-        for m in self.get_mount_list():
-            if m == mount:
-                return True
-        return False
+        return mount in self.get_status()
 
     def process_xml(self, url, xpath):
         # logger.debug("Request: %s, auth=%s", self.base_uri + url, self.auth)
-        response = requests.get(self.base_uri + url, auth=self.auth)
+        with metrics.timed('icecast_seconds'):
+            response = requests.get(self.base_uri + url, auth=self.auth)
         response.raise_for_status()
         # logger.debug("Response: %s", response.content)
         # Parse the XML and get the requested xpath results.
@@ -54,3 +125,22 @@ class Admin:
         # Must get the complete results before running freeDoc()
         xml.freeDoc()
         return results
+
+    def process_xml_sources(self, url):
+        """
+        Returns a dict of listener counts keyed by mount from the
+        //icestats/source elements of an Icecast admin XML document.
+        """
+        with metrics.timed('icecast_seconds'):
+            response = requests.get(self.base_uri + url, auth=self.auth)
+        response.raise_for_status()
+        xml = libxml2.parseDoc(response.content)
+        context = xml.xpathNewContext()
+        sources = {}
+        for source in context.xpathEval("//icestats/source"):
+            context.setContextNode(source)
+            listeners = context.xpathEval("listeners")
+            sources[source.prop("mount")] = int(listeners[0].content) if listeners else 0
+        # Must get the complete results before running freeDoc()
+        xml.freeDoc()
+        return sources
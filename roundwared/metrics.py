@@ -0,0 +1,362 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Counters, gauges and histograms a stream keeps about itself, rendered in
+# the Prometheus text format. Every rwstreamd writes its metrics to a file in
+# settings.STREAM_METRICS_DIR; scripts/stream-metrics.py (or node_exporter's
+# textfile collector) serves the files of a host as one scrapeable page.
+# Kept free of gst and Django so the aggregator can use it on its own.
+from __future__ import unicode_literals, division
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+import io
+import os
+import threading
+import time
+
+# Seconds, for latencies of callbacks and queries.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+# Seconds, for main loop stalls.
+STALL_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Milliseconds between the main loop lag probes.
+LAG_PROBE_INTERVAL = 1000
+# Values a LabelledCounter keeps apart, to bound the number of time series.
+MAX_LABEL_VALUES = 50
+SUFFIX = '.prom'
+
+
+def escape(value):
+    return ('%s' % value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else '%s' % value
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def set(self, value):
+        # For counts kept elsewhere, e.g. CPU time by the kernel.
+        self.value = value
+
+    def samples(self, name):
+        return [(name, (), self.value)]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+
+class Labelled(object):
+    """
+    A metric made by make() per value of one label. Values beyond the first
+    max_values share the metric of "other".
+    """
+
+    def __init__(self, label, make, max_values=MAX_LABEL_VALUES):
+        self.label = label
+        self.make = make
+        self.max_values = max_values
+        self.children = OrderedDict()
+
+    def labels(self, value):
+        if value not in self.children and len(self.children) >= self.max_values:
+            value = 'other'
+        if value not in self.children:
+            self.children[value] = self.make()
+        return self.children[value]
+
+    def samples(self, name):
+        return [(sample, ((self.label, value),) + labels, count)
+                for value, child in self.children.items()
+                for sample, labels, count in child.samples(name)]
+
+
+class LabelledCounter(Labelled):
+    kind = 'counter'
+
+    def __init__(self, label, max_values=MAX_LABEL_VALUES):
+        Labelled.__init__(self, label, Counter, max_values)
+
+    def inc(self, value, amount=1):
+        self.labels(value).inc(amount)
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name):
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append((name + '_bucket', (('le', format_value(bound)),), cumulative))
+        samples.append((name + '_sum', (), self.sum))
+        samples.append((name + '_count', (), self.count))
+        return samples
+
+
+class LabelledHistogram(Labelled):
+    kind = 'histogram'
+
+    def __init__(self, label, buckets=LATENCY_BUCKETS, max_values=MAX_LABEL_VALUES):
+        Labelled.__init__(self, label, lambda: Histogram(buckets), max_values)
+
+    def observe(self, value, amount):
+        self.labels(value).observe(amount)
+
+
+class Registry(object):
+    """
+    Metrics by name, all rendered with the same labels. Collectors are
+    called before rendering, to set gauges from the current state.
+    """
+
+    def __init__(self, labels):
+        self.labels = tuple(labels)
+        self.metrics = OrderedDict()
+        self.collectors = []
+
+    def add(self, name, help, metric):
+        self.metrics[name] = (help, metric)
+        return metric
+
+    def counter(self, name, help):
+        return self.add(name, help, Counter())
+
+    def gauge(self, name, help):
+        return self.add(name, help, Gauge())
+
+    def labelled_counter(self, name, help, label, max_values=MAX_LABEL_VALUES):
+        return self.add(name, help, LabelledCounter(label, max_values))
+
+    def labelled_histogram(self, name, help, label, buckets=LATENCY_BUCKETS,
+                           max_values=MAX_LABEL_VALUES):
+        return self.add(name, help, LabelledHistogram(label, buckets, max_values))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self.add(name, help, Histogram(buckets))
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for name, (help, metric) in self.metrics.items():
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, metric.kind))
+            for sample, labels, value in metric.samples(name):
+                labels = ','.join('%s="%s"' % (key, escape(value))
+                                  for key, value in self.labels + labels)
+                lines.append('%s{%s} %s' % (sample, labels, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+class StreamMetrics(Registry):
+    """
+    The metrics of one stream, labelled with its session and project.
+    """
+
+    def __init__(self, session_id, project_id):
+        Registry.__init__(self, (('session', session_id), ('project', project_id)))
+        self.get_recording_seconds = self.histogram(
+            'roundware_stream_get_recording_seconds',
+            'Time to choose the next asset to play.')
+        self.playlist_assets = self.gauge(
+            'roundware_stream_playlist_assets',
+            'Assets left to play at the listener position.')
+        self.assets = self.gauge(
+            'roundware_stream_assets',
+            'Assets matching the stream tags.')
+        self.db_queries = self.counter(
+            'roundware_stream_db_queries_total', 'Database queries.')
+        self.db_query_seconds = self.counter(
+            'roundware_stream_db_query_seconds_total', 'Time spent in database queries.')
+        self.main_loop_lag_seconds = self.histogram(
+            'roundware_stream_main_loop_lag_seconds',
+            'How late main loop timer callbacks run.')
+        self.main_loop_stalls = self.labelled_counter(
+            'roundware_stream_main_loop_stalls_total',
+            'Main loop stalls, by the function blamed for them.', 'where')
+        self.main_loop_stall_seconds = self.histogram(
+            'roundware_stream_main_loop_stall_seconds',
+            'How long main loop stalls lasted.', STALL_BUCKETS)
+        self.dead_air_seconds = self.counter(
+            'roundware_stream_dead_air_seconds_total',
+            'Time audiotracks spent without an asset playing.')
+        self.asset_transitions = self.counter(
+            'roundware_stream_asset_transitions_total', 'Assets started.')
+        self.speakers = self.gauge(
+            'roundware_stream_speakers', 'Speakers playing in the stream.')
+        self.encoder_buffer_seconds = self.gauge(
+            'roundware_stream_encoder_buffer_seconds',
+            'Audio mixed ahead of playback, being encoded and sent.')
+        self.cpu_seconds = self.counter(
+            'roundware_stream_cpu_seconds_total',
+            'User and system CPU time of the stream process.')
+        self.uptime_seconds = self.gauge(
+            'roundware_stream_uptime_seconds', 'Time since the stream started.')
+
+
+class LagProbe(object):
+    """
+    A main loop timer callback that observes how late it runs, in seconds,
+    in histogram. interval is in milliseconds, as for gobject.timeout_add.
+    """
+
+    def __init__(self, histogram, interval=LAG_PROBE_INTERVAL, clock=time.time):
+        self.histogram = histogram
+        self.interval = interval / 1000
+        self.clock = clock
+        self.last = None
+
+    def __call__(self):
+        now = self.clock()
+        if self.last is not None:
+            self.histogram.observe(max(now - self.last - self.interval, 0))
+        self.last = now
+        return True
+
+
+# What the current thread spent, by key, while it is tallied. Code that does
+# slow work the caller wants to know about, like dbus signals or Icecast
+# requests, adds to it; roundware.lib.web_metrics tallies each request.
+_thread = threading.local()
+
+
+def begin_tally():
+    _thread.tally = defaultdict(float)
+
+
+def end_tally():
+    """
+    Stops tallying the current thread and returns the tally.
+    """
+    tally = getattr(_thread, 'tally', None)
+    _thread.tally = None
+    return tally or {}
+
+
+def tally(key, amount=1):
+    current = getattr(_thread, 'tally', None)
+    if current is not None:
+        current[key] += amount
+
+
+@contextmanager
+def timed(key):
+    """
+    Adds the seconds the block takes to key in the current thread's tally.
+    """
+    started = time.time()
+    try:
+        yield
+    finally:
+        tally(key, time.time() - started)
+
+
+def path(directory, session_id):
+    return os.path.join(directory, '%s%s' % (session_id, SUFFIX))
+
+
+def write(registry, filepath):
+    """
+    Writes the rendered registry to filepath, replacing it atomically so
+    readers never see a partial file.
+    """
+    directory = os.path.dirname(filepath)
+    try:
+        os.makedirs(directory)
+    except OSError:
+        # Made already, maybe by another stream.
+        if not os.path.isdir(directory):
+            raise
+    temporary = '%s.%s.tmp' % (filepath, os.getpid())
+    with io.open(temporary, 'w', encoding='utf-8') as f:
+        f.write(registry.render())
+    os.rename(temporary, filepath)
+
+
+def remove(filepath):
+    try:
+        os.remove(filepath)
+    except OSError:
+        pass
+
+
+def read_dir(directory, max_age, now=None):
+    """
+    Returns the contents of the metrics files in directory, deleting files
+    not written for max_age seconds: their streams died without cleaning up.
+    """
+    now = time.time() if now is None else now
+    texts = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(SUFFIX):
+            continue
+        filepath = os.path.join(directory, name)
+        try:
+            if now - os.path.getmtime(filepath) > max_age:
+                os.remove(filepath)
+                continue
+            with io.open(filepath, encoding='utf-8') as f:
+                texts.append(f.read())
+        except (IOError, OSError):
+            # Removed by its stream meanwhile.
+            continue
+    return texts
+
+
+def merge(texts):
+    """
+    Merges rendered registries into one page, with the HELP and TYPE of
+    each metric once and followed by all of its samples.
+    """
+    families = OrderedDict()
+    family = None
+    for text in texts:
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            if line.startswith('# '):
+                parts = line.split(' ', 3)
+                if len(parts) >= 3 and parts[1] in ('HELP', 'TYPE'):
+                    family = families.setdefault(parts[2], OrderedDict([('HELP', None),
+                                                                        ('TYPE', None),
+                                                                        ('samples', [])]))
+                    if family[parts[1]] is None:
+                        family[parts[1]] = line
+                continue
+            if family is not None:
+                family['samples'].append(line)
+    lines = []
+    for family in families.values():
+        lines.extend(line for line in (family['HELP'], family['TYPE']) if line)
+        lines.extend(family['samples'])
+    return '\n'.join(lines) + '\n' if lines else ''
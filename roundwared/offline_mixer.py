@@ -0,0 +1,275 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Renders the audio of a stream offline with NumPy instead of a gst pipeline.
+# Assets are chosen by a RecordingCollection and scheduled with the same
+# choices as AudioTrack (roundwared.schedule), in virtual time. The clips are
+# then faded, panned and summed block by block the way SrcWavFile,
+# audiopanorama, adder and the RoundStreamSink volume do in a live stream.
+#
+# Speaker audio (GPSMixer) is not rendered, only the audiotracks.
+from __future__ import unicode_literals, division
+from collections import namedtuple
+import heapq
+import logging
+import os
+import random
+import wave
+
+import numpy
+from django.conf import settings
+
+from roundwared import schedule
+from roundwared.schedule import SECOND, MSECOND
+
+logger = logging.getLogger(__name__)
+
+# The raw audio format of MP3 streams, see RoundStreamSink.
+RATE = 44100
+CHANNELS = 2
+# Frames mixed at a time.
+BLOCK_FRAMES = 4096
+
+# A clip started on an audiotrack at position nanoseconds into the stream.
+ScheduledClip = namedtuple('ScheduledClip', ['track', 'position', 'clip'])
+
+
+def read_wav(filepath, rate=RATE):
+    """
+    Returns the samples of a PCM WAV file as a float32 array of shape
+    (frames, channels) with values in [-1, 1], resampled to rate. Files with
+    more than two channels are mixed down to mono.
+    """
+    w = wave.open(filepath, 'rb')
+    try:
+        channels = w.getnchannels()
+        width = w.getsampwidth()
+        file_rate = w.getframerate()
+        data = w.readframes(w.getnframes())
+    finally:
+        w.close()
+
+    if width == 1:
+        samples = (numpy.frombuffer(data, numpy.uint8).astype(numpy.float32) - 128) / 128
+    elif width == 2:
+        samples = numpy.frombuffer(data, b'<i2').astype(numpy.float32) / 32768
+    elif width == 3:
+        raw = numpy.frombuffer(data, numpy.uint8).reshape(-1, 3).astype(numpy.int32)
+        ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        ints = numpy.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        samples = ints.astype(numpy.float32) / (1 << 23)
+    elif width == 4:
+        samples = numpy.frombuffer(data, b'<i4').astype(numpy.float32) / 2147483648
+    else:
+        raise ValueError("Unsupported sample width %s: %s" % (width, filepath))
+
+    samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+    if channels > 2:
+        samples = samples.mean(axis=1, dtype=numpy.float32).reshape(-1, 1)
+    if file_rate != rate:
+        samples = resample(samples, file_rate, rate)
+    return samples
+
+
+def resample(samples, from_rate, to_rate):
+    """
+    Linearly interpolates samples of shape (frames, channels) to a new rate.
+    """
+    frames = int(round(len(samples) * to_rate / from_rate))
+    positions = numpy.arange(frames) * (from_rate / to_rate)
+    source = numpy.arange(len(samples))
+    return numpy.column_stack(
+        [numpy.interp(positions, source, samples[:, c])
+         for c in range(samples.shape[1])]).astype(numpy.float32)
+
+
+def envelope(times, clip):
+    """
+    Returns the volume of the clip at times (nanoseconds from the start of
+    the clip), as set by the SrcWavFile volume controller.
+    """
+    return numpy.interp(
+        times,
+        [0, clip.fadein, clip.duration - clip.fadeout, clip.duration],
+        [0.0, clip.volume, clip.volume, 0.0]).astype(numpy.float32)
+
+
+def pan(samples, pan_pos):
+    """
+    Pans mono or stereo samples to stereo with the psychoacoustic method of
+    audiopanorama, pan_pos being one position per frame in [-1, 1].
+    """
+    out = numpy.empty((len(samples), 2), numpy.float32)
+    if samples.shape[1] == 1:
+        out[:, 0] = samples[:, 0] * ((1 - pan_pos) / 2)
+        out[:, 1] = samples[:, 0] * ((1 + pan_pos) / 2)
+    else:
+        right = numpy.clip(pan_pos, 0, 1).astype(numpy.float32)
+        left = numpy.clip(-pan_pos, 0, 1).astype(numpy.float32)
+        out[:, 0] = samples[:, 0] * (1 - right) + samples[:, 1] * left
+        out[:, 1] = samples[:, 1] * (1 - left) + samples[:, 0] * right
+    return out
+
+
+def render_clip(samples, clip, pan_pos=0.0, rate=RATE):
+    """
+    Returns a whole clip of a recording's samples as float32 stereo samples,
+    faded and panned to a fixed position.
+    """
+    offset = int(clip.start * rate // SECOND)
+    part = samples[offset:offset + int(clip.duration * rate // SECOND)]
+    gain = envelope(numpy.arange(len(part)) * (SECOND / rate), clip)
+    return pan(part, numpy.full(len(part), pan_pos)) * gain[:, numpy.newaxis]
+
+
+def write_wav(filepath, samples, rate=RATE):
+    """
+    Writes int16 samples of shape (frames, channels) to a WAV file.
+    """
+    w = wave.open(filepath, 'wb')
+    try:
+        w.setnchannels(samples.shape[1])
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.astype(b'<i2').tobytes())
+    finally:
+        w.close()
+
+
+class OfflineMixer:
+    """
+    Renders the mix of a RecordingCollection on the given Audiotracks. With a
+    seed, the clip and pan choices are reproducible; RecordingCollection
+    orders assets with the random module, which must be seeded as well for
+    reproducible asset order.
+    """
+
+    def __init__(self, recording_collection, audiotracks, seed=None, rate=RATE,
+                 master_volume=None):
+        self.rc = recording_collection
+        self.audiotracks = list(audiotracks)
+        self.rng = random.Random(seed)
+        self.rate = rate
+        if master_volume is None:
+            master_volume = settings.MASTER_VOLUME
+        self.master_volume = master_volume
+        self.recordings = {}
+
+    def schedule(self, length):
+        """
+        Returns the ScheduledClips of the first length nanoseconds of the
+        stream, and the pan positions of each track, following the timers of
+        AudioTrack (see schedule.next_track_event).
+        """
+        clips = []
+        # (time, sequence, track, action); the sequence keeps events at the
+        # same time in order.
+        events = [(SECOND, i, i, 'tick') for i in range(len(self.audiotracks))]
+        sequence = len(events)
+        while events and events[0][0] < length:
+            now, _, track, action = heapq.heappop(events)
+            next_time, next_action, clip = schedule.next_track_event(
+                self.audiotracks[track], now, action, self.rc.get_recording, self.rng)
+            if clip:
+                clips.append(ScheduledClip(track, now, clip))
+            heapq.heappush(events, (next_time, sequence, track, next_action))
+            sequence += 1
+
+        steps = int(length // (settings.STEREO_PAN_INTERVAL * MSECOND)) + 1
+        pans = [self.pan_positions(track_settings, steps)
+                for track_settings in self.audiotracks]
+        return clips, pans
+
+    def pan_positions(self, track_settings, steps):
+        """
+        Returns the pan position after each STEREO_PAN_INTERVAL step, and
+        whether it was set on the step.
+        """
+        panner = schedule.Panner(track_settings, self.rng)
+        positions = numpy.zeros(steps, numpy.float32)
+        changed = numpy.zeros(steps, numpy.bool_)
+        position = 0
+        for i in range(steps):
+            pan_pos = panner.step()
+            if pan_pos is not None:
+                position = pan_pos
+                changed[i] = True
+            positions[i] = position
+        return positions, changed
+
+    def render(self, length):
+        """
+        Returns the first length nanoseconds of the stream as int16 samples
+        of shape (frames, 2).
+        """
+        clips, pans = self.schedule(length)
+        clips.sort(key=lambda c: c.position)
+        frames = int(length * self.rate // SECOND)
+        out = numpy.empty((frames, CHANNELS), numpy.int16)
+        step_frames = self.rate * settings.STEREO_PAN_INTERVAL / 1000
+        ns_per_frame = SECOND / self.rate
+
+        active = []
+        next_clip = 0
+        for block_start in range(0, frames, BLOCK_FRAMES):
+            block_end = min(block_start + BLOCK_FRAMES, frames)
+            while next_clip < len(clips) and \
+                    clips[next_clip].position * self.rate // SECOND < block_end:
+                active.append(self.prepare(clips[next_clip], pans))
+                next_clip += 1
+
+            mix = numpy.zeros((block_end - block_start, CHANNELS), numpy.float32)
+            for prepared in list(active):
+                first, last, samples, clip, positions, changed_from = prepared
+                if last <= block_start:
+                    active.remove(prepared)
+                    continue
+                start = max(block_start, first)
+                end = min(block_end, last)
+                if start >= end:
+                    continue
+                frame_index = numpy.arange(start, end)
+                part = samples[start - first:end - first]
+                if len(part) < end - start:
+                    # The file is shorter than the asset's audiolength.
+                    part = numpy.concatenate(
+                        [part, numpy.zeros((end - start - len(part), part.shape[1]),
+                                           numpy.float32)])
+                steps = numpy.minimum((frame_index // step_frames).astype(numpy.int64),
+                                      len(positions) - 1)
+                # A new SrcWavFile is centered until the pan is next set.
+                pan_pos = numpy.where(steps >= changed_from, positions[steps], 0)
+                gain = envelope((frame_index - first) * ns_per_frame, clip)
+                mix[start - block_start:end - block_start] += \
+                    pan(part, pan_pos) * gain[:, numpy.newaxis]
+
+            mix *= self.master_volume
+            out[block_start:block_end] = numpy.clip(mix * 32768, -32768, 32767)
+        return out
+
+    def render_to_file(self, filepath, length):
+        write_wav(filepath, self.render(length), self.rate)
+
+    def prepare(self, scheduled, pans):
+        """
+        Returns (first frame, end frame, samples, clip, pan positions, first
+        step the pan is set on) of a scheduled clip.
+        """
+        clip = scheduled.clip
+        first = int(scheduled.position * self.rate // SECOND)
+        last = first + int(clip.duration * self.rate // SECOND)
+        offset = int(clip.start * self.rate // SECOND)
+        samples = self.read(clip.recording)[offset:offset + last - first]
+
+        positions, changed = pans[scheduled.track]
+        step_ns = settings.STEREO_PAN_INTERVAL * MSECOND
+        later = numpy.nonzero(changed[scheduled.position // step_ns + 1:])[0]
+        changed_from = scheduled.position // step_ns + 1 + later[0] if len(later) \
+            else len(positions)
+        return first, last, samples, clip, positions, changed_from
+
+    def read(self, recording):
+        if recording.filename not in self.recordings:
+            filepath = os.path.join(settings.MEDIA_ROOT, recording.filename)
+            self.recordings[recording.filename] = read_wav(filepath, self.rate)
+        return self.recordings[recording.filename]
@@ -0,0 +1,285 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Profiles a running process on demand, for a bounded time, with cProfile,
+# a sampling profiler or tracemalloc. manage.py profile asks streams over
+# dbus and web workers through a request file that a RequestWatcher checks.
+# The profiled process writes the output to settings.PROFILE_DIR for offline
+# analysis: .pstats for pstats, .folded for flamegraph.pl and .tracemalloc
+# for tracemalloc.Snapshot.load(). Kept free of gst and Django, like metrics.
+from __future__ import unicode_literals, division
+from collections import Counter
+import cProfile
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+try:
+    # Python 3.4+, or Python 2 patched for pytracemalloc.
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+logger = logging.getLogger(__name__)
+
+CPROFILE = 'cprofile'
+SAMPLE = 'sample'
+TRACEMALLOC = 'tracemalloc'
+KINDS = (CPROFILE, SAMPLE, TRACEMALLOC)
+# Requested instead of a kind to end a profile early.
+STOP = 'stop'
+EXTENSIONS = {CPROFILE: '.pstats', SAMPLE: '.folded', TRACEMALLOC: '.tracemalloc'}
+# In seconds.
+DEFAULT_DURATION = 30
+MAX_DURATION = 600
+# Seconds between the samples of the sampling profiler.
+SAMPLE_INTERVAL = 0.01
+# Distinct stacks a Sampler keeps apart; further ones are counted as "other".
+MAX_STACKS = 10000
+# Frames tracemalloc keeps of each allocation.
+TRACEMALLOC_FRAMES = 25
+# Seconds between the checks of a RequestWatcher.
+WATCH_INTERVAL = 2
+# Name of the web workers' request file and prefix of their outputs.
+WEB = 'web'
+
+
+def collapse(frame):
+    """
+    Returns "file:function" of frame and its callers, outermost first and
+    separated by semicolons, as flamegraph.pl reads stacks.
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def start_timer(seconds, callback):
+    timer = threading.Timer(seconds, callback)
+    timer.daemon = True
+    timer.start()
+
+
+def make_directory(directory):
+    try:
+        os.makedirs(directory)
+    except OSError:
+        # Made already, maybe by another process.
+        if not os.path.isdir(directory):
+            raise
+
+
+class Sampler(object):
+    """
+    Counts the stacks of every other thread every interval seconds, from a
+    thread of its own.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, max_stacks=MAX_STACKS):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        own = threading.current_thread().ident
+        names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = '%s;%s' % (names.get(thread_id, thread_id), collapse(frame))
+            if stack not in self.stacks and len(self.stacks) >= self.max_stacks:
+                stack = 'other'
+            self.stacks[stack] += 1
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='sampler')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, filepath):
+        with io.open(filepath, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('%s %d\n' % (stack, count))
+
+
+class Profiler(object):
+    """
+    Runs one profile at a time in this process and stops it after its
+    duration. Outputs are named prefix-time-kind.ext in directory.
+    schedule(seconds, callback) calls callback after seconds, from a timer
+    thread by default. cProfile profiles only the thread that starts it and
+    must be stopped by that thread, so a process profiling its main loop
+    schedules on the main loop.
+    """
+
+    def __init__(self, directory, prefix, schedule=start_timer):
+        self.directory = directory
+        self.prefix = prefix
+        self.schedule = schedule
+        self.lock = threading.Lock()
+        self.kind = None
+        self.profile = None
+        self.path = None
+        # Tells the stop timers of profiles stopped early from the current one.
+        self.generation = 0
+
+    def start(self, kind, duration=DEFAULT_DURATION):
+        """
+        Starts a profile of kind for duration seconds and returns the path
+        its output will be written to. Raises ValueError if it can't.
+        """
+        if kind not in KINDS:
+            raise ValueError("Unknown profile kind: %s" % kind)
+        if kind == TRACEMALLOC and tracemalloc is None:
+            raise ValueError("tracemalloc is not available in this Python")
+        if not 0 < duration <= MAX_DURATION:
+            raise ValueError("Profiles last from 1 to %s seconds" % MAX_DURATION)
+        with self.lock:
+            if self.kind is not None:
+                raise ValueError("A %s profile is running already" % self.kind)
+            make_directory(self.directory)
+            self.path = os.path.join(self.directory, '%s-%s-%s%s' % (
+                self.prefix, time.strftime('%Y%m%d-%H%M%S'), kind, EXTENSIONS[kind]))
+            if kind == CPROFILE:
+                self.profile = cProfile.Profile()
+                self.profile.enable()
+            elif kind == SAMPLE:
+                self.profile = Sampler()
+                self.profile.start()
+            else:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.kind = kind
+            self.generation += 1
+            generation = self.generation
+        self.schedule(duration, lambda: self.stop(generation))
+        return self.path
+
+    def stop(self, generation=None):
+        """
+        Writes the output of the running profile, if any, and returns its
+        path. Given a generation, stops only the profile of that generation.
+        """
+        with self.lock:
+            if self.kind is None or generation not in (None, self.generation):
+                return None
+            kind, profile, path = self.kind, self.profile, self.path
+            self.kind = self.profile = None
+            if kind == CPROFILE:
+                profile.disable()
+                profile.dump_stats(path)
+            elif kind == SAMPLE:
+                profile.stop()
+                profile.write(path)
+            else:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                snapshot.dump(path)
+        logger.info("Wrote a %s profile to %s", kind, path)
+        return path
+
+
+def request_path(directory, name):
+    return os.path.join(directory, '%s.request' % name)
+
+
+def request(filepath, kind, duration=DEFAULT_DURATION):
+    """
+    Asks the RequestWatchers of filepath to start a profile of kind, or to
+    stop theirs if kind is STOP.
+    """
+    make_directory(os.path.dirname(filepath))
+    body = {'id': '%r-%s' % (time.time(), os.getpid()), 'kind': kind, 'duration': duration}
+    temporary = '%s.%s.tmp' % (filepath, os.getpid())
+    with io.open(temporary, 'w', encoding='utf-8') as f:
+        f.write('%s' % json.dumps(body))
+    os.rename(temporary, filepath)
+
+
+class RequestWatcher(object):
+    """
+    Checks filepath every interval seconds, from a thread of its own, for
+    requests written by request() after it started, and passes them on to
+    profiler.
+    """
+
+    def __init__(self, profiler, filepath, interval=WATCH_INTERVAL):
+        self.profiler = profiler
+        self.filepath = filepath
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+        # Requests from before this process started are not for it.
+        self.mtime = None
+        self.last_id = None
+        self.read()
+
+    def read(self):
+        """
+        Returns the request in filepath if it is new, else None.
+        """
+        try:
+            mtime = os.path.getmtime(self.filepath)
+            if mtime == self.mtime:
+                return None
+            self.mtime = mtime
+            with io.open(self.filepath, encoding='utf-8') as f:
+                body = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if body.get('id') == self.last_id:
+            return None
+        self.last_id = body.get('id')
+        return body
+
+    def check(self):
+        body = self.read()
+        if body is None:
+            return
+        try:
+            if body.get('kind') == STOP:
+                self.profiler.stop()
+            else:
+                path = self.profiler.start(body.get('kind'),
+                                           body.get('duration') or DEFAULT_DURATION)
+                logger.info("Profiling with %s to %s", body.get('kind'), path)
+        except ValueError as e:
+            logger.warning("Could not start a profile: %s", e)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='profile-requests')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def watch(directory, name=WEB):
+    """
+    Starts watching for profile requests to this process under name, and
+    returns the RequestWatcher.
+    """
+    watcher = RequestWatcher(Profiler(directory, '%s-%s' % (name, os.getpid())),
+                             request_path(directory, name))
+    watcher.start()
+    return watcher
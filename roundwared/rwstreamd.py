@@ -10,7 +10,7 @@ import traceback
 import django
 django.setup()
 
-from roundwared.stream import RoundStream
+from roundwared.stream import RoundStream, SINKS, SINK_FILE
 from roundwared import dbus_receive
 import getopt
 import sys
@@ -28,6 +28,15 @@ options_data = [
     ("longitude", float, False),
     ("audio_format", str, "MP3"),
     ("audio_stream_bitrate", int, 128),
+    # Tag ids to mix from, separated by commas; shared streams get theirs.
+    ("tags", listofint, None),
+    # Where to send the stream: icecast, file (written to --output) or null.
+    ("sink", str, "icecast"),
+    ("output", str, None),
+    # Render as fast as possible instead of in realtime; file and null sinks.
+    ("no_sync",),
+    # Stop the stream after this many seconds.
+    ("duration", int, None),
 ]
 
 # Set specifically since __name__ is __main__
@@ -36,11 +45,15 @@ logger = logging.getLogger('roundwared.rwstreamd')
 
 def main():
     opts = getopts(options_data)
+    if opts["sink"] not in SINKS or (opts["sink"] == SINK_FILE and not opts["output"]):
+        usage(options_data)
     request = cmdline_opts_to_request(opts)
 
     def thunk():
         logger.debug(request)
-        start_stream(opts["session_id"], opts["audio_format"], request)
+        start_stream(opts["session_id"], opts["audio_format"], request,
+                     sink=opts["sink"], location=opts["output"],
+                     sync=not opts["no_sync"], duration=opts["duration"])
 
     if opts["foreground"]:
         thunk()
@@ -48,9 +61,9 @@ def main():
         create_daemon(thunk)
 
 
-def start_stream(sessionid, audio_format, request):
+def start_stream(sessionid, audio_format, request, **sink_options):
     try:
-        stream = RoundStream(sessionid, audio_format, request)
+        stream = RoundStream(sessionid, audio_format, request, **sink_options)
         dbus_receive.add_signal_receiver(stream)
         stream.start()
     except:
@@ -61,6 +74,8 @@ def cmdline_opts_to_request(opts):
     request = {}
     for p in ['project_id', 'session_id', 'latitude', 'longitude', 'audio_stream_bitrate']:
         request[p] = opts[p]
+    if opts['tags']:
+        request['tags'] = opts['tags']
     # logger.debug("cmdline_opts_to_request - session: " + str(request['session_id']))
     return request
 
@@ -0,0 +1,140 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# The random choices an AudioTrack makes when scheduling assets: how much of
+# an asset to play, its fades and volume, the dead air between assets and the
+# stereo pan movements. Kept free of gst so offline renderers and simulators
+# make exactly the same choices as a live stream.
+from __future__ import unicode_literals
+from collections import namedtuple
+import random
+from django.conf import settings
+
+# gst time units, in nanoseconds.
+SECOND = 1000000000
+MSECOND = 1000000
+
+# A section of a recording to play. Times are in nanoseconds, start is the
+# offset into the recording.
+Clip = namedtuple('Clip', ['recording', 'start', 'duration', 'fadein',
+                           'fadeout', 'volume'])
+
+
+def choose_clip(track_settings, recording, rng=random):
+    """
+    Returns the Clip of recording to play with the given Audiotrack settings.
+    """
+    duration = min(
+        recording.audiolength,
+        rng.randint(
+            # FIXME: I don't allow less than a second to
+            # play currently. Mostly because playing zero
+            # is an error. Revisit this.
+            max(track_settings.minduration, SECOND),
+            max(track_settings.maxduration, SECOND)))
+
+    start = rng.randint(0, recording.audiolength - duration)
+
+    fadein = rng.randint(track_settings.minfadeintime,
+                         track_settings.maxfadeintime)
+    fadeout = rng.randint(track_settings.minfadeouttime,
+                          track_settings.maxfadeouttime)
+
+    # FIXME: Instead of doing this divide by two, instead,
+    # decrease them by the same percentage. Remember it's
+    # possible that fade_in != fade_out.
+    if fadein + fadeout > duration:
+        fadein = duration // 2
+        fadeout = duration // 2
+
+    volume = recording.volume * (
+        track_settings.minvolume +
+        rng.random() * (track_settings.maxvolume - track_settings.minvolume))
+
+    return Clip(recording, start, duration, fadein, fadeout, volume)
+
+
+def choose_deadair(track_settings, rng=random):
+    """
+    Returns the silence before the next asset, in milliseconds.
+    """
+    return rng.randint(track_settings.mindeadair,
+                       track_settings.maxdeadair) // MSECOND
+
+
+def choose_fadeout(track_settings, rng=random):
+    """
+    Returns the fade out when skipping an asset, in nanoseconds.
+    """
+    return rng.randint(track_settings.minfadeouttime,
+                       track_settings.maxfadeouttime)
+
+
+def choose_pan_target(track_settings, rng=random):
+    """
+    Returns the next stereo pan position to move to.
+    """
+    pan_step_size = (track_settings.maxpanpos - track_settings.minpanpos) / \
+        settings.NUM_PAN_STEPS
+    target_pan_step = rng.randint(0, settings.NUM_PAN_STEPS)
+    return -1 + target_pan_step * pan_step_size
+
+
+def choose_pan_steps(track_settings, rng=random):
+    """
+    Returns the number of STEREO_PAN_INTERVAL steps to reach the next pan
+    position in.
+    """
+    duration_in_gst_units = rng.randint(track_settings.minpanduration,
+                                        track_settings.maxpanduration)
+    duration_in_miliseconds = duration_in_gst_units // MSECOND
+    return duration_in_miliseconds // settings.STEREO_PAN_INTERVAL
+
+
+def next_track_event(track_settings, now, action, get_recording, rng=random):
+    """
+    Follows the timers of an AudioTrack at now nanoseconds: every second a
+    silent track ('tick') waits a random dead air, then plays a clip of the
+    next recording ('start') until it ends ('end'). get_recording returns the
+    next recording or None. Returns (next time, next action, Clip or None).
+    """
+    # Silent tracks check again on the next second.
+    next_time, next_action, clip = (now // SECOND + 1) * SECOND, 'tick', None
+    if action == 'tick':
+        deadair = choose_deadair(track_settings, rng)
+        next_time, next_action = now + deadair * MSECOND, 'start'
+    elif action == 'start':
+        recording = get_recording()
+        if recording:
+            clip = choose_clip(track_settings, recording, rng)
+            next_time, next_action = now + clip.duration, 'end'
+    return next_time, next_action, clip
+
+
+class Panner:
+    """
+    Moves a stereo pan position towards randomly chosen targets, one step
+    per STEREO_PAN_INTERVAL, like AudioTrack.stereo_pan.
+    """
+
+    def __init__(self, track_settings, rng=random):
+        self.settings = track_settings
+        self.rng = rng
+        self.current_pan_pos = 0
+        self.target_pan_pos = 0
+        self.pan_steps_left = 0
+
+    def step(self):
+        """
+        Advances one step and returns the new pan position, or None if the
+        position didn't change.
+        """
+        if self.current_pan_pos == self.target_pan_pos \
+                or self.pan_steps_left == 0:
+            self.target_pan_pos = choose_pan_target(self.settings, self.rng)
+            self.pan_steps_left = choose_pan_steps(self.settings, self.rng)
+            return None
+        pan_distance = self.target_pan_pos - self.current_pan_pos
+        self.current_pan_pos += pan_distance / self.pan_steps_left
+        self.pan_steps_left -= 1
+        return self.current_pan_pos
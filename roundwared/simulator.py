@@ -0,0 +1,429 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Simulates many listening sessions of a project in one process, to estimate
+# the load streams put on the database for capacity planning. Each virtual
+# session walks a synthetic GPS trajectory and drives a real
+# RecordingCollection, the AudioTrack timers (roundwared.schedule) and the
+# GPSMixer speaker volume decisions, in virtual time and with seeded
+# randomness. No audio is produced: gst elements, speaker streams and
+# Icecast are never touched.
+#
+# The simulated sessions are created in a transaction that is rolled back
+# when the simulation ends.
+from __future__ import unicode_literals, division
+from collections import defaultdict
+import heapq
+import logging
+import math
+import random
+import sys
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from roundware.rw.models import Audiotrack, Project, Session
+from roundwared import db
+from roundwared import gpsmixer
+from roundwared import recording_collection
+from roundwared import schedule
+from roundwared.recording_collection import RecordingCollection
+from roundwared.schedule import SECOND
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+HISTOGRAM_BUCKETS = (0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, float('inf'))
+# Walking speeds, in meters per second.
+MIN_WALKING_SPEED = 1.0
+MAX_WALKING_SPEED = 1.8
+# Standard deviation of a walker's change of heading per move, in degrees.
+HEADING_CHANGE = 30
+METERS_PER_DEGREE = 111320
+
+
+class VirtualGPSMixer(gpsmixer.GPSMixer):
+    """
+    A GPSMixer that makes the same speaker queries and volume decisions,
+    recording the volumes instead of playing speaker streams.
+    """
+
+    def __init__(self, listener, project):
+        # GPSMixer.__init__ builds the adder and blank audio source.
+        gpsmixer.gst.Bin.__init__(self)
+        self.project = project
+        self.listener = listener
+        self.sources = {}
+        self.speakers = {}
+        self.known_speakers = {}
+        self.volumes = {}
+        self.volume_changes = 0
+        always_on = gpsmixer.Speaker.objects.filter(activeyn=True, project=project,
+                                                    minvolume__gt=0)
+        for speaker in always_on:
+            self.speakers[speaker.id] = speaker
+            self.inspect_speaker(speaker)
+
+    def inspect_speaker(self, speaker):
+        # Speaker streams are assumed valid rather than checked over HTTP.
+        return self.known_speakers.setdefault(
+            speaker.id, {'speaker': speaker, 'uri': speaker.uri})
+
+    def set_speaker_volume(self, speaker, volume):
+        if self.volumes.get(speaker.id) != volume:
+            self.volume_changes += 1
+        self.volumes[speaker.id] = volume
+
+    def remove_speaker_from_stream(self, speaker):
+        if self.volumes.pop(speaker.id, None):
+            self.volume_changes += 1
+
+
+class Walker:
+    """
+    A synthetic GPS trajectory: a walk at a steady speed from a random point
+    within radius meters of (latitude, longitude), turning randomly and
+    heading back when it leaves the radius.
+    """
+
+    def __init__(self, latitude, longitude, radius, rng):
+        self.center = (latitude, longitude)
+        self.radius = radius
+        self.rng = rng
+        self.speed = rng.uniform(MIN_WALKING_SPEED, MAX_WALKING_SPEED)
+        self.heading = rng.uniform(0, 360)
+        distance = radius * math.sqrt(rng.random())
+        bearing = rng.uniform(0, 360)
+        self.x = distance * math.sin(math.radians(bearing))
+        self.y = distance * math.cos(math.radians(bearing))
+
+    def position(self):
+        """
+        Returns the current (latitude, longitude).
+        """
+        latitude = self.center[0] + self.y / METERS_PER_DEGREE
+        longitude = self.center[1] + self.x / (
+            METERS_PER_DEGREE * max(math.cos(math.radians(self.center[0])), 0.01))
+        return latitude, longitude
+
+    def walk(self, seconds):
+        """
+        Walks for seconds and returns the new (latitude, longitude).
+        """
+        self.heading += self.rng.gauss(0, HEADING_CHANGE)
+        if math.hypot(self.x, self.y) > self.radius:
+            self.heading = math.degrees(math.atan2(-self.x, -self.y))
+        distance = self.speed * seconds
+        self.x += distance * math.sin(math.radians(self.heading))
+        self.y += distance * math.cos(math.radians(self.heading))
+        return self.position()
+
+
+class VirtualClock:
+    """
+    Seconds since the epoch in simulated time, a stand-in for time.time().
+    """
+
+    def __init__(self, start):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+class OperationStats:
+
+    def __init__(self):
+        self.latencies = []
+        self.queries = 0
+        self.errors = 0
+
+    def report(self, minutes):
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        histogram = [0] * len(HISTOGRAM_BUCKETS)
+        for latency in latencies:
+            for i, bound in enumerate(HISTOGRAM_BUCKETS):
+                if latency * 1000 <= bound:
+                    histogram[i] += 1
+                    break
+        return {
+            'count': count,
+            'per_minute': count / minutes if minutes else 0,
+            'errors': self.errors,
+            'queries': self.queries,
+            'queries_per_call': self.queries / count if count else 0,
+            'mean_ms': sum(latencies) * 1000 / count if count else 0,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': latencies[-1] * 1000 if count else 0,
+            'histogram': [['<=%s' % b if b != float('inf') else '>%s' % HISTOGRAM_BUCKETS[-2], n]
+                          for b, n in zip(HISTOGRAM_BUCKETS, histogram)],
+        }
+
+
+def percentile(ordered, percent):
+    """
+    Returns the nearest-rank percentile of an ordered list, 0 if empty.
+    """
+    if not ordered:
+        return 0
+    rank = int(math.ceil(percent / 100 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+
+def max_rss_mb():
+    """
+    Returns the peak resident memory of the process in MB, None where the
+    resource module is not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, OS X bytes.
+    if sys.platform == 'darwin':
+        rss /= 1024
+    return rss / 1024
+
+
+class VirtualSession:
+
+    def __init__(self, session, walker, audiotracks):
+        self.session = session
+        self.walker = walker
+        self.audiotracks = audiotracks
+        self.rc = None
+        self.mixer = None
+
+    def request(self):
+        latitude, longitude = self.walker.position()
+        return {'session_id': self.session.id,
+                'project_id': self.session.project_id,
+                'latitude': latitude,
+                'longitude': longitude}
+
+    def listener(self):
+        request = self.request()
+        # GPSMixer expects the session_id of a parsed form.
+        request['session_id'] = [self.session.id]
+        return request
+
+
+class Simulator:
+    """
+    Runs sessions virtual listening sessions of a project for a number of
+    simulated seconds. Sessions start spread over the first move interval,
+    then move every move_interval seconds and play assets on every
+    Audiotrack of the project. With the same seed and database, runs make
+    the same choices.
+    """
+
+    def __init__(self, project, sessions=100, seconds=600, seed=0,
+                 move_interval=10, walk_radius=300, check_files=False):
+        if not isinstance(project, Project):
+            project = Project.objects.get(id=project)
+        self.project = project
+        self.sessions = sessions
+        self.seconds = seconds
+        self.seed = seed
+        self.move_interval = move_interval
+        self.walk_radius = walk_radius
+        # Media files are usually not present where simulations run.
+        self.check_files = check_files
+        self.rng = random.Random(seed)
+        self.clock = VirtualClock(time.time())
+        self.operations = defaultdict(OperationStats)
+        self.counters = defaultdict(int)
+
+    def run(self):
+        """
+        Runs the simulation and returns the report.
+        """
+        # RecordingCollection orders assets with the random module.
+        random.seed(self.seed)
+        patched = [(recording_collection, 'time', self.clock),
+                   (db, 'get_recordings', self.counted('get_recordings', db.get_recordings))]
+        originals = [(module, name, getattr(module, name)) for module, name, _ in patched]
+        force_debug_cursor = connection.force_debug_cursor
+        try:
+            for module, name, value in patched:
+                setattr(module, name, value)
+            connection.force_debug_cursor = True
+            with override_settings(TESTING=not self.check_files):
+                with transaction.atomic():
+                    report = self.simulate()
+                    transaction.set_rollback(True)
+        finally:
+            connection.force_debug_cursor = force_debug_cursor
+            for module, name, value in originals:
+                setattr(module, name, value)
+        return report
+
+    def simulate(self):
+        wall_start = time.time()
+        rss_start = max_rss_mb()
+        audiotracks = list(Audiotrack.objects.filter(project=self.project))
+        radius = self.project.recording_radius
+        if radius is None:
+            radius = settings.RECORDING_RADIUS
+
+        # (time, sequence, session, track, action); track is None for
+        # session events. The sequence keeps events at the same time in order.
+        events = []
+        virtual_sessions = []
+        for i in range(self.sessions):
+            session = Session.objects.create(
+                project=self.project, starttime=timezone.now(),
+                device_id='simulator-%s' % i, client_type='simulator',
+                geo_listen_enabled=self.project.geo_listen_enabled)
+            walker = Walker(self.project.latitude, self.project.longitude,
+                            self.walk_radius, random.Random(self.rng.random()))
+            virtual_sessions.append(VirtualSession(session, walker, audiotracks))
+            start = int(self.rng.uniform(0, self.move_interval) * SECOND)
+            events.append((start, len(events), i, None, 'start'))
+        heapq.heapify(events)
+        sequence = len(events)
+        length = self.seconds * SECOND
+        start_time = self.clock.now
+
+        while events and events[0][0] < length:
+            now, _, index, track, action = heapq.heappop(events)
+            self.clock.now = start_time + now / SECOND
+            vs = virtual_sessions[index]
+            if action == 'start':
+                if not self.start_session(vs, radius):
+                    continue
+                for t in range(len(audiotracks)):
+                    heapq.heappush(events, (now + SECOND, sequence, index, t, 'tick'))
+                    sequence += 1
+                next_event = (now + self.move_interval * SECOND, None, 'move')
+            elif action == 'move':
+                self.move(vs)
+                next_event = (now + self.move_interval * SECOND, None, 'move')
+            else:
+                next_time, next_action, clip = schedule.next_track_event(
+                    audiotracks[track], now, action,
+                    lambda: self.call('get_recording', vs.rc.get_recording), self.rng)
+                if clip:
+                    self.counters['clips_played'] += 1
+                next_event = (next_time, track, next_action)
+            heapq.heappush(events, (next_event[0], sequence, index) + next_event[1:])
+            sequence += 1
+
+        self.counters['speaker_volume_changes'] = sum(
+            vs.mixer.volume_changes for vs in virtual_sessions if vs.mixer)
+        return self.report(time.time() - wall_start, rss_start)
+
+    def start_session(self, vs, radius):
+        """
+        Starts the stream of a virtual session, like RoundStream. Returns
+        False if it failed.
+        """
+        request = vs.request()
+        vs.rc = self.call('start_recording_collection', RecordingCollection,
+                          None, request, radius, str(self.project.ordering))
+        if vs.rc is None:
+            return False
+        vs.rc._update_playlist_proximity = self.counted(
+            'playlist_rebuilds', vs.rc._update_playlist_proximity)
+        vs.rc.start()
+        vs.mixer = self.call('start_gps_mixer', VirtualGPSMixer, vs.listener(), self.project)
+        self.move(vs)
+        return True
+
+    def move(self, vs):
+        """
+        Walks a virtual session and sends its new position, like a client
+        calling move_listener.
+        """
+        vs.walker.walk(self.move_interval)
+        if not vs.session.geo_listen_enabled:
+            return
+        request = vs.request()
+        self.call('move_listener', vs.rc.move_listener, request)
+        if vs.mixer:
+            self.call('gps_mixer_move_listener', vs.mixer.move_listener, vs.listener())
+
+    def call(self, name, function, *args):
+        """
+        Calls function and records its wall clock latency and queries as
+        operation name. Returns None if it raised.
+        """
+        stats = self.operations[name]
+        connection.queries_log.clear()
+        started = time.time()
+        result = None
+        try:
+            result = function(*args)
+        except Exception:
+            stats.errors += 1
+            logger.exception("Simulated %s failed", name)
+        stats.latencies.append(time.time() - started)
+        stats.queries += len(connection.queries_log)
+        return result
+
+    def counted(self, name, function):
+        """
+        Wraps function to count its calls, which may be nested in operations.
+        """
+        def wrapper(*args, **kwargs):
+            self.counters[name] += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    def report(self, wall_seconds, rss_start):
+        minutes = self.seconds / 60
+        rss_end = max_rss_mb()
+        return {
+            'project_id': self.project.id,
+            'sessions': self.sessions,
+            'simulated_seconds': self.seconds,
+            'seed': self.seed,
+            'wall_seconds': wall_seconds,
+            'max_rss_mb': rss_end,
+            'rss_growth_mb': rss_end - rss_start if rss_end is not None else None,
+            'queries': sum(stats.queries for stats in self.operations.values()),
+            'operations': dict((name, stats.report(minutes))
+                               for name, stats in self.operations.items()),
+            'counters': dict((name, {'count': count,
+                                     'per_minute': count / minutes if minutes else 0})
+                             for name, count in self.counters.items()),
+        }
+
+
+def format_report(report):
+    """
+    Returns a report as human readable text.
+    """
+    lines = [
+        "Project %(project_id)s: %(sessions)s sessions for %(simulated_seconds)s "
+        "simulated seconds (seed %(seed)s) in %(wall_seconds).1f seconds" % report,
+        "Queries: %s, max RSS: %s MB, RSS growth: %s MB" % (
+            report['queries'],
+            '%.1f' % report['max_rss_mb'] if report['max_rss_mb'] is not None else '?',
+            '%.1f' % report['rss_growth_mb'] if report['rss_growth_mb'] is not None else '?'),
+        "",
+        "%-28s %8s %9s %7s %8s %8s %8s %8s %6s" % (
+            'operation', 'count', '/minute', 'q/call', 'p50 ms', 'p95 ms',
+            'p99 ms', 'max ms', 'errors'),
+    ]
+    for name, op in sorted(report['operations'].items()):
+        lines.append("%-28s %8d %9.1f %7.1f %8.2f %8.2f %8.2f %8.2f %6d" % (
+            name, op['count'], op['per_minute'], op['queries_per_call'],
+            op['p50_ms'], op['p95_ms'], op['p99_ms'], op['max_ms'], op['errors']))
+    lines.append("")
+    lines.append("%-28s %8s %9s" % ('counter', 'count', '/minute'))
+    for name, counter in sorted(report['counters'].items()):
+        lines.append("%-28s %8d %9.1f" % (name, counter['count'], counter['per_minute']))
+    lines.append("")
+    lines.append("Latency histograms (ms bucket: calls)")
+    for name, op in sorted(report['operations'].items()):
+        lines.append("%-28s %s" % (name, '  '.join(
+            '%s: %s' % (bucket, n) for bucket, n in op['histogram'] if n)))
+    return '\n'.join(lines)
@@ -10,14 +10,20 @@ import pygst
 pygst.require("0.10")
 import gst
 import logging
+import os
 import time
 import urllib
 from django.conf import settings
+from django.db import connection
 from roundware.rw import models
+from roundware.lib import db_metrics, liveness, shared_streams
 from roundware.lib.api import log_event
 from roundwared.audiotrack import AudioTrack
 from roundwared import icecast2
 from roundwared import gpsmixer
+from roundwared import metrics
+from roundwared import profiler
+from roundwared import watchdog
 from roundwared.recording_collection import RecordingCollection
 
 logger = logging.getLogger(__name__)
@@ -25,12 +31,29 @@ logger = logging.getLogger(__name__)
 STATE_PAUSED = 0
 STATE_PLAYING = 1
 
+# Where RoundStreamSink sends the encoded stream.
+SINK_ICECAST = 'icecast'
+SINK_FILE = 'file'
+SINK_NULL = 'null'
+SINKS = (SINK_ICECAST, SINK_FILE, SINK_NULL)
+
+
+def call_later(seconds, callback):
+    # Schedules on the main loop, for the Profiler: cProfile must be stopped
+    # by the thread it profiles.
+    def once():
+        callback()
+        return False
+    gobject.timeout_add(int(seconds * 1000), once)
+
+
 class RoundStream:
     ######################################################################
     # PUBLIC
     ######################################################################
 
-    def __init__(self, sessionid, audio_format, request):
+    def __init__(self, sessionid, audio_format, request, sink=SINK_ICECAST,
+                 location=None, sync=True, duration=None):
         self.audiotracks = []
         self.sessionid = sessionid
         self.request = request
@@ -39,6 +62,12 @@ class RoundStream:
         session = models.Session.objects.select_related(
             'project').get(id=sessionid)
         self.project = session.project
+        self.start_time = time.time()
+        self.metrics = metrics.StreamMetrics(sessionid, self.project.id)
+        self.metrics.add_collector(self.collect_metrics)
+        self.metrics_path = None
+        if settings.STREAM_METRICS_DIR:
+            self.metrics_path = metrics.path(settings.STREAM_METRICS_DIR, sessionid)
         if session.geo_listen_enabled and (
                         self.request.get('latitude') is False or self.request.get('longitude') is False):
             raise Exception("Lat and Lon not provided for geo_listen project, {}".format(self.project.name))
@@ -47,6 +76,8 @@ class RoundStream:
         self.ordering = self.project.ordering
         # Keeps track of whether the stream has started playing audio.
         self.started = False
+        # Whether the stream is connected to Icecast and can be listened to.
+        self.is_ready = False
         self.state = STATE_PAUSED
 
         logger.debug("Project radius: %d meters" % self.radius)
@@ -56,8 +87,18 @@ class RoundStream:
         # TODO - Why is this stored as listener and as request?
         self.listener = request
         self.audio_format = audio_format
+        # Sink options, see RoundStreamSink. The stream is stopped after
+        # duration seconds if set.
+        self.sink_type = sink
+        self.sink_location = location
+        self.sink_sync = sync
+        self.duration = duration
         self.last_listener_count = 1
         self.gps_mixer = None
+        self.sink = None
+        self.stall_detector = None
+        self.profiler = profiler.Profiler(settings.PROFILE_DIR, 'stream-%s' % sessionid,
+                                          call_later)
         self.main_loop = gobject.MainLoop()
         self.icecast_admin = icecast2.Admin()
         self.heartbeat()
@@ -69,7 +110,11 @@ class RoundStream:
 
         self.pipeline = gst.Pipeline()
         self.adder = gst.element_factory_make("adder")
-        self.sink = RoundStreamSink(self.sessionid, self.audio_format, self.bitrate)
+        # Only streams sent to Icecast have a mount to wait for.
+        on_connected = self.connected if self.sink_type == SINK_ICECAST else None
+        self.sink = RoundStreamSink(self.sessionid, self.audio_format, self.bitrate,
+                                    on_connected, self.sink_type,
+                                    self.sink_location, self.sink_sync)
         self.set_metadata({'stream_started': True})
         self.pipeline.add(self.adder, self.sink)
         self.adder.link(self.sink)
@@ -80,6 +125,20 @@ class RoundStream:
 
         self.pipeline.set_state(gst.STATE_PLAYING)
         gobject.timeout_add(settings.STEREO_PAN_INTERVAL, self.stereo_pan)
+        # Count the queries of the stream, see collect_metrics().
+        db_metrics.measure(connection)
+        metrics.begin_tally()
+        gobject.timeout_add(metrics.LAG_PROBE_INTERVAL,
+                            metrics.LagProbe(self.metrics.main_loop_lag_seconds))
+        if self.metrics_path:
+            gobject.timeout_add(settings.STREAM_METRICS_INTERVAL, self.export_metrics)
+        if settings.STREAM_STALL_THRESHOLD:
+            self.stall_detector = watchdog.StallDetector(
+                settings.STREAM_STALL_THRESHOLD, self.log_stall, self.record_stall)
+            gobject.timeout_add(watchdog.TICK_INTERVAL, self.stall_detector.tick)
+            self.stall_detector.start()
+        if self.duration:
+            gobject.timeout_add_seconds(self.duration, self.stop)
         logger.debug("starting main loop!")
         self.main_loop.run()
 
@@ -117,6 +176,28 @@ class RoundStream:
     def heartbeat(self):
         self.activity_timestamp = time.time()
 
+    # Called from the sink's streaming thread once shout2send is connected.
+    def connected(self):
+        gobject.idle_add(self.ready)
+
+    def ready(self):
+        """
+        Publishes that the stream is playing and connected to Icecast, so
+        request_stream can return its URL.
+        """
+        logger.info("Session %s - Stream ready", self.sessionid)
+        self.is_ready = True
+        self.publish_ready()
+        self.icecast_admin.add_mount(
+            icecast2.mount_point(self.sessionid, self.audio_format))
+        return False
+
+    def publish_ready(self):
+        # Refreshed on every ping, so the status expires if the stream dies.
+        icecast2.set_stream_status(
+            icecast2.mount_point(self.sessionid, self.audio_format),
+            icecast2.STREAM_READY, settings.PING_INTERVAL * 2 // 1000)
+
     # Sets the stream metadata using tag injection.
     def set_metadata(self, query):
         metadata = 'artist="Roundware",title="%s"' % urllib.urlencode(query)
@@ -172,6 +253,18 @@ class RoundStream:
         self.recordingCollection._generate_user_blocked_list()
         self.skip_ahead()
 
+    def profile(self, request):
+        kind = request.get('kind')
+        if kind == profiler.STOP:
+            self.profiler.stop()
+            return
+        try:
+            path = self.profiler.start(kind, request.get('duration') or profiler.DEFAULT_DURATION)
+        except (ValueError, IOError, OSError) as e:
+            logger.warning("Session %s - Could not start a profile: %s", self.sessionid, e)
+            return
+        logger.info("Session %s - Profiling with %s to %s", self.sessionid, kind, path)
+
     ######################################################################
     # PRIVATE
     ######################################################################
@@ -255,6 +348,13 @@ class RoundStream:
     def cleanup(self):
         log_event("cleanup_session", self.sessionid)
         logger.info("Session %d - Stream cleanup", self.sessionid)
+        icecast2.clear_stream_status(
+            icecast2.mount_point(self.sessionid, self.audio_format))
+        if self.metrics_path:
+            metrics.remove(self.metrics_path)
+        if self.stall_detector:
+            self.stall_detector.stop()
+        self.profiler.stop()
 
         if self.pipeline:
             if self.watch_id:
@@ -264,21 +364,71 @@ class RoundStream:
             self.pipeline.set_state(gst.STATE_NULL)
         self.main_loop.quit()
 
+    def stop(self):
+        logger.info("Session %s - Stream duration of %s seconds reached",
+                    self.sessionid, self.duration)
+        self.cleanup()
+        return False
+
+    def export_metrics(self):
+        try:
+            metrics.write(self.metrics, self.metrics_path)
+        except (IOError, OSError) as e:
+            logger.warning("Session %s - Could not write metrics: %s", self.sessionid, e)
+        return True
+
+    def log_stall(self, stall):
+        # Called from the stall detector thread while the main loop is stalled.
+        logger.warning("Session %s - Main loop stalled for %.2f seconds in %s:\n%s",
+                       self.sessionid, stall.duration, stall.where, stall.stack)
+
+    def record_stall(self, stall):
+        logger.info("Session %s - Main loop stall in %s lasted %.2f seconds",
+                    self.sessionid, stall.where, stall.duration)
+        self.metrics.main_loop_stalls.inc(stall.where)
+        self.metrics.main_loop_stall_seconds.observe(stall.duration)
+
+    def collect_metrics(self):
+        # The queries of this (the main) thread since the last collection.
+        tally = metrics.end_tally()
+        metrics.begin_tally()
+        self.metrics.db_queries.inc(int(tally.get('db_queries', 0)))
+        self.metrics.db_query_seconds.inc(tally.get('db_query_seconds', 0))
+
+        self.metrics.playlist_assets.set(self.recordingCollection.count())
+        self.metrics.assets.set(len(self.recordingCollection.all))
+        for track in self.audiotracks:
+            track.update_dead_air()
+        if self.gps_mixer:
+            self.metrics.speakers.set(self.gps_mixer.count_playing_speakers())
+        if self.sink:
+            self.metrics.encoder_buffer_seconds.set(self.sink.buffer_level())
+        times = os.times()
+        self.metrics.cpu_seconds.set(times[0] + times[1])
+        self.metrics.uptime_seconds.set(time.time() - self.start_time)
+
     def stereo_pan(self):
         for track in self.audiotracks:
             track.stereo_pan()
         return True
 
     def ping(self):
-        is_stream_active = self.is_anyone_listening() or self.is_activity_timestamp_recent()
+        # Shared streams stop once all of their sessions left.
+        is_stream_active = shared_streams.listeners(self.sessionid) != 0 and \
+            (self.is_anyone_listening() or self.is_activity_timestamp_recent())
 
         if is_stream_active:
+            if self.is_ready:
+                self.publish_ready()
             return True
 
         self.cleanup()
         return False
 
     def is_anyone_listening(self):
+        # Only Icecast streams have listeners.
+        if self.sink_type != SINK_ICECAST:
+            return False
         mount_point = icecast2.mount_point(self.sessionid, self.audio_format)
         listeners = self.icecast_admin.get_client_count(mount_point)
         logger.debug("Number of listeners: %d " % listeners)
@@ -289,6 +439,10 @@ class RoundStream:
         return True
 
     def is_activity_timestamp_recent(self):
+        # Heartbeats aren't signalled, see roundware.lib.liveness.
+        last_seen = liveness.stream_last_seen(self.sessionid)
+        if last_seen is not None and last_seen > self.activity_timestamp:
+            self.activity_timestamp = last_seen
         # logger.debug("check now=" + str(time.time()) \
         #   + " time=" + str(self.activity_timestamp) \
         #   + " diff=" + str(time.time() - self.activity_timestamp))
@@ -311,21 +465,40 @@ class BlankAudioSrc(gst.Bin):
 
 
 class RoundStreamSink(gst.Bin):
-    def __init__(self, sessionid, audio_format, bitrate):
+    """
+    Encodes the mix and sends it to Icecast (SINK_ICECAST), writes it to the
+    file at location (SINK_FILE) or discards it (SINK_NULL). File and null
+    sinks need no Icecast server, and render faster than realtime if sync
+    is False.
+    """
+    def __init__(self, sessionid, audio_format, bitrate, on_connected=None,
+                 sink=SINK_ICECAST, location=None, sync=True):
         gst.Bin.__init__(self)
+        self.on_connected = on_connected
+        self.buffer_count = 0
 
         capsfilter = gst.element_factory_make("capsfilter")
         volume = gst.element_factory_make("volume")
         volume.set_property("volume", settings.MASTER_VOLUME)
         # Create Metatag Injector
         self.taginjector = gst.element_factory_make("taginject")
-        shout2send = gst.element_factory_make("shout2send")
-        shout2send.set_property("username", settings.ICECAST_SOURCE_USERNAME)
-        shout2send.set_property("password", settings.ICECAST_SOURCE_PASSWORD)
-        shout2send.set_property("mount",
-                                icecast2.mount_point(sessionid, audio_format))
+        if sink == SINK_ICECAST:
+            outputsink = gst.element_factory_make("shout2send")
+            outputsink.set_property("username", settings.ICECAST_SOURCE_USERNAME)
+            outputsink.set_property("password", settings.ICECAST_SOURCE_PASSWORD)
+            outputsink.set_property("mount",
+                                    icecast2.mount_point(sessionid, audio_format))
+        elif sink == SINK_FILE:
+            outputsink = gst.element_factory_make("filesink")
+            outputsink.set_property("location", location)
+            outputsink.set_property("sync", sync)
+        elif sink == SINK_NULL:
+            outputsink = gst.element_factory_make("fakesink")
+            outputsink.set_property("sync", sync)
+        else:
+            raise Exception("Invalid sink: %s" % sink)
 
-        self.add(capsfilter, volume, self.taginjector, shout2send)
+        self.add(capsfilter, volume, self.taginjector, outputsink)
         capsfilter.link(volume)
 
         if audio_format.upper() == "MP3":
@@ -337,7 +510,7 @@ class RoundStreamSink(gst.Bin):
             lame.set_property("bitrate", int(bitrate))
             logger.debug("roundstreamsink: bitrate: " + str(bitrate))
             self.add(lame)
-            gst.element_link_many(volume, lame, self.taginjector, shout2send)
+            gst.element_link_many(volume, lame, self.taginjector, outputsink)
         elif audio_format.upper() == "OGG":
             capsfilter.set_property(
                 "caps",
@@ -346,10 +519,40 @@ class RoundStreamSink(gst.Bin):
             vorbisenc = gst.element_factory_make("vorbisenc")
             oggmux = gst.element_factory_make("oggmux")
             self.add(vorbisenc, oggmux)
-            gst.element_link_many(volume, vorbisenc, oggmux, self.taginjector, shout2send)
+            gst.element_link_many(volume, vorbisenc, oggmux, self.taginjector, outputsink)
         else:
             raise "Invalid format"
 
+        # The stream is ready once the sink has rendered its first buffer,
+        # which for shout2send is when it connects to Icecast. So the second
+        # buffer only arrives once the mount is connected.
+        if on_connected:
+            pad = outputsink.get_pad("sink")
+            self.probe_id = pad.add_buffer_probe(self.buffer_probe)
+
         pad = capsfilter.get_pad("sink")
         ghostpad = gst.GhostPad("sink", pad)
         self.add_pad(ghostpad)
+
+    def buffer_level(self):
+        """
+        Returns the seconds of audio mixed but not yet played: how far the
+        position of the mixer is ahead of the running time of the pipeline.
+        """
+        clock = self.get_clock()
+        peer = self.get_pad("sink").get_peer()
+        if clock is None or peer is None:
+            return 0.0
+        try:
+            position, _ = peer.query_position(gst.FORMAT_TIME)
+        except gst.QueryError:
+            return 0.0
+        running = clock.get_time() - self.get_base_time()
+        return max(position - running, 0) / float(gst.SECOND)
+
+    def buffer_probe(self, pad, buffer):
+        self.buffer_count += 1
+        if self.buffer_count == 2:
+            pad.remove_buffer_probe(self.probe_id)
+            self.on_connected()
+        return True
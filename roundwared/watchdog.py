@@ -0,0 +1,114 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+# Detects stalls of the gobject main loop all stream control runs on. A main
+# loop timer ticks every TICK_INTERVAL; a watchdog thread checks the ticks and,
+# once one is threshold late, captures the Python stack of the main loop
+# thread, which is the code blocking it. The stack is captured once per
+# stall, so the overhead is a timer and a thread that wakes a few times per
+# tick.
+from __future__ import unicode_literals, division
+from collections import deque, namedtuple
+import os
+import sys
+import threading
+import time
+import traceback
+
+# Milliseconds between main loop ticks.
+TICK_INTERVAL = 100
+# Recent stalls kept by a StallDetector.
+RECENT_STALLS = 20
+# The directory of the roundware-server code, whose frames are blamed for
+# stalls rather than the library code they call.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# started is a time.time(), duration in seconds, where is "path:function" of
+# the blamed frame and stack the formatted stack.
+Stall = namedtuple('Stall', ['started', 'duration', 'where', 'stack'])
+
+
+def blame(frames, root=ROOT):
+    """
+    Returns "path:function" of the innermost frame of a traceback.extract_stack()
+    list that is in the root directory, or of the innermost frame if none is.
+    """
+    if not frames:
+        return 'unknown'
+    blamed = frames[-1]
+    for frame in reversed(frames):
+        if frame[0].startswith(root + os.sep):
+            blamed = frame
+            break
+    filename = blamed[0]
+    if filename.startswith(root + os.sep):
+        filename = os.path.relpath(filename, root)
+    return '%s:%s' % (filename, blamed[2])
+
+
+class StallDetector(object):
+    """
+    Watches the main loop of the thread that creates it. Schedule tick()
+    every TICK_INTERVAL milliseconds on the main loop and call start().
+    threshold is in milliseconds. on_stall(stall) is called from the
+    watchdog thread once a stall is detected, with the duration so far, and
+    on_recover(stall) from the main loop once it is over, with the whole
+    duration.
+    """
+
+    def __init__(self, threshold, on_stall=None, on_recover=None,
+                 interval=TICK_INTERVAL, clock=time.time):
+        self.threshold = threshold / 1000
+        self.interval = interval / 1000
+        self.on_stall = on_stall
+        self.on_recover = on_recover
+        self.clock = clock
+        self.thread_id = threading.current_thread().ident
+        self.last_tick = clock()
+        self.stall = None
+        self.stalls = deque(maxlen=RECENT_STALLS)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def tick(self):
+        now = self.clock()
+        stall = self.stall
+        if stall is not None:
+            self.stall = None
+            stall = stall._replace(duration=now - stall.started)
+            self.stalls.append(stall)
+            if self.on_recover:
+                self.on_recover(stall)
+        self.last_tick = now
+        return True
+
+    def check(self):
+        """
+        Captures the main loop thread's stack if it is stalled and the stall
+        has not been captured yet. Returns the new Stall, if any.
+        """
+        now = self.clock()
+        last_tick = self.last_tick
+        if self.stall is not None or now - last_tick - self.interval < self.threshold:
+            return None
+        frame = sys._current_frames().get(self.thread_id)
+        frames = traceback.extract_stack(frame) if frame is not None else []
+        started = last_tick + self.interval
+        stall = Stall(started, now - started, blame(frames),
+                      ''.join(traceback.format_list(frames)))
+        self.stall = stall
+        if self.on_stall:
+            self.on_stall(stall)
+        return stall
+
+    def run(self):
+        while not self.stopped.wait(self.interval / 2):
+            self.check()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='stall-detector')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# Compares reading audio lengths with roundware.lib.audioinfo against the
+# mediainfo subprocess used before.
+# Usage: ./benchmark-audioinfo.py [media directory]
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from roundware.lib import audioinfo
+
+MEDIA_ROOT = sys.argv[1] if len(sys.argv) > 1 else '/var/www/roundware/rwmedia/'
+
+
+def mediainfo_duration(filepath):
+    cmd = ['mediainfo', '--Inform=General;%Duration%', filepath]
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output, error = p.communicate()
+    output = output.strip()
+    if output:
+        return int(output) * 1000000
+    return None
+
+start = time.time()
+probed = list(audioinfo.probe_directory(MEDIA_ROOT))
+audioinfo_time = time.time() - start
+print("audioinfo: %d files in %.3f seconds" % (len(probed), audioinfo_time))
+
+start = time.time()
+mediainfo = [(filepath, mediainfo_duration(filepath)) for filepath, info in probed]
+mediainfo_time = time.time() - start
+print("mediainfo: %d files in %.3f seconds" % (len(mediainfo), mediainfo_time))
+
+if audioinfo_time > 0:
+    print("Speedup: %.1fx" % (mediainfo_time / audioinfo_time))
+
+# Report files where the two methods disagree by more than 100ms.
+for (filepath, info), (_, duration) in zip(probed, mediainfo):
+    if info is None or duration is None:
+        print("Unreadable: %s audioinfo=%s mediainfo=%s" % (filepath, info, duration))
+    elif abs(info.duration - duration) > 100000000:
+        print("Different: %s audioinfo=%.3fs mediainfo=%.3fs" %
+              (filepath, info.duration / 1e9, duration / 1e9))
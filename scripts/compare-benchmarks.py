@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# Compares two result files of the benchmark_roundwared management command,
+# e.g. from two commits, and lists the median latency change of every
+# benchmark. Exits with status 1 if any benchmark got slower than the
+# threshold ratio.
+# Usage: ./compare-benchmarks.py before.json after.json [threshold, default 1.25]
+from __future__ import division, print_function
+import json
+import sys
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: ./compare-benchmarks.py before.json after.json [threshold]")
+        sys.exit(2)
+    with open(sys.argv[1]) as f:
+        before = json.load(f)
+    with open(sys.argv[2]) as f:
+        after = json.load(f)
+    threshold = float(sys.argv[3]) if len(sys.argv) > 3 else 1.25
+
+    print("%s -> %s" % (before['revision'], after['revision']))
+    regressions = 0
+    for size, results in sorted(after['results'].items(), key=lambda r: int(r[0])):
+        print("")
+        print("%s assets" % size)
+        print("  %-52s %10s %10s %7s %9s" % ('benchmark', 'before ms', 'after ms',
+                                              'ratio', 'queries'))
+        for name, result in sorted(results.items()):
+            previous = before['results'].get(size, {}).get(name)
+            if previous is None:
+                print("  %-52s %10s %10.3f" % (name, '-', result['median'] * 1000))
+                continue
+            ratio = result['median'] / previous['median'] if previous['median'] else 1
+            flag = ''
+            if ratio > threshold:
+                flag = '  SLOWER'
+                regressions += 1
+            print("  %-52s %10.3f %10.3f %7.2f %4.1f->%-4.1f%s" % (
+                name, previous['median'] * 1000, result['median'] * 1000, ratio,
+                previous['queries'], result['queries'], flag))
+    if regressions:
+        print("")
+        print("%s benchmarks slower than %.2fx" % (regressions, threshold))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# Renders one clip of a WAV file through the gst elements a live stream uses
+# (SrcWavFile, as played by AudioTrack) and with roundwared.offline_mixer, and
+# prints how far apart the two renders are.
+# Usage: ./compare-offline-mix.py file.wav [start duration fadein fadeout volume pan]
+#   times in seconds, defaults: 0 5 1 1 1.0 0.0
+from __future__ import division
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "roundware.settings")
+import django
+django.setup()
+
+import numpy
+
+from roundwared import gst_render, offline_mixer
+from roundwared.schedule import Clip, SECOND
+
+
+def strip_silence(samples):
+    sounding = numpy.nonzero(numpy.abs(samples).max(axis=1) > 1)[0]
+    return samples[sounding[0]:] if len(sounding) else samples
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: ./compare-offline-mix.py file.wav "
+              "[start duration fadein fadeout volume pan]")
+        sys.exit(2)
+    filepath = os.path.abspath(sys.argv[1])
+    args = [float(a) for a in sys.argv[2:]]
+    start, duration, fadein, fadeout, volume, pan_pos = \
+        args + [0, 5, 1, 1, 1.0, 0.0][len(args):]
+    clip = Clip(None, int(start * SECOND), int(duration * SECOND),
+                int(fadein * SECOND), int(fadeout * SECOND), volume)
+
+    fd, output = tempfile.mkstemp(suffix='.wav')
+    os.close(fd)
+    try:
+        gst_render.render_clip(filepath, clip, pan_pos, output)
+        gst_samples = offline_mixer.read_wav(output) * 32768
+    finally:
+        os.remove(output)
+    numpy_samples = offline_mixer.render_clip(
+        offline_mixer.read_wav(filepath), clip, pan_pos) * 32768
+
+    # gst may render a few silent frames before seeking to the clip.
+    gst_samples = strip_silence(gst_samples)
+    numpy_samples = strip_silence(numpy_samples)
+    frames = min(len(gst_samples), len(numpy_samples))
+    difference = gst_samples[:frames] - numpy_samples[:frames]
+    rms = numpy.sqrt(numpy.mean(numpy_samples[:frames] ** 2))
+    rms_difference = numpy.sqrt(numpy.mean(difference ** 2))
+    print("gst frames:            %d" % len(gst_samples))
+    print("offline_mixer frames:  %d" % len(numpy_samples))
+    print("max difference:        %.1f (int16)" % numpy.abs(difference).max())
+    print("rms difference:        %.1f dB below signal" %
+          (20 * numpy.log10(rms / rms_difference) if rms_difference else float('inf')))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,463 @@
+#!/usr/bin/env python
+# Simulates concurrent clients of the Roundware HTTP API and reports latency
+# percentiles and error rates per operation.
+#
+# Clients arrive at --rate per second until --clients have started. Each one
+# goes through the lifecycle of a listening app for --session-length seconds:
+#   api 1: get_config, request_stream, then heartbeat, move_listener along a
+#          walk, modify_stream, uploads (create_envelope and
+#          add_asset_to_envelope) and vote_asset.
+#   api 2: users, sessions, streams, then streams/:id/heartbeat/, stream
+#          moves, stream tag changes, uploads (envelopes) and assets/:id/votes/.
+#
+# To run everything on one machine, start the server with the stand-in
+# settings, which start no stream processes and send no dbus signals:
+#   DJANGO_SETTINGS_MODULE=roundware.settings.loadtest ./manage.py runserver 8888
+# This script serves the Icecast admin status for the streams it requests on
+# --icecast-port, the port the stand-in settings point to.
+#
+# Usage: ./load-test.py --project 1 [--api 2] [--clients 50] [--rate 1]
+#   see ./load-test.py --help for all options.
+from __future__ import division, print_function
+import argparse
+import BaseHTTPServer
+import io
+import json
+import math
+import random
+import struct
+import threading
+import time
+import urlparse
+import uuid
+import wave
+
+import requests
+
+# Seconds between checks of a client's timers.
+TICK = 0.1
+
+
+class Mounts:
+    """
+    The mounts of the streams clients requested, each with one listener.
+    """
+
+    def __init__(self):
+        self.mounts = set()
+        self.lock = threading.Lock()
+
+    def add(self, mount):
+        with self.lock:
+            self.mounts.add(mount)
+
+    def stats(self):
+        with self.lock:
+            mounts = sorted(self.mounts)
+        sources = ''.join('<source mount="%s"><listeners>1</listeners></source>' % m
+                          for m in mounts)
+        return '<?xml version="1.0"?><icestats>%s</icestats>' % sources
+
+
+class IcecastStandin(BaseHTTPServer.HTTPServer):
+    """
+    Serves /admin/stats like Icecast, for the given Mounts.
+    """
+
+    def __init__(self, port, mounts):
+        BaseHTTPServer.HTTPServer.__init__(self, ('', port), IcecastStandinHandler)
+        self.mounts = mounts
+
+
+class IcecastStandinHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] in ('/admin/stats', '/admin/listmounts'):
+            body = self.server.mounts.stats()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/xml')
+        else:
+            body = 'Not found'
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Stats:
+    """
+    Latencies and errors per operation, shared by all clients.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.error_samples = {}
+
+    def record(self, operation, latency, error=None):
+        with self.lock:
+            self.latencies.setdefault(operation, []).append(latency)
+            if error:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+                self.error_samples.setdefault(operation, error)
+
+    def report(self, wall_seconds):
+        lines = ["%-24s %7s %7s %8s %8s %8s %8s %7s" % (
+            'operation', 'count', '/sec', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms',
+            'errors')]
+        with self.lock:
+            for operation in sorted(self.latencies):
+                latencies = sorted(self.latencies[operation])
+                count = len(latencies)
+                errors = self.errors.get(operation, 0)
+                lines.append("%-24s %7d %7.2f %8.1f %8.1f %8.1f %8.1f %6.1f%%" % (
+                    operation, count, count / wall_seconds,
+                    percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000,
+                    percentile(latencies, 99) * 1000, latencies[-1] * 1000,
+                    100 * errors / count))
+            if self.error_samples:
+                lines.append("")
+                lines.append("First error per operation:")
+                for operation, error in sorted(self.error_samples.items()):
+                    lines.append("  %s: %s" % (operation, error[:200]))
+        return '\n'.join(lines)
+
+    def as_dict(self, wall_seconds):
+        with self.lock:
+            result = {}
+            for operation, latencies in self.latencies.items():
+                latencies = sorted(latencies)
+                result[operation] = {
+                    'count': len(latencies),
+                    'per_second': len(latencies) / wall_seconds,
+                    'errors': self.errors.get(operation, 0),
+                    'p50': percentile(latencies, 50),
+                    'p95': percentile(latencies, 95),
+                    'p99': percentile(latencies, 99),
+                    'max': latencies[-1],
+                }
+            return result
+
+
+def percentile(ordered, percent):
+    rank = int(math.ceil(percent / 100 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+
+def silent_wav(seconds=1, rate=22050):
+    data = io.BytesIO()
+    w = wave.open(data, 'wb')
+    w.setnchannels(1)
+    w.setsampwidth(2)
+    w.setframerate(rate)
+    w.writeframes(struct.pack(b'<h', 0) * int(seconds * rate))
+    w.close()
+    return data.getvalue()
+
+
+class Walk:
+    """
+    A random walk at walking speed around a starting point.
+    """
+
+    def __init__(self, latitude, longitude, radius, rng):
+        self.rng = rng
+        self.latitude = latitude + rng.uniform(-radius, radius) / 111320
+        self.longitude = longitude + rng.uniform(-radius, radius) / (
+            111320 * max(math.cos(math.radians(latitude)), 0.01))
+        self.heading = rng.uniform(0, 2 * math.pi)
+
+    def step(self, seconds):
+        self.heading += self.rng.gauss(0, 0.5)
+        meters = 1.4 * seconds
+        self.latitude += meters * math.cos(self.heading) / 111320
+        self.longitude += meters * math.sin(self.heading) / (
+            111320 * max(math.cos(math.radians(self.latitude)), 0.01))
+        return self.latitude, self.longitude
+
+
+class Client:
+    """
+    One simulated listener. Subclasses implement the API calls.
+    """
+
+    def __init__(self, options, stats, mounts, rng):
+        self.options = options
+        self.stats = stats
+        self.mounts = mounts
+        self.rng = rng
+        self.http = requests.Session()
+        self.device_id = str(uuid.uuid4())
+        self.session_id = None
+        self.walk = None
+        self.tags = options.tags
+
+    def call(self, operation, method, path, **kwargs):
+        """
+        Makes a request and records its latency. Returns the decoded JSON
+        response, or None on errors.
+        """
+        started = time.time()
+        error = None
+        result = None
+        try:
+            response = self.http.request(method, self.options.server + path,
+                                         timeout=self.options.timeout, **kwargs)
+            if response.status_code >= 400:
+                error = "HTTP %s %s" % (response.status_code, response.text)
+            elif response.content:
+                result = response.json()
+                if isinstance(result, dict) and 'error_message' in result:
+                    error = result['error_message']
+                    result = None
+        except (requests.RequestException, ValueError) as e:
+            error = str(e)
+        self.stats.record(operation, time.time() - started, error)
+        return result if not error else None
+
+    def stream_started(self, response):
+        # Let the Icecast stand-in report the stream as listened to.
+        if response and 'stream_url' in response:
+            self.mounts.add(urlparse.urlparse(response['stream_url']).path)
+
+    def run(self):
+        if not self.start():
+            return
+        options = self.options
+        now = time.time()
+        end = now + options.session_length
+        timers = {
+            'heartbeat': now + options.heartbeat_interval,
+            'move': now + options.move_interval,
+            'modify': now + self.exponential(options.modify_interval),
+            'upload': now + self.exponential(options.upload_interval),
+            'vote': now + self.exponential(options.vote_interval),
+        }
+        while time.time() < end:
+            now = time.time()
+            for action, due in sorted(timers.items(), key=lambda t: t[1]):
+                if due > now:
+                    continue
+                if action == 'heartbeat':
+                    self.heartbeat()
+                    timers[action] = now + options.heartbeat_interval
+                elif action == 'move':
+                    self.move(*self.walk.step(options.move_interval))
+                    timers[action] = now + options.move_interval
+                elif action == 'modify':
+                    if self.tags:
+                        self.modify(','.join(self.rng.sample(
+                            self.tags, self.rng.randint(1, len(self.tags)))))
+                    timers[action] = now + self.exponential(options.modify_interval)
+                elif action == 'upload':
+                    self.upload()
+                    timers[action] = now + self.exponential(options.upload_interval)
+                elif action == 'vote':
+                    self.vote()
+                    timers[action] = now + self.exponential(options.vote_interval)
+            time.sleep(TICK)
+
+    def exponential(self, interval):
+        """
+        Returns the time to the next of events happening every interval
+        seconds on average, never if interval is 0.
+        """
+        if not interval:
+            return float('inf')
+        return self.rng.expovariate(1 / interval)
+
+    def start_walk(self, latitude, longitude):
+        self.walk = Walk(float(latitude), float(longitude), self.options.walk_radius,
+                         self.rng)
+
+
+class Api1Client(Client):
+
+    def get(self, operation, **params):
+        params['operation'] = operation
+        return self.call(operation, 'GET', '/api/1/', params=params)
+
+    def start(self):
+        config = self.get('get_config', project_id=self.options.project,
+                          device_id=self.device_id, client_type='load-test')
+        if not config:
+            return False
+        for section in config:
+            if 'session' in section:
+                self.session_id = section['session']['session_id']
+            elif 'project' in section:
+                self.start_walk(section['project']['latitude'],
+                                section['project']['longitude'])
+        latitude, longitude = self.walk.step(0)
+        self.stream_started(self.get('request_stream', session_id=self.session_id,
+                                     latitude=latitude, longitude=longitude))
+        return True
+
+    def heartbeat(self):
+        self.get('heartbeat', session_id=self.session_id)
+
+    def move(self, latitude, longitude):
+        self.get('move_listener', session_id=self.session_id,
+                 latitude=latitude, longitude=longitude)
+
+    def modify(self, tags):
+        self.get('modify_stream', session_id=self.session_id, tags=tags)
+
+    def upload(self):
+        envelope = self.get('create_envelope', session_id=self.session_id)
+        if not envelope:
+            return
+        latitude, longitude = self.walk.latitude, self.walk.longitude
+        data = {'operation': 'add_asset_to_envelope',
+                'envelope_id': envelope['envelope_id'],
+                'session_id': self.session_id,
+                'latitude': latitude, 'longitude': longitude}
+        if self.tags:
+            data['tags'] = ','.join(self.tags)
+        self.call('add_asset_to_envelope', 'POST', '/api/1/', data=data,
+                  files={'file': ('load-test.wav', silent_wav(), 'audio/x-wav')})
+
+    def vote(self):
+        current = self.get('get_current_streaming_asset', session_id=self.session_id)
+        if current:
+            self.get('vote_asset', session_id=self.session_id,
+                     asset_id=current['asset_id'], vote_type='like')
+
+
+class Api2Client(Client):
+
+    def start(self):
+        user = self.call('users', 'POST', '/api/2/users/',
+                         data={'device_id': self.device_id, 'client_type': 'load-test'})
+        if not user:
+            return False
+        self.http.headers['Authorization'] = 'Token %s' % user['token']
+        project = self.call('projects', 'GET', '/api/2/projects/%s/' % self.options.project)
+        if not project:
+            return False
+        self.start_walk(project['latitude'], project['longitude'])
+        session = self.call('sessions', 'POST', '/api/2/sessions/',
+                            data={'project_id': self.options.project,
+                                  'client_system': 'load-test'})
+        if not session:
+            return False
+        self.session_id = session['session_id']
+        latitude, longitude = self.walk.step(0)
+        self.stream_started(self.call('streams', 'POST', '/api/2/streams/',
+                                      data={'session_id': self.session_id,
+                                            'latitude': latitude,
+                                            'longitude': longitude}))
+        return True
+
+    def heartbeat(self):
+        self.call('streams/heartbeat', 'POST',
+                  '/api/2/streams/%s/heartbeat/' % self.session_id)
+
+    def move(self, latitude, longitude):
+        self.call('streams (move)', 'PATCH', '/api/2/streams/%s/' % self.session_id,
+                  data={'latitude': latitude, 'longitude': longitude})
+
+    def modify(self, tags):
+        self.call('streams (tags)', 'PATCH', '/api/2/streams/%s/' % self.session_id,
+                  data={'tag_ids': tags})
+
+    def upload(self):
+        envelope = self.call('envelopes', 'POST', '/api/2/envelopes/',
+                             data={'session_id': self.session_id})
+        if not envelope:
+            return
+        data = {'latitude': self.walk.latitude, 'longitude': self.walk.longitude}
+        if self.tags:
+            data['tag_ids'] = ','.join(self.tags)
+        self.call('envelopes (upload)', 'PATCH', '/api/2/envelopes/%s/' % envelope['id'],
+                  data=data,
+                  files={'file': ('load-test.wav', silent_wav(), 'audio/x-wav')})
+
+    def vote(self):
+        assets = self.call('assets/random', 'GET', '/api/2/assets/random/',
+                           params={'project_id': self.options.project})
+        if assets:
+            self.call('assets/votes', 'POST', '/api/2/assets/%s/votes/' % assets[0]['id'],
+                      data={'session_id': self.session_id, 'vote_type': 'like'})
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulates concurrent API clients.")
+    parser.add_argument('--server', default='http://localhost:8888')
+    parser.add_argument('--api', type=int, choices=[1, 2], default=1)
+    parser.add_argument('--project', type=int, required=True)
+    parser.add_argument('--clients', type=int, default=50,
+                        help='Clients to start in total')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='Average client arrivals per second (Poisson)')
+    parser.add_argument('--session-length', type=float, default=300,
+                        help='Seconds each client listens for')
+    parser.add_argument('--heartbeat-interval', type=float, default=30)
+    parser.add_argument('--move-interval', type=float, default=10)
+    parser.add_argument('--modify-interval', type=float, default=120,
+                        help='Average seconds between tag changes, 0 for none')
+    parser.add_argument('--upload-interval', type=float, default=600,
+                        help='Average seconds between uploads per client, 0 for none')
+    parser.add_argument('--vote-interval', type=float, default=300,
+                        help='Average seconds between votes per client, 0 for none')
+    parser.add_argument('--tags', default='',
+                        help='Comma separated tag ids to choose from for modify and uploads')
+    parser.add_argument('--walk-radius', type=float, default=200,
+                        help='Meters around the project location clients start in')
+    parser.add_argument('--icecast-port', type=int, default=8001,
+                        help='Port of the Icecast admin stand-in, 0 to not run it')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', default=None, help='File to write the results to')
+    options = parser.parse_args()
+    options.tags = [t for t in options.tags.split(',') if t]
+    return options
+
+
+def main():
+    options = parse_args()
+    rng = random.Random(options.seed)
+    stats = Stats()
+
+    mounts = Mounts()
+    if options.icecast_port:
+        icecast = IcecastStandin(options.icecast_port, mounts)
+        server = threading.Thread(target=icecast.serve_forever)
+        server.daemon = True
+        server.start()
+
+    client_class = Api1Client if options.api == 1 else Api2Client
+    started = time.time()
+    threads = []
+    try:
+        for i in range(options.clients):
+            client = client_class(options, stats, mounts, random.Random(rng.random()))
+            thread = threading.Thread(target=client.run)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+            if i + 1 < options.clients:
+                time.sleep(rng.expovariate(options.rate))
+            active = sum(1 for t in threads if t.is_alive())
+            print("\r%d clients started, %d active" % (i + 1, active), end='')
+        print("")
+        while any(t.is_alive() for t in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nInterrupted, reporting what completed.")
+    wall_seconds = time.time() - started
+
+    print("%d api%s clients in %.1f seconds" % (len(threads), options.api, wall_seconds))
+    print(stats.report(wall_seconds))
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump({'options': vars(options), 'wall_seconds': wall_seconds,
+                       'operations': stats.as_dict(wall_seconds)}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# Serves the metrics of every stream on this host as one page in the
+# Prometheus text format, for Prometheus to scrape. Each rwstreamd writes its
+# metrics to settings.STREAM_METRICS_DIR every STREAM_METRICS_INTERVAL; files
+# of streams that died without cleaning up are deleted once they are three
+# intervals old.
+# Usage: ./stream-metrics.py [port (default 9137)] [directory]
+#   then scrape http://host:port/metrics
+from __future__ import division
+import BaseHTTPServer
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "roundware.settings")
+import django
+django.setup()
+
+from django.conf import settings
+
+from roundwared import metrics
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        directory = self.server.directory
+        texts = []
+        if os.path.isdir(directory):
+            texts = metrics.read_dir(directory, settings.STREAM_METRICS_INTERVAL * 3 / 1000)
+        body = (metrics.merge(texts) +
+                '# HELP roundware_streams Streams running on this host.\n'
+                '# TYPE roundware_streams gauge\n'
+                'roundware_streams %d\n' % len(texts)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9137
+    directory = sys.argv[2] if len(sys.argv) > 2 else settings.STREAM_METRICS_DIR
+    if not directory:
+        print("Set STREAM_METRICS_DIR or pass the metrics directory.")
+        sys.exit(2)
+    server = BaseHTTPServer.HTTPServer(('', port), Handler)
+    server.directory = directory
+    print("Serving the stream metrics in %s on http://0.0.0.0:%d/metrics" % (directory, port))
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
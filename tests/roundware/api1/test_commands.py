@@ -12,9 +12,11 @@ from mock import patch
 
 from django.test.client import Client
 from django.conf import settings
+from django.test.utils import override_settings
 from roundware.rw.models import (ListeningHistoryItem, Asset, Project,
                                  Audiotrack, Session, Vote, Envelope,
                                  Speaker, LocalizedString, UIGroup, UIItem)
+from tests.roundware.rw.common import use_locmemcache
 from tests.roundwared.common import (RoundwaredTestCase, FakeRequest,
                                      mock_distance_in_meters_near,
                                      mock_distance_in_meters_far)
@@ -22,10 +24,10 @@ from roundware.lib.exception import RoundException
 from roundware.api1.commands import (check_for_single_audiotrack, get_asset_info,
                                      get_available_assets)
 from roundware.api1 import commands
-from roundware.lib import api
+from roundware.lib import api, shared_streams
 from roundware.lib.api import (request_stream, get_project_tags_old as get_project_tags, get_currently_streaming_asset,
                                _get_current_streaming_asset, vote_asset)
-from roundwared import gpsmixer
+from roundwared import gpsmixer, icecast2
 
 TEST_LOCATIONS = {
     "point_far_away_from_speaker": dict(latitude='-0.1', longitude='0.1'),
@@ -171,6 +173,27 @@ class TestServer(RoundwaredTestCase):
 
         self.assertLess(result.status_code, 400)
 
+    def test_get_config_speaker_detail(self):
+        # A square with points every 10 meters along one side.
+        side = ", ".join("0 %s" % (i / 10000.0) for i in range(101))
+        self.speaker1.shape = "MULTIPOLYGON(((%s, 1 0.01, 1 0, 0 0)))" % side
+        self.speaker1.save()
+
+        def shape(**params):
+            result = self.client.get("/api/1/", dict(operation="get_config", project_id=self.project1.id,
+                                                     **params))
+            speakers = json.loads(result.content)[-1]["speakers"]
+            self.assertEqual([self.speaker1.id], [speaker["id"] for speaker in speakers])
+            return json.dumps(speakers[0]["shape"])
+
+        full = shape()
+        self.assertEqual(full, shape(speaker_detail="full"))
+        self.assertLess(len(shape(speaker_detail="low")), len(full))
+
+        result = self.client.get("/api/1/", dict(operation="get_config", project_id=self.project1.id,
+                                                 speaker_detail="tiny"))
+        self.assertIn("error_message", json.loads(result.content))
+
     def test_get_tags_for_project(self):
         pass
 
@@ -373,37 +396,28 @@ class TestServer(RoundwaredTestCase):
         }
         self.assertEquals(expected, get_available_assets(req))
 
-    @patch.object(gpsmixer, 'distance_in_meters',
-                  mock_distance_in_meters_near)
     def test_get_available_assets_pass_lat_long_near(self):
-        """ with mocked gpsmixer.distance_in_meters to always return a
-        distance of 0 meters, we should get all assets when a latitude
-        and longitude are specified
+        """ assets within the project's radius of the latitude and
+        longitude are returned, assets without a location are not
         """
         req = FakeRequest()
         req.GET = {'latitude': '0.1', 'longitude': '0.1', 'project_id': '12'}
         expected = {
             'number_of_assets': {
-                'audio': 2, 'photo': 0, 'text': 0, 'video': 0
+                'audio': 1, 'photo': 0, 'text': 0, 'video': 0
             },
             'assets': [dict(self.ASSET_1.items() +
-                            self.ASSET_1_TAGS_EN.items()),
-                       dict(self.ASSET_2.items() +
-                            self.ASSET_2_TAGS_ES.items())
-                       ]
+                            self.ASSET_1_TAGS_EN.items())]
         }
         result = get_available_assets(req)
         self.assertEquals(expected, result)
 
-    @patch.object(gpsmixer, 'distance_in_meters',
-                  mock_distance_in_meters_far)
     def test_get_available_assets_pass_lat_long_far(self):
-        """ with mocked gpsmixer.distance_in_meters to always return a
-        distance of 0 meters, we should get all assets when a latitude
-        and longitude are specified
+        """ no assets are within the project's radius of a latitude
+        and longitude about 150 km away
         """
         req = FakeRequest()
-        req.GET = {'latitude': '0.1', 'longitude': '0.1', 'project_id': '12'}
+        req.GET = {'latitude': '1.0', 'longitude': '1.0', 'project_id': '12'}
         expected = {
             'number_of_assets': {
                 'audio': 0, 'photo': 0, 'text': 0, 'video': 0
@@ -448,16 +462,14 @@ class TestServer(RoundwaredTestCase):
         }
         self.assertEquals(expected, get_available_assets(req))
 
-    @patch.object(gpsmixer, 'distance_in_meters',
-                  mock_distance_in_meters_near)
     def test_get_available_assets_pass_radius(self):
-        """project's radius is bigger than the mock near distance.
-        should get no assets if we pass a radius of 0, overriding
+        """asset 1 is about 55 meters away, out of the project's radius
+        of 10 meters. should get it if we pass a radius of 100, overriding
         project radius.
         """
         req = FakeRequest()
-        req.GET = {'radius': '0', 'project_id': '12',
-                   'latitude': '0.1', 'longitude': '0.1'}
+        req.GET = {'project_id': '12',
+                   'latitude': '0.1', 'longitude': '0.1005'}
         expected = {
             'number_of_assets': {
                 'audio': 0, 'photo': 0, 'text': 0, 'video': 0
@@ -466,6 +478,21 @@ class TestServer(RoundwaredTestCase):
             'assets': []
         }
         self.assertEquals(expected, get_available_assets(req))
+        req.GET['radius'] = '100'
+        self.assertEquals([1], [asset['asset_id'] for asset in
+                                get_available_assets(req)['assets']])
+
+    def test_get_available_assets_pass_bbox(self):
+        """ only assets located in the bounding box are returned
+        """
+        req = FakeRequest()
+        req.GET = {'project_id': '12', 'bbox': '0,0,0.2,0.2'}
+        self.assertEquals([1], [asset['asset_id'] for asset in
+                                get_available_assets(req)['assets']])
+        req.GET['bbox'] = '0.2,0.2,0.3,0.3'
+        self.assertEquals([], get_available_assets(req)['assets'])
+        req.GET['bbox'] = '0,0.2'
+        self.assertRaises(RoundException, get_available_assets, req)
 
     def test_get_available_assets_pass_envelope_id(self):
         """ ignore other filters and return asset info for
@@ -725,6 +752,66 @@ class TestServer(RoundwaredTestCase):
         self.session.geo_listen_enabled = True
         self.session.save()
 
+    @patch.object(gpsmixer, 'distance_in_meters', mock_distance_in_meters_far)
+    def test_request_stream_shared_stream(self):
+        """ Global listen sessions of a shared stream project with the same
+        language get the stream of the first session and can't skip ahead.
+        Doesn't test actual stream being served.
+        """
+        self.project1.shared_stream_enabled = True
+        self.project1.save()
+        self.session.geo_listen_enabled = False
+        self.session.save()
+        session2 = mommy.make(Session, project=self.project1, id=2,
+                              language=self.spanish, geo_listen_enabled=False)
+        session3 = mommy.make(Session, project=self.project1, id=3,
+                              language=self.english, geo_listen_enabled=False)
+        req = FakeRequest()
+        req.method = 'GET'
+        with use_locmemcache(shared_streams, 'cache'):
+            for session_id, stream in (('1', 1), ('2', 1), ('3', 3)):
+                req.GET = {'session_id': session_id}
+                expected = {'stream_url': 'http://rw.com:8000/stream%s.ogg' % stream}
+                self.assertEquals(expected, request_stream(req))
+            req.GET = {'session_id': '2'}
+            with self.assertRaises(RoundException):
+                api.skip_ahead(req)
+            self.assertEquals(1, api.stream_session_id(session2.id))
+            self.assertEquals(session3.id, api.stream_session_id(session3.id))
+            self.assertEquals(2, shared_streams.listeners(1))
+            self.assertIsNone(shared_streams.listeners(session3.id))
+
+            # Other tags make another mix, which session 2 moves to.
+            req.GET = {'session_id': '2', 'tags': '3,1'}
+            self.assertEquals({'stream_url': 'http://rw.com:8000/stream2.ogg'},
+                              request_stream(req))
+            self.assertEquals(1, shared_streams.listeners(1))
+            self.assertEquals(1, shared_streams.listeners(2))
+            shared_streams.leave([1, 2])
+            self.assertEquals(0, shared_streams.listeners(1))
+            self.assertFalse(api.is_shared_stream(session2.id))
+
+    @patch.object(gpsmixer, 'distance_in_meters', mock_distance_in_meters_far)
+    def test_request_stream_standin(self):
+        """ With STREAM_STANDIN no stream process is started and the stream
+        is ready at once.
+        """
+        self.session.geo_listen_enabled = False
+        self.session.save()
+        req = FakeRequest()
+        req.method = 'GET'
+        req.GET = {'session_id': '1', 'wait_for_stream': 'false'}
+        with use_locmemcache(shared_streams, 'cache'), use_locmemcache(icecast2, 'cache'), \
+                override_settings(STREAM_STANDIN=True), \
+                patch.object(api, 'stream_exists', return_value=False), \
+                patch.object(api, 'apache_safe_daemon_subprocess') as subprocess:
+            self.assertEquals({'stream_url': 'http://rw.com:8000/stream1.ogg',
+                               'stream_status': icecast2.STREAM_READY},
+                              request_stream(req))
+            self.assertFalse(subprocess.called)
+            self.assertEquals(icecast2.STREAM_READY,
+                              icecast2.get_stream_status('/stream1.ogg'))
+
     @patch.object(gpsmixer, 'distance_in_meters', mock_distance_in_meters_near)
     def test_request_stream_inactive_speakers_not_involved(self):
         """ Inactive speakers don't count for in-range
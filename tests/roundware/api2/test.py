@@ -18,9 +18,14 @@ from roundware.rw.models import (ListeningHistoryItem, Asset, Project,
                                  Language, Tag, TagCategory)
 from roundware.settings import DEFAULT_SESSION_ID
 
+from mock import patch
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from roundware.lib import api, shared_streams
+from roundwared import icecast2
+from tests.roundware.rw.common import use_locmemcache
+
 TEST_POLYGONS = {
     "crazy_shape": "MULTIPOLYGON(((-0.774183051414968 -0.120296667618684,-0.697181433024807 0.197879831012361,-0.52645517133469 0.200040922932489,-0.444333678369823 -0.0571290155627506,-0.468105689491232 -0.245144012613892,-0.774183051414968 -0.120296667618684)),((-1.25042096457759 0.204363106772745,-1.01702303720376 0.504754883670546,-0.599932296619044 0.625776031197718,-0.152586269152534 0.448566493747217,0.0354287278986072 0.00122046628070716,-0.109364430749973 -0.30349349445735,-0.340601266203676 -0.487186307668236,-0.811719304791594 -0.487186307668236,-1.0969834382485 -0.331587689419015,-1.25042096457759 0.204363106772745),(-0.774183051414968 -0.120296667618684,-0.811719304791594 -0.275399299495685,-0.504844252133409 -0.374809527821576,-0.314668163162139 -0.327265505578759,-0.239029945957657 -0.0506457398023664,-0.362212185404957 0.325384254299917,-0.796591661350698 0.35563954118171,-0.880874246235692 0.122241613807879,-0.958673555360303 -0.0917064862847996,-0.889518613916205 -0.0247126367608296,-0.796591661350698 -0.111156313565952,-0.774183051414968 -0.120296667618684)))",
     "square": "MULTIPOLYGON(((10 10, 10 20, 20 20, 20 10, 10 10)))"
@@ -208,6 +213,24 @@ class TestServer(APITestCase):
 
         self.ensure_token_required()
 
+    def test_streams_post_without_waiting(self):
+        """ a JSON false wait_for_stream returns the stream URL without
+        waiting for the stream
+        """
+        self.client.force_authenticate(get_user_model().objects.create_user('listener'))
+        self.session.geo_listen_enabled = False
+        self.session.save()
+        with use_locmemcache(shared_streams, 'cache'), use_locmemcache(icecast2, 'cache'), \
+                patch.object(api, 'stream_exists', return_value=False), \
+                patch.object(api, 'apache_safe_daemon_subprocess'), \
+                patch.object(api, 'wait_for_stream') as wait_for_stream:
+            response = self.client.post(reverse('Stream-list'),
+                                        {"session_id": self.session.id,
+                                         "wait_for_stream": False}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(wait_for_stream.called)
+        self.assertEqual(icecast2.STREAM_STARTING, response.data["stream_status"])
+
     def users_post(self):
         url = reverse('user-list')
         data = {"device_id": "12891038109281",
@@ -0,0 +1,109 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import json
+
+from model_mommy import mommy
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from roundware.api2.filters import AssetFilterSet
+from roundware.api2.serializers import AssetSerializer
+from roundware.rw.models import (Asset, Language, LocalizedString, Project, Session,
+                                 Tag, TagCategory)
+
+
+class TestAssetListSerializer(TestCase):
+
+    """ asset listings serialized from plain rows
+    """
+
+    def setUp(self):
+        self.english = Language.objects.create(language_code='en')
+        self.spanish = Language.objects.create(language_code='es')
+        self.project = mommy.make(Project)
+        self.session = mommy.make(Session, project=self.project, language=self.english)
+        category = mommy.make(TagCategory)
+        self.tags = [mommy.make(Tag, tag_category=category, project=self.project, value=value)
+                     for value in ('red', 'blue')]
+
+    def make_assets(self, count):
+        for i in range(count):
+            asset = Asset.objects.create(
+                session=self.session if i % 2 else None, project=self.project,
+                latitude=i, longitude=-i, audiolength=i * 1500000000,
+                language=(self.english, self.spanish, None)[i % 3],
+                description='Asset %s' % i, filename='asset%s.wav' % i,
+                file='asset%s.wav' % i if i % 2 else '')
+            asset.tags.add(*self.tags[:i % 3])
+            for language, field in ((self.english, asset.loc_description),
+                                    (self.spanish, asset.loc_alt_text)):
+                if i % 2:
+                    field.add(LocalizedString.objects.create(
+                        language=language, localized_string='%s %s' % (language.language_code, i)))
+
+    def render(self, data):
+        return json.loads(JSONRenderer().render(data).decode('utf-8'))
+
+    def test_same_output_as_asset_serializer(self):
+        self.make_assets(6)
+        for context in ({}, {'admin': True}):
+            listed = AssetSerializer(Asset.objects.all(), many=True, context=context).data
+            single = [AssetSerializer(asset, context=context).data
+                      for asset in Asset.objects.all()]
+            self.assertEqual(6, len(listed))
+            self.assertEqual([list(result) for result in single],
+                             [list(result) for result in listed])
+            self.assertEqual(self.render(single), self.render(listed))
+
+    def test_asset_keys(self):
+        # The keys of assets as api/2 output them before the list serializer
+        # and compiled localization tables.
+        self.make_assets(2)
+        expected = set(['latitude', 'longitude', 'filename', 'file', 'volume', 'submitted',
+                        'project', 'created', 'language', 'weight', 'description',
+                        'loc_description', 'loc_alt_text', 'loc_caption', 'asset_id',
+                        'media_type', 'audio_length_in_seconds', 'tag_ids', 'session_id'])
+        asset = Asset.objects.last()
+        listed = AssetSerializer(Asset.objects.all(), many=True).data
+        single = AssetSerializer(asset).data
+        for result in (listed[-1], single):
+            self.assertEqual(expected, set(result))
+            self.assertEqual(list(asset.loc_description.values_list('id', flat=True)),
+                             result['loc_description'])
+            self.assertEqual(list(asset.loc_alt_text.values_list('id', flat=True)),
+                             result['loc_alt_text'])
+
+    def test_filter_sets(self):
+        self.make_assets(6)
+        params = {'project_id': self.project.id, 'tag_ids': str(self.tags[1].id)}
+        listed = AssetSerializer(AssetFilterSet(params), many=True).data
+        self.assertEqual([2, 5], [result['asset_id'] - Asset.objects.first().id
+                                  for result in listed])
+        self.assertEqual([], AssetSerializer(Asset.objects.none(), many=True).data)
+
+    def test_spatial_filters(self):
+        self.make_assets(4)
+        first = Asset.objects.first().id
+
+        def filtered(**params):
+            params['project_id'] = self.project.id
+            listed = AssetSerializer(AssetFilterSet(params), many=True).data
+            self.assertNotIn('location', listed[0] if listed else {})
+            return [result['asset_id'] - first for result in listed]
+        self.assertEqual([0], filtered(near='0,0,1000'))
+        self.assertEqual([0, 1], filtered(near='0.5,-0.5,100000'))
+        self.assertEqual([1, 2], filtered(bbox='-2.5,0.5,0,2.5'))
+
+    def test_constant_queries(self):
+        queries = []
+        for count in (2, 20):
+            self.make_assets(count - Asset.objects.count())
+            with CaptureQueriesContext(connection) as context:
+                AssetSerializer(Asset.objects.all(), many=True, context={'admin': True}).data
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
@@ -0,0 +1,75 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import (SimpleUploadedFile,
+                                            TemporaryUploadedFile)
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from mock import patch
+
+from roundware.lib import api
+from roundware.lib.api import save_upload_to_file, wait_for_stream
+from roundware.lib.exception import RoundException
+from roundwared import icecast2
+from tests.roundware.rw.common import use_locmemcache
+
+CONTENT = b'RIFF' + b'\x01\x02\x03\x04' * 50000
+
+
+class TestSaveUploadToFile(SimpleTestCase):
+
+    """ test persisting uploads without buffering them in memory
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dest_filepath = os.path.join(self.tmpdir, 'upload.wav')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_in_memory_upload_is_copied(self):
+        upload = SimpleUploadedFile('upload.wav', CONTENT)
+        checksum = save_upload_to_file(upload, self.dest_filepath)
+        self.assertEqual(hashlib.md5(CONTENT).hexdigest(), checksum)
+        with open(self.dest_filepath, 'rb') as f:
+            self.assertEqual(CONTENT, f.read())
+
+    def test_temporary_upload_is_linked(self):
+        upload = TemporaryUploadedFile('upload.wav', 'audio/x-wav',
+                                       len(CONTENT), None)
+        upload.write(CONTENT)
+        upload.flush()
+        checksum = save_upload_to_file(upload, self.dest_filepath)
+        self.assertEqual(hashlib.md5(CONTENT).hexdigest(), checksum)
+        # The saved file outlives the temporary upload.
+        upload.close()
+        with open(self.dest_filepath, 'rb') as f:
+            self.assertEqual(CONTENT, f.read())
+        self.assertEqual(0o644, os.stat(self.dest_filepath).st_mode & 0o777)
+
+
+@override_settings(STREAM_READY_TIMEOUT=0.2, STREAM_READY_POLL_INTERVAL=0.01)
+class TestWaitForStream(SimpleTestCase):
+
+    """ test waiting for rwstreamd to report a new stream ready
+    """
+
+    def test_ready_stream_returns_without_checking_icecast(self):
+        with use_locmemcache(icecast2, 'cache'):
+            icecast2.set_stream_status('/stream1.mp3', icecast2.STREAM_READY)
+            with patch.object(api, 'stream_exists') as stream_exists:
+                wait_for_stream(1, 'MP3')
+                self.assertFalse(stream_exists.called)
+
+    def test_stream_never_ready_times_out(self):
+        with use_locmemcache(icecast2, 'cache'):
+            icecast2.set_stream_status('/stream1.mp3', icecast2.STREAM_STARTING)
+            with patch.object(api, 'stream_exists', return_value=False):
+                self.assertRaises(RoundException, wait_for_stream, 1, 'MP3')
@@ -0,0 +1,46 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import json
+
+from django.test import TestCase
+
+from roundware.lib import api_benchmark
+from roundware.rw.models import Asset, Project
+
+
+class TestApiBenchmark(TestCase):
+
+    """ time and count the queries of api endpoints on synthetic catalogs
+    """
+
+    def test_run(self):
+        report = api_benchmark.run([3], repeat=1)
+        # The catalogs are rolled back.
+        self.assertFalse(Project.objects.filter(name__startswith='Benchmark').exists())
+        self.assertEqual(0, Asset.objects.count())
+
+        results = report['results']['3']
+        self.assertEqual([endpoint.name for endpoint in api_benchmark.ENDPOINTS],
+                         list(results))
+        errors = [(name, result['error']) for name, result in results.items()
+                  if result['error']]
+        self.assertEqual([], errors)
+        self.assertEqual(3, results['GET /api/2/assets/']['items'])
+        self.assertEqual(3, results['api/1 operation=get_available_assets']['items'])
+        self.assertTrue(results['GET /api/2/assets/']['queries'] > 0)
+
+        json.loads(json.dumps(report))
+        self.assertIn('3 assets', api_benchmark.format_results(report))
+
+    def test_over_budget(self):
+        endpoints = (api_benchmark.operation('current_version', 1),
+                     api_benchmark.resource('get', 'api/2/tagcategories/', 0))
+        report = api_benchmark.run([1], repeat=1, endpoints=endpoints)
+        results = report['results']['1']
+        self.assertFalse(results['api/1 operation=current_version']['over_budget'])
+        self.assertTrue(results['GET /api/2/tagcategories/']['over_budget'])
+        failures = api_benchmark.check_budgets(report)
+        self.assertEqual(1, len(failures))
+        self.assertIn('GET /api/2/tagcategories/', failures[0])
@@ -0,0 +1,111 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import os
+import shutil
+import struct
+import tempfile
+import wave
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from roundware.lib import audioinfo
+
+TEST_AUDIO_DIR = os.path.join(settings.ROUNDWARE_SERVER_ROOT, 'files')
+
+
+class TestAudioInfo(SimpleTestCase):
+
+    """ test reading audio metadata from file headers
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_wav(self, name, seconds, rate=44100, channels=2):
+        filepath = os.path.join(self.tmpdir, name)
+        w = wave.open(filepath, 'wb')
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b'\x00' * (2 * channels * int(rate * seconds)))
+        w.close()
+        return filepath
+
+    def make_ogg(self, name, samples, rate=44100, channels=2):
+        """ writes a minimal Ogg Vorbis file: identification header page
+        and a final page carrying the granule position.
+        """
+        ident = (b'\x01vorbis' + struct.pack(b'<IBIiii', 0, channels, rate, 0, 128000, 0)
+                 + b'\xb8\x01')
+        first = (b'OggS\x00\x02' + struct.pack(b'<qIIIB', 0, 1, 0, 0, 1)
+                 + struct.pack(b'<B', len(ident)) + ident)
+        last = (b'OggS\x00\x04' + struct.pack(b'<qIIIB', samples, 1, 1, 0, 1)
+                + b'\x01' + b'\x00')
+        filepath = os.path.join(self.tmpdir, name)
+        with open(filepath, 'wb') as f:
+            f.write(first + last)
+        return filepath
+
+    def test_wav(self):
+        filepath = self.make_wav('test.wav', 2.5, rate=22050, channels=1)
+        info = audioinfo.probe(filepath)
+        self.assertEqual('wav', info.format)
+        self.assertEqual(2500000000, info.duration)
+        self.assertEqual(22050, info.rate)
+        self.assertEqual(1, info.channels)
+        self.assertEqual(os.path.getsize(filepath), info.size)
+
+    def test_wav_matches_wave_module(self):
+        filepath = os.path.join(TEST_AUDIO_DIR, 'rw_test_audio1.wav')
+        w = wave.open(filepath)
+        expected = w.getnframes() * audioinfo.SECOND // w.getframerate()
+        w.close()
+        self.assertEqual(expected, audioinfo.probe(filepath).duration)
+
+    def test_mp3(self):
+        filepath = os.path.join(TEST_AUDIO_DIR, 'test-audio',
+                                '243044__phinster__evening-cicadas.mp3')
+        info = audioinfo.probe(filepath)
+        self.assertEqual('mp3', info.format)
+        self.assertEqual(44100, info.rate)
+        self.assertEqual(2, info.channels)
+        self.assertAlmostEqual(16.56, info.duration / 1e9, places=1)
+
+    def test_vbr_mp3_without_frame_count(self):
+        """ humpbacks has no Xing header and a variable bitrate, which
+        must not be estimated from the first frame.
+        """
+        filepath = os.path.join(TEST_AUDIO_DIR, 'test-audio',
+                                '249887__aguasonic__humpbacks-trk04.mp3')
+        info = audioinfo.probe(filepath)
+        self.assertEqual(48000, info.rate)
+        self.assertAlmostEqual(9.816, info.duration / 1e9, places=2)
+
+    def test_ogg(self):
+        filepath = self.make_ogg('test.ogg', 44100 * 3)
+        info = audioinfo.probe(filepath)
+        self.assertEqual('ogg', info.format)
+        self.assertEqual(3000000000, info.duration)
+        self.assertEqual(2, info.channels)
+
+    def test_unknown_and_missing_files(self):
+        filepath = os.path.join(self.tmpdir, 'test.txt')
+        with open(filepath, 'wb') as f:
+            f.write(b'not audio at all')
+        self.assertIsNone(audioinfo.probe(filepath))
+        self.assertIsNone(audioinfo.probe(os.path.join(self.tmpdir, 'missing.wav')))
+
+    def test_probe_directory(self):
+        self.make_wav('one.wav', 1)
+        os.mkdir(os.path.join(self.tmpdir, '1'))
+        self.make_wav(os.path.join('1', 'two.wav'), 2)
+        results = dict(audioinfo.probe_directory(self.tmpdir))
+        self.assertEqual(2, len(results))
+        self.assertEqual(2000000000,
+                         results[os.path.join(self.tmpdir, '1', 'two.wav')].duration)
@@ -0,0 +1,76 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from model_mommy import mommy
+
+from django.test import TestCase
+
+from roundware.lib import event_archive
+from roundware.rw.models import Event, EventRollup, Session
+
+
+class TestEventArchive(TestCase):
+
+    """ rolling up, exporting and deleting old events
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.session = mommy.make(Session)
+        self.day = datetime.date(2016, 3, 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def log(self, day, hour, event_type):
+        return Event.objects.create(
+            session=self.session, event_type=event_type,
+            server_time=datetime.datetime.combine(day, datetime.time(hour)))
+
+    def read(self):
+        rows = []
+        for name in sorted(os.listdir(self.directory)):
+            with gzip.open(os.path.join(self.directory, name)) as f:
+                rows.extend(json.loads(line.decode('utf-8')) for line in f)
+        return rows
+
+    def rollups(self):
+        return sorted(EventRollup.objects.values_list('day', 'event_type', 'count'))
+
+    def test_archive(self):
+        next_day = self.day + datetime.timedelta(days=1)
+        for hour in (1, 2, 3):
+            self.log(self.day, hour, 'heartbeat')
+        self.log(self.day, 4, 'skip')
+        kept = self.log(next_day, 1, 'heartbeat')
+
+        cutoff = datetime.datetime.combine(next_day, datetime.time())
+        self.assertEqual([(self.day, 4)], event_archive.archive(cutoff, self.directory))
+        self.assertEqual([kept.id], list(Event.objects.values_list('id', flat=True)))
+        self.assertEqual([(self.day, 'heartbeat', 3), (self.day, 'skip', 1)], self.rollups())
+        rows = self.read()
+        self.assertEqual(4, len(rows))
+        self.assertEqual('2016-03-01T01:00:00', rows[0]['server_time'])
+
+        # Events logged late are added to the rollups of their day.
+        self.log(self.day, 5, 'heartbeat')
+        self.assertEqual([(self.day, 1)], event_archive.archive(cutoff, self.directory))
+        self.assertEqual([(self.day, 'heartbeat', 4), (self.day, 'skip', 1)], self.rollups())
+        self.assertEqual(5, len(self.read()))
+        self.assertEqual(datetime.datetime(2016, 3, 1, 5),
+                         EventRollup.objects.get(event_type='heartbeat').last_time)
+
+    def test_nothing_to_archive(self):
+        self.log(self.day, 1, 'heartbeat')
+        cutoff = datetime.datetime.combine(self.day, datetime.time(12))
+        self.assertEqual([], event_archive.archive(cutoff, self.directory))
+        self.assertEqual([], os.listdir(self.directory))
+        self.assertEqual(1, Event.objects.count())
@@ -0,0 +1,102 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import datetime
+
+from mock import patch
+from model_mommy import mommy
+
+from django.test import TestCase, override_settings
+
+from roundware.lib import liveness
+from roundware.lib.cache_backends import state
+from roundware.lib.api import heartbeat
+from roundware.lib.exception import RoundException
+from roundware.rw.models import Event, LivenessInterval, Session, SharedStream
+from tests.roundwared.common import FakeRequest
+
+START = 1457000000.0
+
+
+@override_settings(HEARTBEAT_TIMEOUT=200, CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'test_liveness'}, 'state': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'test_liveness_state'}})
+class TestLiveness(TestCase):
+
+    """ heartbeats coalesced into liveness intervals
+    """
+
+    def setUp(self):
+        state.clear()
+        self.session = mommy.make(Session)
+
+    def intervals(self):
+        return [(interval.start, interval.end, interval.closed)
+                for interval in LivenessInterval.objects.order_by('start')]
+
+    def at(self, offset):
+        return datetime.datetime.fromtimestamp(START + offset)
+
+    def test_intervals(self):
+        for offset in (0, 10, 20):
+            liveness.seen(self.session.id, now=START + offset)
+        self.assertEqual([(self.at(0), self.at(0), False)], self.intervals())
+        self.assertEqual(0, liveness.flush(now=START + 30))
+        self.assertEqual([(self.at(0), self.at(20), False)], self.intervals())
+
+        # A heartbeat after the timeout starts another interval.
+        liveness.seen(self.session.id, now=START + 300)
+        self.assertEqual([(self.at(0), self.at(20), True),
+                          (self.at(300), self.at(300), False)], self.intervals())
+
+        self.assertEqual(1, liveness.flush(now=START + 600))
+        self.assertEqual([(self.at(0), self.at(20), True),
+                          (self.at(300), self.at(300), True)], self.intervals())
+
+    def test_interval_started_once(self):
+        liveness.seen(self.session.id, now=START)
+        # As if another heartbeat started the next interval while this one
+        # waited for the lock.
+        stale = liveness.cache.get(liveness.SESSION_CACHE_KEY % self.session.id)
+        liveness.seen(self.session.id, now=START + 300)
+        get = liveness.cache.get
+        calls = []
+
+        def get_after_lock(key, *args):
+            calls.append(key)
+            return stale if len(calls) == 1 else get(key, *args)
+        with patch.object(liveness.cache, 'get', get_after_lock):
+            liveness.seen(self.session.id, now=START + 310)
+        self.assertEqual([(self.at(0), self.at(0), True),
+                          (self.at(300), self.at(300), False)], self.intervals())
+
+    def test_stream_last_seen(self):
+        other = mommy.make(Session)
+        liveness.seen(self.session.id, other.id, now=START)
+        self.assertEqual(START, liveness.stream_last_seen(other.id))
+        self.assertEqual(None, liveness.stream_last_seen(self.session.id))
+
+    def test_heartbeat(self):
+        request = FakeRequest()
+        request.GET = {'session_id': str(self.session.id)}
+        for i in range(3):
+            self.assertEqual({'success': True}, heartbeat(request))
+        self.assertEqual(1, LivenessInterval.objects.count())
+        self.assertFalse(Event.objects.exists())
+        self.assertIsNotNone(liveness.stream_last_seen(self.session.id))
+
+        request.GET = {'session_id': str(self.session.id + 1)}
+        self.assertRaises(RoundException, heartbeat, request)
+
+    def test_stopped_sessions_leave_shared_streams(self):
+        shared = SharedStream.objects.create(fingerprint='f', owner=self.session, listeners=1)
+        Session.objects.filter(pk=self.session.pk).update(shared_stream=shared)
+        liveness.seen(self.session.id, now=START)
+        liveness.flush(now=START + 100)
+        self.assertEqual(1, SharedStream.objects.get(pk=shared.pk).listeners)
+        liveness.flush(now=START + 300)
+        self.assertEqual(0, SharedStream.objects.get(pk=shared.pk).listeners)
+        self.assertIsNone(Session.objects.get(pk=self.session.pk).shared_stream)
@@ -0,0 +1,90 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+
+from model_mommy import mommy
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from roundware.api2.serializers import TagSerializer
+from roundware.lib import localization
+from roundware.lib.api import t
+from roundware.rw.models import Language, LocalizedString, Project, Session, Tag, TagCategory
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'test_localization'}})
+class TestLocalization(TransactionTestCase):
+
+    """ compiled localization tables of projects
+    """
+
+    def setUp(self):
+        # Not rolled back like the database.
+        cache.clear()
+        self.english = Language.objects.create(language_code='en')
+        self.spanish = Language.objects.create(language_code='es')
+        self.french = Language.objects.create(language_code='fr')
+        self.project = mommy.make(Project)
+        category = mommy.make(TagCategory)
+        self.tags = [mommy.make(Tag, tag_category=category, project=self.project, value=value)
+                     for value in ('one', 'two', 'three')]
+        for tag in self.tags:
+            tag.loc_msg.add(self.string(self.english, '%s en' % tag.value))
+            tag.loc_msg.add(self.string(self.spanish, '%s es' % tag.value))
+
+    def string(self, language, text):
+        return LocalizedString.objects.create(language=language, localized_string=text)
+
+    def test_fallback(self):
+        table = localization.table(self.project.id)
+        tag = self.tags[0]
+        self.assertEqual('one es', table.get(tag, 'loc_msg', table.chain(self.spanish.id)))
+        self.assertEqual('one en', table.get(tag, 'loc_msg', table.chain(self.french.id)))
+        self.assertEqual('none', t('none', tag, 'loc_msg', self.french))
+        self.assertEqual('', t('', tag, 'loc_description', self.english))
+
+    def test_invalidated_on_change(self):
+        tag = self.tags[1]
+        self.assertEqual('two', t('two', tag, 'loc_msg', self.french))
+        french = self.string(self.french, 'deux')
+        tag.loc_msg.add(french)
+        self.assertEqual('deux', t('two', tag, 'loc_msg', self.french))
+
+        french.localized_string = 'Deux'
+        french.save()
+        self.assertEqual('Deux', t('two', tag, 'loc_msg', self.french))
+
+        tag.loc_msg.remove(french)
+        self.assertEqual('two', t('two', tag, 'loc_msg', self.french))
+
+        # Cached tables are used until they change.
+        with CaptureQueriesContext(connection) as queries:
+            t('two', tag, 'loc_msg', self.french)
+        self.assertEqual(0, len(queries))
+
+    def test_invalidated_on_commit(self):
+        tag = self.tags[1]
+        self.assertEqual('two', t('two', tag, 'loc_msg', self.french))
+        with transaction.atomic():
+            tag.loc_msg.add(self.string(self.french, 'deux'))
+            self.assertEqual('two', t('two', tag, 'loc_msg', self.french))
+        self.assertEqual('deux', t('two', tag, 'loc_msg', self.french))
+
+    def test_generation_not_reused_when_evicted(self):
+        generation = localization.generation()
+        cache.delete(localization.GENERATION_CACHE_KEY)
+        self.assertGreaterEqual(localization.generation(), generation)
+        localization.invalidate_all()
+        self.assertGreater(localization.generation(), generation)
+
+    def test_tag_serializer(self):
+        session = mommy.make(Session, project=self.project, language=self.spanish)
+        data = TagSerializer(Tag.objects.all(), many=True, context={'session': session}).data
+        self.assertEqual(['one es', 'two es', 'three es'], [tag['loc_msg'] for tag in data])
+        self.assertEqual([None] * 3, [tag['loc_description'] for tag in data])
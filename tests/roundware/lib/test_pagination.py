@@ -0,0 +1,92 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import datetime
+import json
+
+from model_mommy import mommy
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils.six.moves.urllib.parse import parse_qsl, urlparse
+from rest_framework.test import APIClient
+
+from roundware.lib import pagination
+from roundware.rw.models import Event, Project, Session
+
+
+class TestPagination(TestCase):
+
+    """ keyset pages and streamed lists of events
+    """
+
+    def setUp(self):
+        self.project = mommy.make(Project)
+        self.session = mommy.make(Session, project=self.project)
+        start = datetime.datetime(2016, 1, 1)
+        # Pairs of events at the same time, listed by id within each pair.
+        self.events = [Event.objects.create(session=self.session, event_type='heartbeat',
+                                            server_time=start + datetime.timedelta(seconds=i // 2))
+                       for i in reversed(range(7))]
+        self.ids = [event.id for event in sorted(self.events, key=lambda e: (e.server_time, e.id))]
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('user'))
+
+    def test_pages(self):
+        ids = []
+        cursor = None
+        while True:
+            page, cursor = pagination.page(Event.objects.all(), ('server_time', 'id'), 3, cursor)
+            ids.append([event.id for event in page])
+            if cursor is None:
+                break
+        self.assertEqual([self.ids[:3], self.ids[3:6], self.ids[6:]], ids)
+
+    def test_api2_pages(self):
+        url = '/api/2/events/'
+        response = self.client.get(url)
+        self.assertEqual(7, len(response.data))
+        self.assertNotIn('Link', response)
+
+        ids = []
+        params = {'page_size': 4}
+        while True:
+            response = self.client.get(url, params)
+            ids.extend(event['event_id'] for event in response.data)
+            if 'Link' not in response:
+                break
+            link = response['Link']
+            params = dict(parse_qsl(urlparse(link[1:link.index('>')]).query))
+        self.assertEqual(self.ids, ids)
+        self.assertEqual(400, self.client.get(url, {'cursor': 'nonsense'}).status_code)
+
+    def test_api2_stream(self):
+        pagination.STREAM_BATCH_SIZE, batch_size = 2, pagination.STREAM_BATCH_SIZE
+        try:
+            response = self.client.get('/api/2/events/', {'stream': 'true'})
+            data = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        finally:
+            pagination.STREAM_BATCH_SIZE = batch_size
+        self.assertEqual(self.ids, [event['event_id'] for event in data])
+        self.assertEqual(self.client.get('/api/2/events/', {'page_size': 7}).data, data)
+
+    def test_api1_get_events(self):
+        params = {'operation': 'get_events', 'session_id': self.session.id}
+        data = json.loads(self.client.get('/api/1/', params).content.decode('utf-8'))
+        self.assertEqual(7, data['number_of_events'])
+
+        params['page_size'] = 5
+        data = json.loads(self.client.get('/api/1/', params).content.decode('utf-8'))
+        self.assertEqual(self.ids[:5], [event['event_id'] for event in data['events']])
+        params['cursor'] = data['next_cursor']
+        data = json.loads(self.client.get('/api/1/', params).content.decode('utf-8'))
+        self.assertEqual(self.ids[5:], [event['event_id'] for event in data['events']])
+        self.assertIsNone(data['next_cursor'])
+
+        params = {'operation': 'get_events', 'session_id': self.session.id, 'stream': 'true'}
+        response = self.client.get('/api/1/', params)
+        data = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        self.assertEqual(7, data['number_of_events'])
+        self.assertEqual(self.project.id, data['project_id'])
+        self.assertEqual(sorted(self.ids), sorted(event['event_id'] for event in data['events']))
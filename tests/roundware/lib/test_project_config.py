@@ -0,0 +1,128 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+
+from mock import patch
+from model_mommy import mommy
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from roundware.lib import project_config
+from roundware.lib.api import get_project_tags_old
+from roundware.rw.models import (Language, LocalizedString, Project, Session, Tag, TagCategory,
+                                 TagRelationship, UIGroup, UIItem)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'test_project_config'}, 'state': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'test_project_config_state'}})
+class TestProjectConfig(TransactionTestCase):
+
+    """ compiled tag and UI configuration documents of projects, bumped
+    once changes commit
+    """
+
+    def setUp(self):
+        self.english = Language.objects.create(language_code='en')
+        self.project = mommy.make(Project)
+        self.session = mommy.make(Session, project=self.project, language=self.english)
+        self.category = mommy.make(TagCategory)
+        self.tag = mommy.make(Tag, tag_category=self.category, project=self.project)
+        self.uigroup = mommy.make(UIGroup, project=self.project, tag_category=self.category,
+                                  active=True, ui_mode=UIGroup.LISTEN, index=1)
+        self.uiitem = mommy.make(UIItem, ui_group=self.uigroup, tag=self.tag, active=True,
+                                 index=1)
+
+    def options(self):
+        return get_project_tags_old(s=self.session)['listen'][0]['options']
+
+    def test_cached_until_changed(self):
+        self.assertEqual(1, self.options()[0]['order'])
+        with CaptureQueriesContext(connection) as queries:
+            self.options()
+        # Only English and the session's project and language.
+        self.assertEqual(3, len(queries))
+
+        self.uiitem.index = 2
+        self.uiitem.save()
+        self.assertEqual(2, self.options()[0]['order'])
+
+        self.tag.loc_msg.add(LocalizedString.objects.create(language=self.english,
+                                                            localized_string='Tag'))
+        self.assertEqual('Tag', self.options()[0]['value'])
+
+        other = mommy.make(Tag, tag_category=self.category, project=self.project)
+        mommy.make(TagRelationship, tag=self.tag)
+        self.tag.relationships_old.add(other)
+        self.assertEqual([other.id], self.options()[0]['relationships'])
+
+    def test_generations(self):
+        generation = project_config.generation(self.project.id)
+        self.assertEqual(generation, project_config.generation(self.project.id))
+        mommy.make(UIItem, ui_group=self.uigroup, tag=self.tag, index=2)
+        self.assertNotEqual(generation, project_config.generation(self.project.id))
+
+        generation = project_config.generation(self.project.id)
+        self.category.save()
+        self.assertNotEqual(generation, project_config.generation(self.project.id))
+
+        generation = project_config.generation(self.project.id)
+        self.project.languages.add(self.english)
+        self.assertNotEqual(generation, project_config.generation(self.project.id))
+
+    def test_bumped_on_commit(self):
+        generation = project_config.generation(self.project.id)
+        with transaction.atomic():
+            self.uigroup.save()
+            self.assertEqual(generation, project_config.generation(self.project.id))
+        self.assertNotEqual(generation, project_config.generation(self.project.id))
+
+    def assert_conditional(self, client, url, params):
+        response = client.get(url, params)
+        self.assertEqual(200, response.status_code)
+        etag = response['ETag']
+        response = client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.content)
+        response = client.get(url, params, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(304, response.status_code)
+
+        self.uigroup.name = 'renamed'
+        self.uigroup.save()
+        response = client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_api2_conditional_get(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('user'))
+        for path in ('', 'tags/', 'uigroups/'):
+            self.assert_conditional(client, '/api/2/projects/%s/%s' % (self.project.id, path),
+                                    {'session_id': self.session.id})
+
+    @patch('roundware.api1.commands.psutil.cpu_times_percent')
+    def test_api1_conditional_get(self, cpu_times_percent):
+        cpu_times_percent.return_value.idle = 100.0
+        client = APIClient()
+        self.assert_conditional(client, '/api/1/', {'operation': 'get_tags',
+                                                    'session_id': self.session.id})
+        self.assert_conditional(client, '/api/1/', {'operation': 'get_config',
+                                                    'project_id': self.project.id,
+                                                    'device_id': 'device',
+                                                    'new_session': 'false'})
+        response = client.get('/api/1/', {'operation': 'get_config', 'project_id': self.project.id})
+        self.assertNotIn('ETag', response)
+
+        params = {'operation': 'get_config', 'project_id': self.project.id,
+                  'device_id': 'device', 'new_session': 'false'}
+        etag = client.get('/api/1/', params)['ETag']
+        with override_settings(STARTUP_NOTIFICATION_MESSAGE='Welcome'):
+            response = client.get('/api/1/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
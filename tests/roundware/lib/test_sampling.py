@@ -0,0 +1,65 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import random
+
+from mock import patch
+from model_mommy import mommy
+
+from django.test import TestCase
+
+from roundware.lib import sampling
+from roundware.rw.models import Asset, Project
+
+
+@patch.object(sampling, 'PROBE_MIN', 5)
+class TestSampling(TestCase):
+
+    """ random samples of assets
+    """
+
+    def setUp(self):
+        self.projects = [mommy.make(Project), mommy.make(Project)]
+        # Interleaved, so the ids of each project are spread out.
+        Asset.objects.bulk_create([Asset(project=self.projects[i % 3 == 0])
+                                   for i in range(60)])
+        self.assets = Asset.objects.filter(project=self.projects[0])
+        self.ids = set(self.assets.values_list('id', flat=True))
+
+    def assert_sample(self, limit, expected_size):
+        sample = sampling.sample_ids(self.assets, limit, random.Random(limit))
+        self.assertEqual(expected_size, len(sample))
+        self.assertEqual(expected_size, len(set(sample)))
+        self.assertTrue(set(sample) <= self.ids)
+
+    def test_sample_ids(self):
+        for limit in (0, 1, 10, 39):
+            self.assert_sample(limit, limit)
+        self.assert_sample(40, 40)
+        self.assert_sample(100, 40)
+        self.assertEqual([], sampling.sample_ids(Asset.objects.none(), 10))
+
+    def test_random_order(self):
+        with patch.object(sampling, 'PROBE_ROUNDS', 0):
+            self.assert_sample(10, 10)
+
+    def test_sparse(self):
+        # Too few hits to probe for the rest, so they are read.
+        with patch.object(sampling, 'PROBE_MAX', 1):
+            self.assert_sample(10, 10)
+            self.assert_sample(100, 40)
+
+    def test_queries(self):
+        # The id bounds, then one round that looks up every id.
+        with patch.object(sampling, 'PROBE_MIN', 60), self.assertNumQueries(2):
+            self.assert_sample(10, 10)
+
+    def test_uniform(self):
+        rng = random.Random(0)
+        counts = dict((asset_id, 0) for asset_id in self.ids)
+        for i in range(400):
+            for asset_id in sampling.sample_ids(self.assets, 2, rng):
+                counts[asset_id] += 1
+        # Each of the 40 assets is expected 20 times.
+        self.assertTrue(min(counts.values()) > 5, counts)
@@ -0,0 +1,157 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection
+from django.http import StreamingHttpResponse
+from django.test import (TestCase, SimpleTestCase, Client, RequestFactory,
+                         override_settings)
+
+from roundware.lib import db_metrics, web_metrics
+from roundware.lib.cache_backends import ExpiringFileBasedCache, MeasuredCache
+from roundwared import metrics
+
+
+class TestWebMetrics(TestCase):
+
+    """ request metrics by endpoint, served at /metrics
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings = override_settings(WEB_METRICS_DIR=self.tmpdir,
+                                          WEB_METRICS_TOKEN='secret')
+        self.settings.enable()
+        web_metrics._registry = None
+
+    def tearDown(self):
+        self.settings.disable()
+        web_metrics._registry = None
+        shutil.rmtree(self.tmpdir)
+
+    def test_requests_are_measured_by_endpoint(self):
+        client = Client()
+        client.get('/api/1/', {'operation': 'current_version'})
+        client.get('/api/1/', {'operation': 'Current_Version'})
+        client.get('/api/1/', {'operation': 'no_such_operation'})
+        client.get('/api/1/rest/asset/')
+
+        registry = web_metrics.registry()
+        seconds = registry.request_seconds.children
+        self.assertEqual(['api1 current_version', 'api1 invalid', 'GET api1-asset'],
+                         list(seconds))
+        self.assertEqual(2, seconds['api1 current_version'].count)
+        self.assertTrue(registry.db_queries.labels('GET api1-asset').value > 0)
+
+    def test_streaming_responses_are_recorded_when_closed(self):
+        middleware = web_metrics.RequestMetricsMiddleware()
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        request.metrics_endpoint = 'GET streamed'
+
+        def content():
+            yield '%s' % User.objects.count()
+        response = middleware.process_response(request, StreamingHttpResponse(content()))
+        registry = web_metrics.registry()
+        self.assertNotIn('GET streamed', registry.request_seconds.children)
+
+        self.assertEqual(b'0', b''.join(response.streaming_content))
+        # Closing a response closes the connections of the request, too.
+        request_finished.disconnect(close_old_connections)
+        try:
+            response.close()
+        finally:
+            request_finished.connect(close_old_connections)
+        self.assertEqual(1, registry.request_seconds.children['GET streamed'].count)
+        self.assertEqual(1, registry.db_queries.labels('GET streamed').value)
+
+    def test_metrics_view_is_protected(self):
+        client = Client()
+        client.get('/api/1/', {'operation': 'current_version'})
+        self.assertEqual(403, client.get('/metrics').status_code)
+        self.assertEqual(403, client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code)
+
+        response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(200, response.status_code)
+        self.assertIn('roundware_web_request_seconds_count{process="%s",endpoint="api1 current_version"} 1'
+                      % web_metrics.registry().process, response.content.decode('utf-8'))
+
+        User.objects.create_user('staff', password='password', is_staff=True)
+        client.login(username='staff', password='password')
+        self.assertEqual(200, client.get('/metrics').status_code)
+
+    def test_metrics_view_is_off_without_directory(self):
+        with override_settings(WEB_METRICS_DIR=None):
+            self.assertEqual(404, Client().get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+                             .status_code)
+
+
+class TestMeasuredCache(SimpleTestCase):
+
+    """ cache hits and misses tallied for the request metrics
+    """
+
+    def test_hits_and_misses(self):
+        cache = MeasuredCache('measured', {
+            'OPTIONS': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+        metrics.begin_tally()
+        cache.set('a', None)
+        cache.set('b', 2)
+        self.assertIsNone(cache.get('a', 'default'))
+        self.assertEqual('default', cache.get('c', 'default'))
+        self.assertEqual({'b': 2}, cache.get_many(['b', 'c']))
+        self.assertTrue(cache.add('c', 3))
+        self.assertEqual(4, cache.incr('c'))
+        self.assertEqual({'cache_hits': 2, 'cache_misses': 2}, dict(metrics.end_tally()))
+
+
+class TestExpiringFileBasedCache(SimpleTestCase):
+
+    """ the state cache culls expired entries before live ones
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_expired_entries_are_culled_first(self):
+        cache = ExpiringFileBasedCache(self.tmpdir, {'OPTIONS': {'MAX_ENTRIES': 3,
+                                                                 'CULL_INTERVAL': 0}})
+        cache.set('old1', 1, 0)
+        cache.set('old2', 2, 0)
+        cache.set('live1', 3)
+        cache.set('live2', 4)
+        self.assertEqual(2, len(os.listdir(self.tmpdir)))
+        self.assertEqual({'live1': 3, 'live2': 4},
+                         cache.get_many(['old1', 'old2', 'live1', 'live2']))
+
+    def test_culled_once_per_interval(self):
+        cache = ExpiringFileBasedCache(self.tmpdir, {'OPTIONS': {'MAX_ENTRIES': 2,
+                                                                 'CULL_INTERVAL': 60}})
+        for key in ('a', 'b', 'c', 'd'):
+            cache.set(key, 1, 0)
+        # The first set culled the empty cache; the others didn't list it.
+        self.assertEqual(4, len(os.listdir(self.tmpdir)))
+
+
+class TestMeasuredCursor(TestCase):
+
+    """ database queries tallied for the request and stream metrics
+    """
+
+    def test_queries_are_tallied(self):
+        db_metrics.measure(connection)
+        metrics.begin_tally()
+        User.objects.count()
+        list(User.objects.all())
+        tally = metrics.end_tally()
+        self.assertEqual(2, tally['db_queries'])
+        self.assertTrue(tally['db_query_seconds'] > 0)
@@ -0,0 +1,42 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import json
+
+from django.test import TestCase
+
+from roundware.rw.models import Asset, Project
+from roundwared import benchmark
+
+
+class TestBenchmark(TestCase):
+
+    """ time roundwared hot paths on synthetic catalogs
+    """
+
+    def test_run(self):
+        report = benchmark.run([0, 20], repeat=2)
+        # The catalogs are rolled back.
+        self.assertFalse(Project.objects.filter(name__startswith='Benchmark').exists())
+        self.assertEqual(0, Asset.objects.count())
+
+        self.assertEqual(['0', '20'], list(report['results']))
+        results = report['results']['20']
+        for name in ('db.get_recordings', 'db.filter_recs_for_tags',
+                     'RecordingCollection.update_request',
+                     'RecordingCollection.move_listener',
+                     'RecordingCollection.get_recording',
+                     'RecordingCollection._generate_user_blocked_list',
+                     'asset_sorters.order_assets_by_like'):
+            self.assertEqual(2, results[name]['repeat'])
+            self.assertTrue(results[name]['min'] <= results[name]['median'] <=
+                            results[name]['max'])
+        self.assertTrue(results['db.get_recordings']['queries'] > 0)
+        # order_assets_by_like counts the likes of every asset.
+        self.assertTrue(results['asset_sorters.order_assets_by_like']['queries'] >= 1)
+        self.assertEqual('GPSMixer.move_listener' in results,
+                         benchmark.supports_speakers())
+
+        json.loads(json.dumps(report))
+        self.assertIn('20 assets', benchmark.format_results(report))
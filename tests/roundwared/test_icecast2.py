@@ -0,0 +1,93 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import fcntl
+import os
+import shutil
+import tempfile
+from django.test import SimpleTestCase, override_settings
+from mock import patch
+
+from roundwared import icecast2
+from tests.roundware.rw.common import use_locmemcache
+
+MOUNTS = {'/stream1.mp3': 2, '/stream2.ogg': 0}
+
+
+class TestIcecastAdminStatus(SimpleTestCase):
+
+    """ Icecast status is requested once and shared through the cache
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.lock_file = os.path.join(directory, 'icecast2_status.lock')
+        settings = override_settings(ICECAST_STATUS_LOCK_FILE=self.lock_file)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_status_is_shared(self):
+        with use_locmemcache(icecast2, 'cache'):
+            with patch.object(icecast2.Admin, 'process_xml_sources',
+                              return_value=MOUNTS) as poll:
+                admin = icecast2.Admin()
+                self.assertTrue(admin.stream_exists('/stream1.mp3'))
+                self.assertFalse(admin.stream_exists('/stream3.mp3'))
+                self.assertEqual(2, admin.get_client_count('/stream1.mp3'))
+                self.assertEqual(0, icecast2.Admin().get_client_count('/stream3.mp3'))
+                self.assertEqual(sorted(MOUNTS.keys()),
+                                 sorted(icecast2.Admin().get_mount_list()))
+                self.assertEqual(1, poll.call_count)
+
+    def test_stale_status_is_refreshed(self):
+        with use_locmemcache(icecast2, 'cache'):
+            with patch.object(icecast2.Admin, 'process_xml_sources',
+                              return_value=MOUNTS) as poll:
+                admin = icecast2.Admin()
+                admin.get_status()
+                # Age the cached status past ICECAST_STATUS_INTERVAL.
+                icecast2.cache.set(icecast2.STATUS_CACHE_KEY,
+                                   {'time': 0, 'mounts': MOUNTS})
+                admin.get_status()
+                self.assertEqual(2, poll.call_count)
+                icecast2.cache.set(icecast2.STATUS_CACHE_KEY,
+                                   {'time': 0, 'mounts': {}})
+                # Another process holds the refresh lock, so the stale
+                # status is used.
+                with open(self.lock_file, 'a') as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    self.assertEqual({}, admin.get_status())
+                self.assertEqual(2, poll.call_count)
+                self.assertEqual(MOUNTS, admin.get_status())
+                self.assertEqual(3, poll.call_count)
+
+    def test_added_mount_is_visible_before_next_poll(self):
+        with use_locmemcache(icecast2, 'cache'):
+            with patch.object(icecast2.Admin, 'process_xml_sources',
+                              return_value=dict(MOUNTS)):
+                admin = icecast2.Admin()
+                self.assertFalse(admin.stream_exists('/stream3.mp3'))
+                admin.add_mount('/stream3.mp3')
+                self.assertTrue(admin.stream_exists('/stream3.mp3'))
+                self.assertEqual(0, admin.get_client_count('/stream3.mp3'))
+
+
+class TestStreamStatus(SimpleTestCase):
+
+    """ rwstreamd publishes the provisioning status of its mount
+    """
+
+    def test_stream_status(self):
+        with use_locmemcache(icecast2, 'cache'):
+            self.assertIsNone(icecast2.get_stream_status('/stream1.mp3'))
+            icecast2.set_stream_status('/stream1.mp3', icecast2.STREAM_STARTING)
+            self.assertEqual(icecast2.STREAM_STARTING,
+                             icecast2.get_stream_status('/stream1.mp3'))
+            icecast2.set_stream_status('/stream1.mp3', icecast2.STREAM_READY)
+            self.assertEqual(icecast2.STREAM_READY,
+                             icecast2.get_stream_status('/stream1.mp3'))
+            self.assertIsNone(icecast2.get_stream_status('/stream1.ogg'))
+            icecast2.clear_stream_status('/stream1.mp3')
+            self.assertIsNone(icecast2.get_stream_status('/stream1.mp3'))
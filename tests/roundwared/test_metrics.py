@@ -0,0 +1,88 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from roundwared import metrics
+
+
+class TestMetrics(SimpleTestCase):
+
+    """ stream metrics in the Prometheus text format
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_render(self):
+        registry = metrics.Registry((('session', 1), ('project', 'a "b"')))
+        counter = registry.counter('rw_things_total', 'Things.')
+        histogram = registry.histogram('rw_latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+        counter.inc()
+        counter.inc(2)
+        for value in (0.0625, 0.5, 0.5, 3):
+            histogram.observe(value)
+        lines = registry.render().splitlines()
+        self.assertEqual([
+            '# HELP rw_things_total Things.',
+            '# TYPE rw_things_total counter',
+            'rw_things_total{session="1",project="a \\"b\\""} 3',
+            '# HELP rw_latency_seconds Latency.',
+            '# TYPE rw_latency_seconds histogram',
+            'rw_latency_seconds_bucket{session="1",project="a \\"b\\"",le="0.1"} 1',
+            'rw_latency_seconds_bucket{session="1",project="a \\"b\\"",le="1.0"} 3',
+            'rw_latency_seconds_bucket{session="1",project="a \\"b\\"",le="+Inf"} 4',
+            'rw_latency_seconds_sum{session="1",project="a \\"b\\""} 4.0625',
+            'rw_latency_seconds_count{session="1",project="a \\"b\\""} 4',
+        ], lines)
+
+    def test_collectors_run_before_rendering(self):
+        registry = metrics.StreamMetrics(1, 2)
+        registry.add_collector(lambda: registry.speakers.set(4))
+        self.assertIn('roundware_stream_speakers{session="1",project="2"} 4',
+                      registry.render())
+
+    def test_lag_probe(self):
+        histogram = metrics.Histogram(buckets=(0.01, 1.0))
+        times = iter([10.0, 11.0, 12.5, 13.0])
+        probe = metrics.LagProbe(histogram, 1000, clock=lambda: next(times))
+        self.assertTrue(all(probe() for i in range(4)))
+        # On time, half a second late, and early (never negative).
+        self.assertEqual(3, histogram.count)
+        self.assertEqual([2, 1, 0], histogram.counts)
+        self.assertEqual(0.5, histogram.sum)
+
+    def test_write_read_and_merge(self):
+        directory = os.path.join(self.tmpdir, 'metrics')
+        for session in (1, 2):
+            registry = metrics.StreamMetrics(session, 1)
+            registry.asset_transitions.inc(session)
+            metrics.write(registry, metrics.path(directory, session))
+        stale = metrics.path(directory, 3)
+        metrics.write(metrics.StreamMetrics(3, 1), stale)
+        os.utime(stale, (0, 0))
+
+        texts = metrics.read_dir(directory, 60)
+        self.assertEqual(2, len(texts))
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual(['1.prom', '2.prom'], sorted(os.listdir(directory)))
+
+        page = metrics.merge(texts).splitlines()
+        self.assertEqual(1, page.count('# TYPE roundware_stream_asset_transitions_total counter'))
+        start = page.index('# TYPE roundware_stream_asset_transitions_total counter')
+        self.assertEqual([
+            'roundware_stream_asset_transitions_total{session="1",project="1"} 1',
+            'roundware_stream_asset_transitions_total{session="2",project="1"} 2',
+        ], page[start + 1:start + 3])
+
+        metrics.remove(metrics.path(directory, 1))
+        metrics.remove(metrics.path(directory, 1))
+        self.assertEqual(['2.prom'], os.listdir(directory))
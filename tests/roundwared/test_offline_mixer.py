@@ -0,0 +1,128 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import os
+import shutil
+import tempfile
+
+import numpy
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from roundwared import gst_render, offline_mixer, schedule
+from roundwared.offline_mixer import OfflineMixer
+from tests.roundwared.test_schedule import Recording, TRACK
+
+SECOND = schedule.SECOND
+
+
+class FakeRecordingCollection(object):
+
+    def __init__(self, recordings):
+        self.recordings = list(recordings)
+
+    def get_recording(self):
+        if self.recordings:
+            return self.recordings.pop(0)
+
+
+class TestOfflineMixer(SimpleTestCase):
+
+    """ render stream audio with NumPy
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        # Two seconds of a constant stereo signal.
+        samples = numpy.full((2 * offline_mixer.RATE, 2), 8192, numpy.int16)
+        offline_mixer.write_wav(os.path.join(self.tmpdir, 'constant.wav'), samples)
+        self.recording = Recording(1, 'constant.wav', 2 * SECOND, 1.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_wav(self):
+        samples = offline_mixer.read_wav(os.path.join(self.tmpdir, 'constant.wav'))
+        self.assertEqual((2 * offline_mixer.RATE, 2), samples.shape)
+        self.assertTrue(numpy.allclose(0.25, samples))
+        resampled = offline_mixer.read_wav(os.path.join(self.tmpdir, 'constant.wav'),
+                                           22050)
+        self.assertEqual((2 * 22050, 2), resampled.shape)
+
+    def test_envelope(self):
+        clip = schedule.Clip(self.recording, 0, 10, 2, 4, 0.5)
+        self.assertTrue(numpy.allclose([0, 0.25, 0.5, 0.5, 0.25, 0],
+                                       offline_mixer.envelope([0, 1, 2, 6, 8, 10], clip)))
+
+    def test_pan(self):
+        stereo = numpy.array([[1.0, 0.5]], numpy.float32)
+        self.assertTrue(numpy.allclose([[1.0, 0.5]], offline_mixer.pan(stereo, numpy.array([0.0]))))
+        self.assertTrue(numpy.allclose([[0.0, 1.5]], offline_mixer.pan(stereo, numpy.array([1.0]))))
+        self.assertTrue(numpy.allclose([[1.5, 0.0]], offline_mixer.pan(stereo, numpy.array([-1.0]))))
+        mono = numpy.array([[1.0]], numpy.float32)
+        self.assertTrue(numpy.allclose([[0.5, 0.5]], offline_mixer.pan(mono, numpy.array([0.0]))))
+        self.assertTrue(numpy.allclose([[0.25, 0.75]], offline_mixer.pan(mono, numpy.array([0.5]))))
+        self.assertTrue(numpy.allclose([[1.0, 0.0]], offline_mixer.pan(mono, numpy.array([-1.0]))))
+
+    def test_pan_matches_gst(self):
+        # Rendered through audiopanorama as in a live stream. The signals are
+        # constant, so where gst starts the clip doesn't matter.
+        mono = numpy.full((2 * offline_mixer.RATE, 1), 8192, numpy.int16)
+        offline_mixer.write_wav(os.path.join(self.tmpdir, 'mono.wav'), mono)
+        stereo = numpy.empty((2 * offline_mixer.RATE, 2), numpy.int16)
+        stereo[:] = [8192, -4096]
+        offline_mixer.write_wav(os.path.join(self.tmpdir, 'stereo.wav'), stereo)
+        clip = schedule.Clip(None, 0, SECOND, 0, 0, 1.0)
+        output = os.path.join(self.tmpdir, 'gst.wav')
+        for name in ('mono.wav', 'stereo.wav'):
+            filepath = os.path.join(self.tmpdir, name)
+            for pan_pos in (-1.0, -0.5, 0.0, 0.5, 1.0):
+                gst_render.render_clip(filepath, clip, pan_pos, output)
+                rendered = offline_mixer.read_wav(output)
+                expected = offline_mixer.render_clip(offline_mixer.read_wav(filepath),
+                                                     clip, pan_pos)
+                middle = len(rendered) // 2
+                self.assertTrue(numpy.allclose(expected[len(expected) // 2],
+                                               rendered[middle], atol=2 / 32768.0),
+                                (name, pan_pos, rendered[middle]))
+
+    def test_render_clip(self):
+        samples = offline_mixer.read_wav(os.path.join(self.tmpdir, 'constant.wav'))
+        clip = schedule.Clip(self.recording, SECOND // 2, SECOND, SECOND // 4,
+                             SECOND // 4, 0.5)
+        rendered = offline_mixer.render_clip(samples, clip, 1.0)
+        self.assertEqual((offline_mixer.RATE, 2), rendered.shape)
+        middle = rendered[offline_mixer.RATE // 2]
+        self.assertTrue(numpy.allclose([0.0, 0.25], middle))
+
+    def test_schedule(self):
+        track = TRACK._replace(mindeadair=500000000.0, maxdeadair=500000000.0)
+        mixer = OfflineMixer(FakeRecordingCollection([self.recording] * 3), [track],
+                             seed=1)
+        clips, pans = mixer.schedule(10 * SECOND)
+        # The first second tick waits half a second of dead air.
+        self.assertEqual(int(1.5 * SECOND), clips[0].position)
+        # Each clip ends before the next one starts.
+        for previous, clip in zip(clips, clips[1:]):
+            self.assertTrue(previous.position + previous.clip.duration < clip.position)
+        self.assertEqual(3, len(clips))
+
+    def test_render(self):
+        track = TRACK._replace(mindeadair=500000000.0, maxdeadair=500000000.0)
+        with override_settings(MEDIA_ROOT=self.tmpdir):
+            renders = []
+            for i in range(2):
+                mixer = OfflineMixer(FakeRecordingCollection([self.recording]), [track],
+                                     seed=1, master_volume=1.0)
+                renders.append(mixer.render(5 * SECOND))
+        audio = renders[0]
+        self.assertEqual((5 * offline_mixer.RATE, 2), audio.shape)
+        self.assertTrue(numpy.array_equal(renders[0], renders[1]))
+        # Silent until the clip starts, and loudest in the middle of it.
+        first = int(1.5 * offline_mixer.RATE)
+        self.assertFalse(audio[:first].any())
+        # The recording is shorter than the minimum duration, so all of it plays.
+        middle = first + offline_mixer.RATE
+        self.assertTrue(abs(audio[middle]).max() > 0)
+        self.assertTrue(abs(audio).max() <= 8192 * 2)
@@ -0,0 +1,118 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+from unittest import skipIf
+
+from django.test import SimpleTestCase
+
+from roundwared import profiler
+
+
+def busy():
+    return sum(i * i for i in range(1000))
+
+
+class TestProfiler(SimpleTestCase):
+
+    """ on-demand profiling of running processes
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tmpdir, 'profiles')
+        self.timers = []
+        self.profiler = profiler.Profiler(self.directory, 'test',
+                                          lambda seconds, callback: self.timers.append(
+                                              (seconds, callback)))
+
+    def tearDown(self):
+        self.profiler.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_cprofile_stops_after_duration(self):
+        path = self.profiler.start(profiler.CPROFILE, 5)
+        self.assertTrue(path.endswith('-cprofile.pstats'))
+        busy()
+        self.assertRaises(ValueError, self.profiler.start, profiler.SAMPLE)
+        [(seconds, callback)] = self.timers
+        self.assertEqual(5, seconds)
+        self.assertEqual(path, callback())
+        self.assertIsNone(callback())
+        functions = [function for (filename, line, function)
+                     in pstats.Stats(path).stats]
+        self.assertIn('busy', functions)
+
+    def test_early_stop_timer_leaves_next_profile_running(self):
+        first = self.profiler.start(profiler.CPROFILE, 5)
+        self.assertEqual(first, self.profiler.stop())
+        self.profiler.start(profiler.SAMPLE, 5)
+        self.timers[0][1]()
+        self.assertEqual(profiler.SAMPLE, self.profiler.kind)
+
+    def test_invalid_requests(self):
+        self.assertRaises(ValueError, self.profiler.start, 'strace')
+        self.assertRaises(ValueError, self.profiler.start, profiler.SAMPLE, 0)
+        self.assertRaises(ValueError, self.profiler.start, profiler.SAMPLE,
+                          profiler.MAX_DURATION + 1)
+        self.assertIsNone(self.profiler.stop())
+
+    def test_sampler_counts_other_threads(self):
+        sampler = profiler.Sampler(max_stacks=2)
+        started = threading.Event()
+        stopped = threading.Event()
+
+        def wait():
+            started.set()
+            stopped.wait()
+        waiter = threading.Thread(target=wait, name='waiter')
+        waiter.start()
+        started.wait()
+        try:
+            for i in range(3):
+                sampler.sample()
+        finally:
+            stopped.set()
+            waiter.join()
+        stacks = [stack for stack in sampler.stacks if stack.startswith('waiter;')]
+        self.assertEqual(1, len(stacks))
+        self.assertIn('test_profiler.py:wait;', stacks[0])
+        self.assertEqual(3, sampler.stacks[stacks[0]])
+        self.assertTrue(len(sampler.stacks) <= 3)
+
+        path = os.path.join(self.tmpdir, 'out.folded')
+        sampler.write(path)
+        with open(path) as f:
+            self.assertEqual(len(sampler.stacks), len(f.readlines()))
+
+    @skipIf(profiler.tracemalloc is None, "tracemalloc is not available")
+    def test_tracemalloc(self):
+        path = self.profiler.start(profiler.TRACEMALLOC, 5)
+        self.assertEqual(path, self.profiler.stop())
+        profiler.tracemalloc.Snapshot.load(path)
+
+    def test_request_watcher(self):
+        filepath = profiler.request_path(self.directory, profiler.WEB)
+        profiler.request(filepath, profiler.SAMPLE, 10)
+        watcher = profiler.RequestWatcher(self.profiler, filepath)
+        # Requests from before the watcher started are ignored.
+        watcher.check()
+        self.assertIsNone(self.profiler.kind)
+
+        profiler.request(filepath, profiler.SAMPLE, 10)
+        os.utime(filepath, (0, 0))
+        watcher.check()
+        self.assertEqual(profiler.SAMPLE, self.profiler.kind)
+        self.assertEqual(10, self.timers[0][0])
+        watcher.check()
+
+        profiler.request(filepath, profiler.STOP)
+        watcher.check()
+        self.assertIsNone(self.profiler.kind)
+        self.assertEqual(1, len([name for name in os.listdir(self.directory)
+                                 if name.endswith('.folded')]))
@@ -0,0 +1,77 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+from collections import namedtuple
+import random
+
+from django.test import SimpleTestCase
+
+from roundwared import schedule
+
+TrackSettings = namedtuple('TrackSettings', [
+    'minvolume', 'maxvolume', 'minduration', 'maxduration', 'mindeadair',
+    'maxdeadair', 'minfadeintime', 'maxfadeintime', 'minfadeouttime',
+    'maxfadeouttime', 'minpanpos', 'maxpanpos', 'minpanduration',
+    'maxpanduration'])
+Recording = namedtuple('Recording', ['id', 'filename', 'audiolength', 'volume'])
+
+TRACK = TrackSettings(0.5, 1.0, 2000000000.0, 5000000000.0, 1000000000.0,
+                      3000000000.0, 100000000.0, 500000000.0, 100000000.0,
+                      2000000000.0, -1.0, 1.0, 5000000000.0, 10000000000.0)
+
+
+class TestSchedule(SimpleTestCase):
+
+    """ AudioTrack's random choices, without gst
+    """
+
+    def test_clip_fits_recording(self):
+        rng = random.Random(1)
+        recording = Recording(1, 'rw_test_audio1.wav', 10 * schedule.SECOND, 0.8)
+        for i in range(100):
+            clip = schedule.choose_clip(TRACK, recording, rng)
+            self.assertTrue(2 * schedule.SECOND <= clip.duration <= 5 * schedule.SECOND)
+            self.assertTrue(0 <= clip.start <= recording.audiolength - clip.duration)
+            self.assertTrue(0.4 <= clip.volume <= 0.8)
+
+    def test_short_recording_halves_fades(self):
+        recording = Recording(1, 'rw_test_audio1.wav', schedule.SECOND, 1.0)
+        clip = schedule.choose_clip(TRACK._replace(minfadeintime=900000000.0,
+                                                   maxfadeintime=900000000.0),
+                                    recording, random.Random(1))
+        self.assertEqual(schedule.SECOND, clip.duration)
+        self.assertEqual(schedule.SECOND // 2, clip.fadein)
+        self.assertEqual(schedule.SECOND // 2, clip.fadeout)
+
+    def test_deadair_in_milliseconds(self):
+        deadair = schedule.choose_deadair(TRACK, random.Random(1))
+        self.assertTrue(1000 <= deadair <= 3000)
+
+    def test_panner_reaches_target(self):
+        panner = schedule.Panner(TRACK, random.Random(1))
+        self.assertIsNone(panner.step())
+        target = panner.target_pan_pos
+        steps = panner.pan_steps_left
+        positions = [panner.step() for i in range(steps)]
+        self.assertAlmostEqual(target, positions[-1])
+        self.assertTrue(-1 <= min(positions) and max(positions) <= 1)
+
+    def test_next_track_event(self):
+        recording = Recording(1, 'rw_test_audio1.wav', 10 * schedule.SECOND, 0.8)
+        rng = random.Random(1)
+        next_time, action, clip = schedule.next_track_event(
+            TRACK, schedule.SECOND, 'tick', lambda: recording, rng)
+        self.assertEqual('start', action)
+        self.assertTrue(2 * schedule.SECOND <= next_time <= 4 * schedule.SECOND)
+        self.assertIsNone(clip)
+        end_time, action, clip = schedule.next_track_event(
+            TRACK, next_time, action, lambda: recording, rng)
+        self.assertEqual('end', action)
+        self.assertEqual(next_time + clip.duration, end_time)
+        # Without a recording to play the track waits for the next second.
+        self.assertEqual((2 * schedule.SECOND, 'tick', None), schedule.next_track_event(
+            TRACK, schedule.SECOND + 5, 'start', lambda: None, rng))
+        self.assertEqual((end_time // schedule.SECOND + 1) * schedule.SECOND,
+                         schedule.next_track_event(TRACK, end_time, 'end',
+                                                   lambda: recording, rng)[0])
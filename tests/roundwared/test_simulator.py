@@ -0,0 +1,97 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import random
+
+from django.test import SimpleTestCase
+from model_mommy import mommy
+
+from .common import RoundwaredTestCase
+from roundware.rw.models import Asset, Audiotrack, Project, Session
+from roundwared import gst_stubs, recording_collection
+from roundwared.schedule import SECOND
+from roundwared.simulator import Simulator, Walker, format_report, percentile
+
+
+class TestSimulator(RoundwaredTestCase):
+
+    """ simulate listening sessions in virtual time
+    """
+
+    def setUp(self):
+        super(type(self), TestSimulator).setUp(self)
+        self.project = mommy.make(Project, name='Simulated', latitude=0.1,
+                                  longitude=0.1, recording_radius=10000,
+                                  geo_listen_enabled=True,
+                                  repeat_mode=Project.CONTINUOUS,
+                                  ordering='random')
+        for i in range(3):
+            mommy.make(Asset, project=self.project, language=self.english,
+                       tags=[self.tag1], audiolength=10 * SECOND,
+                       latitude=0.1, longitude=0.1)
+        mommy.make(Audiotrack, project=self.project,
+                   minvolume=1.0, maxvolume=1.0,
+                   minduration=2 * SECOND, maxduration=5 * SECOND,
+                   mindeadair=SECOND, maxdeadair=3 * SECOND,
+                   minfadeintime=0.1 * SECOND, maxfadeintime=0.5 * SECOND,
+                   minfadeouttime=0.1 * SECOND, maxfadeouttime=0.5 * SECOND,
+                   minpanpos=-1.0, maxpanpos=1.0,
+                   minpanduration=5 * SECOND, maxpanduration=10 * SECOND)
+
+    def test_run(self):
+        original_time = recording_collection.time
+        sessions = Session.objects.count()
+        report = Simulator(self.project, sessions=3, seconds=60, seed=1,
+                           walk_radius=50).run()
+        # The simulated sessions are rolled back and time restored.
+        self.assertEqual(sessions, Session.objects.count())
+        self.assertIs(original_time, recording_collection.time)
+
+        operations = report['operations']
+        self.assertEqual(3, operations['start_recording_collection']['count'])
+        self.assertEqual(3, operations['start_gps_mixer']['count'])
+        # A move when each session starts and every 10 seconds after that.
+        self.assertTrue(18 <= operations['move_listener']['count'] <= 21)
+        self.assertTrue(operations['get_recording']['count'] > 0)
+        self.assertTrue(report['counters']['clips_played']['count'] > 0)
+        self.assertTrue(report['counters']['playlist_rebuilds']['count'] >=
+                        operations['move_listener']['count'])
+        for op in operations.values():
+            self.assertEqual(0, op['errors'])
+            self.assertEqual(op['count'], sum(n for bucket, n in op['histogram']))
+        self.assertIn('get_recording', format_report(report))
+
+    def test_seeded_runs_repeat(self):
+        first = Simulator(self.project, sessions=2, seconds=30, seed=5).run()
+        second = Simulator(self.project, sessions=2, seconds=30, seed=5).run()
+        self.assertEqual(first['counters'], second['counters'])
+        self.assertEqual(dict((name, op['count']) for name, op in first['operations'].items()),
+                         dict((name, op['count']) for name, op in second['operations'].items()))
+
+
+class TestSimulatorParts(SimpleTestCase):
+
+    def test_walker_stays_near(self):
+        walker = Walker(45.0, -122.0, 100, random.Random(1))
+        for i in range(500):
+            latitude, longitude = walker.walk(10)
+        # Walkers turn back at the radius, after at most one move outside it.
+        self.assertTrue(abs(latitude - 45.0) * 111320 < 130)
+
+    def test_percentile(self):
+        self.assertEqual(0, percentile([], 50))
+        self.assertEqual(5, percentile(range(1, 11), 50))
+        self.assertEqual(10, percentile(range(1, 11), 99))
+
+    def test_gst_stubs(self):
+        gst = gst_stubs.stub_modules()['gst']
+
+        class Element(gst.Bin):
+            def __init__(self):
+                gst.Bin.__init__(self)
+                self.adder = gst.element_factory_make("adder")
+                self.adder.get_request_pad('sink%d').link(gst.GhostPad("src", None))
+
+        Element().set_state(gst.STATE_PLAYING)
+        self.assertEqual(1000000000, gst.SECOND)
@@ -3,11 +3,13 @@
 
 from __future__ import unicode_literals
 from model_mommy import mommy
+from mock import patch
 
 from .common import RoundwaredTestCase
 from roundware.rw.models import (UIGroup, Session, Tag, Asset, TagCategory,
                                  UIItem, Project, LocalizedString, Audiotrack)
-from roundwared.stream import RoundStream
+from roundwared.stream import (BlankAudioSrc, RoundStream, RoundStreamSink,
+                               SINK_ICECAST, SINK_FILE, SINK_NULL)
 
 class TestRoundStream(RoundwaredTestCase):
 
@@ -122,4 +124,52 @@ class TestRoundStream(RoundwaredTestCase):
         stream.adder = {}
         self.assertEqual(len(stream.audiotracks), 0)
         stream.add_audiotracks()
-        self.assertEqual(len(stream.audiotracks), 1)
\ No newline at end of file
+        self.assertEqual(len(stream.audiotracks), 1)
+
+    def test_null_sink_stream_has_no_listeners(self):
+        """ Streams that aren't sent to Icecast never ask it for listeners
+        """
+        req = self.req1
+        req["audio_stream_bitrate"] = '128'
+        stream = RoundStream(self.session1.id, 'ogg', req, sink=SINK_NULL,
+                             sync=False)
+        with patch.object(stream.icecast_admin, 'get_client_count') as count:
+            self.assertFalse(stream.is_anyone_listening())
+            self.assertFalse(count.called)
+
+    def test_null_sink_stream_sets_no_stream_status(self):
+        """ Streams that aren't sent to Icecast never publish they are ready
+        """
+        req = self.req1
+        req["audio_stream_bitrate"] = '128'
+        # Plays blank audio for a second, then start() returns.
+        stream = RoundStream(self.session1.id, 'ogg', req, sink=SINK_NULL,
+                             sync=False, duration=1)
+        with patch('roundwared.stream.icecast2.set_stream_status') as set_status, \
+                patch.object(stream, 'add_speakers',
+                             lambda: stream.add_source_to_adder(BlankAudioSrc())), \
+                patch.object(stream, 'add_audiotracks'):
+            stream.start()
+        self.assertIsNone(stream.sink.on_connected)
+        self.assertFalse(stream.is_ready)
+        self.assertFalse(set_status.called)
+
+
+class TestRoundStreamSink(RoundwaredTestCase):
+
+    """ RoundStreamSink outputs to Icecast, a file or nowhere
+    """
+
+    def test_sinks(self):
+        for sink, factory in ((SINK_ICECAST, 'shout2send'),
+                              (SINK_FILE, 'filesink'),
+                              (SINK_NULL, 'fakesink')):
+            for audio_format in ('mp3', 'ogg'):
+                stream_sink = RoundStreamSink(1, audio_format, 128, sink=sink,
+                                              location='/tmp/stream1.' + audio_format,
+                                              sync=False)
+                factories = [e.get_factory().get_name() for e in stream_sink.elements()]
+                self.assertIn(factory, factories)
+
+    def test_invalid_sink(self):
+        self.assertRaises(Exception, RoundStreamSink, 1, 'mp3', 128, sink='rtp')
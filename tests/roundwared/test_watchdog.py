@@ -0,0 +1,81 @@
+# Roundware Server is released under the GNU Affero General Public License v3.
+# See COPYRIGHT.txt, AUTHORS.txt, and LICENSE.txt in the project root directory.
+
+from __future__ import unicode_literals
+import os
+import threading
+
+from django.test import SimpleTestCase
+
+from roundwared import watchdog
+
+
+class Clock(object):
+
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestWatchdog(SimpleTestCase):
+
+    """ main loop stall detection
+    """
+
+    def test_blame(self):
+        root = os.path.join(os.sep, 'srv', 'rw')
+        frames = [
+            (os.path.join(root, 'roundwared', 'stream.py'), 10, 'ping', ''),
+            (os.path.join(root, 'roundwared', 'icecast2.py'), 20, 'poll_status', ''),
+            (os.path.join(os.sep, 'usr', 'lib', 'urllib2.py'), 30, 'urlopen', ''),
+        ]
+        self.assertEqual('roundwared/icecast2.py:poll_status',
+                         watchdog.blame(frames, root).replace(os.sep, '/'))
+        self.assertEqual('%s:urlopen' % frames[2][0], watchdog.blame(frames[2:], root))
+        self.assertEqual('unknown', watchdog.blame([], root))
+
+    def test_stall_is_captured_once_and_recorded(self):
+        clock = Clock()
+        stalled, recovered = [], []
+        detector = watchdog.StallDetector(500, stalled.append, recovered.append,
+                                          interval=100, clock=clock)
+        clock.now += 0.5
+        self.assertIsNone(detector.check())
+        self.assertTrue(detector.tick())
+        self.assertEqual([], recovered)
+
+        clock.now += 0.7
+        stall = detector.check()
+        self.assertEqual([stall], stalled)
+        self.assertAlmostEqual(100.6, stall.started)
+        self.assertAlmostEqual(0.6, stall.duration)
+        clock.now += 1
+        self.assertIsNone(detector.check())
+        self.assertEqual(1, len(stalled))
+
+        detector.tick()
+        self.assertEqual(1, len(recovered))
+        self.assertAlmostEqual(1.6, recovered[0].duration)
+        self.assertEqual(stall.where, recovered[0].where)
+        self.assertEqual(list(recovered), list(detector.stalls))
+        self.assertIsNone(detector.stall)
+
+    def test_captures_main_loop_stack(self):
+        clock = Clock()
+        detector = watchdog.StallDetector(500, clock=clock)
+        clock.now += 1
+        captured = []
+        checker = threading.Thread(target=lambda: captured.append(detector.check()))
+        checker.start()
+        checker.join()
+        self.assertTrue(captured[0].where.endswith('test_captures_main_loop_stack'))
+        self.assertIn('test_watchdog.py', captured[0].stack)
+
+    def test_start_and_stop(self):
+        detector = watchdog.StallDetector(500, interval=10)
+        detector.start()
+        detector.stop()
+        detector.thread.join(1)
+        self.assertFalse(detector.thread.is_alive())